@@ -1,26 +1,48 @@
 # app/api/documentos.py
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Form
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Form, Query, status
+from fastapi.responses import FileResponse
+from starlette.background import BackgroundTask
 from pathlib import Path
+from typing import List
 from sqlalchemy.orm import Session
 from app.database import SessionLocal
 from app.models.documento import Documento
-from app.models.historial_documento import HistorialDocumento
-from app.utils.validaciones import validar_trd_ccd
+from app.models.documento_vigente import DocumentoVigente
+from app.models.blob import Blob
+from app.services.document_service import (
+    buscar_duplicado, registrar_documento, registrar_documentos, versiones_existentes, pagina_historial,
+    PAGINA_POR_DEFECTO, PAGINA_MAXIMA
+)
+from app.services.validacion import ArchivoInvalido, servicio_validacion
+from app.services.filtro_duplicados import filtro_duplicados
+from app.services.busqueda import buscar_documentos, BUSQUEDA_POR_DEFECTO, BUSQUEDA_MAXIMA
+from app.services.paquetes import encolar_paquete, PaqueteInvalido, PAQUETE_EXTENSIONES
+from app.services.almacenamiento import TMP_DIR, liberar_blob, borrar, ejecutor_almacenamiento, reconstruir_blob
 from app.api.auth import get_current_user
-import hashlib
+from app.utils.file_manager import guardar_upload_por_bloques, detectar_tipo, ArchivoDemasiadoGrande
+from app.utils.delta import DeltaInvalido
+from app.utils.validaciones import ALLOWED_EXTENSIONS
+from starlette.concurrency import run_in_threadpool
+from decouple import config
+import asyncio
 import os
-import magic
-from PyPDF2 import PdfReader
-import openpyxl
-from datetime import datetime
+import shutil
+import uuid
+import zipfile
 
 router = APIRouter(tags=["Documentos"])
 
 UPLOAD_DIR = Path("uploads")
 UPLOAD_DIR.mkdir(exist_ok=True)
 
-ALLOWED_EXTENSIONS = {".pdf", ".docx", ".xlsx", ".png", ".jpg", ".trd", ".ccd"}
-MAX_SIZE_BYTES = 10 * 1024 * 1024  # 10 MB
+# La subida se procesa por bloques, así que el límite se puede subir desde .env
+MAX_SIZE_MB = config("MAX_UPLOAD_MB", default=10, cast=int)
+MAX_SIZE_BYTES = MAX_SIZE_MB * 1024 * 1024
+MAX_ARCHIVOS_LOTE = config("MAX_ARCHIVOS_LOTE", default=200, cast=int)
+MAX_PAQUETE_MB = config("MAX_PAQUETE_MB", default=2048, cast=int)
+
+# Operaciones de disco: pool dedicado (ver app/services/almacenamiento.py)
+ejecutar = ejecutor_almacenamiento.ejecutar
 
 def get_db():
     db = SessionLocal()
@@ -29,9 +51,6 @@ def get_db():
     finally:
         db.close()
 
-def calcular_md5_contenido(contenido: bytes) -> str:
-    return hashlib.md5(contenido).hexdigest()
-
 
 # ===============================
 # ENDPOINT: SUBIR DOCUMENTO
@@ -48,87 +67,56 @@ async def upload_file(
     if extension not in ALLOWED_EXTENSIONS:
         raise HTTPException(status_code=400, detail=f"Tipo de archivo '{extension}' no permitido")
 
-    contents = await file.read()
-    if len(contents) > MAX_SIZE_BYTES:
-        raise HTTPException(status_code=400, detail="Archivo demasiado grande (máx 10 MB)")
-
-    # --- Carpeta por usuario ---
-    user_dir = UPLOAD_DIR / str(current_user.id)
-    user_dir.mkdir(exist_ok=True)
-
-    file_path = user_dir / file.filename
-    with open(file_path, "wb") as f:
-        f.write(contents)
-
-    # Validaciones específicas de archivos
-    if extension in {".trd", ".ccd"} and not validar_trd_ccd(file_path):
-        os.remove(file_path)
-        raise HTTPException(status_code=400, detail="Archivo TRD/CCD inválido")
-
+    # --- Lectura por bloques: hash y tamaño se calculan mientras se escribe ---
+    # El archivo queda en staging hasta que se registra en el almacén por contenido
     try:
-        if extension == ".pdf":
-            PdfReader(str(file_path))
-        elif extension == ".xlsx":
-            openpyxl.load_workbook(str(file_path))
-    except Exception:
-        os.remove(file_path)
-        raise HTTPException(status_code=400, detail="Archivo corrupto o no procesable")
-
-    # Calcular hash
-    nuevo_hash = calcular_md5_contenido(contents)
+        tmp_path, hashes, tamano_bytes = await guardar_upload_por_bloques(file, TMP_DIR, MAX_SIZE_BYTES)
+    except ArchivoDemasiadoGrande:
+        raise HTTPException(status_code=400, detail=f"Archivo demasiado grande (máx {MAX_SIZE_MB} MB)")
+
+    # Validaciones específicas de archivos (en el pool de procesos, sin bloquear el loop)
     try:
-        mime = magic.Magic(mime=True)
-        tipo_archivo = mime.from_file(str(file_path))
-    except Exception:
-        tipo_archivo = "desconocido"
+        await servicio_validacion.validar(tmp_path, extension)
+    except ArchivoInvalido as e:
+        await ejecutar(borrar, tmp_path)
+        raise HTTPException(status_code=400, detail=str(e))
+
+    tipo_archivo = await ejecutar(detectar_tipo, tmp_path)
 
     # --- CHEQUEO DE DUPLICADOS SOLO DEL MISMO USUARIO ---
-    duplicado = db.query(Documento).filter(
-        Documento.hash_archivo == nuevo_hash,
-        Documento.version == version,
-        Documento.usuario_id == current_user.id
-    ).first()
-    if duplicado:
-        os.remove(file_path)
+    if await run_in_threadpool(buscar_duplicado, db, current_user.id, hashes["sha256"], version):
+        await ejecutar(borrar, tmp_path)
         raise HTTPException(
             status_code=400,
             detail=f"Ya subiste anteriormente el archivo '{file.filename}' con la versión '{version}'"
         )
 
-    # --- Guardar en tabla documentos ---
-    nuevo_doc = Documento(
-        nombre_archivo=file.filename,
-        extension=extension,
-        version=version,
-        hash_archivo=nuevo_hash,
-        ruta_guardado=str(file_path),
-        tamano_kb=len(contents) / 1024,
-        duplicado=False,
-        usuario_id=current_user.id,
-        categoria=categoria,
-        content_type=file.content_type,
-        last_modified=datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    )
-    db.add(nuevo_doc)
-    db.commit()
-    db.refresh(nuevo_doc)
-
-    # --- Guardar en tabla historial_documentos ---
-    nuevo_historial = HistorialDocumento(
-        nombre_archivo=file.filename,
-        version=version,
-        usuario=current_user.nombre,
-        usuario_id=current_user.id,
-        fecha_subida=datetime.now(),
-        hash_md5=nuevo_hash
-    )
-    db.add(nuevo_historial)
-    db.commit()
+    # --- Guardar en documentos e historial_documentos (mueve el archivo al almacén) ---
+    # Trabajo de base: va al threadpool, el pool de almacenamiento queda para el disco
+    try:
+        nuevo_doc = await run_in_threadpool(
+            registrar_documento,
+            db,
+            current_user,
+            nombre_archivo=file.filename,
+            extension=extension,
+            version=version,
+            categoria=categoria,
+            hashes=hashes,
+            ruta_temporal=tmp_path,
+            tamano_bytes=tamano_bytes,
+            content_type=file.content_type,
+        )
+    except BaseException:
+        await run_in_threadpool(db.rollback)
+        await ejecutar(borrar, tmp_path)
+        raise
 
     return {
         "mensaje": f"Archivo '{file.filename}' cargado correctamente.",
         "documento_id": nuevo_doc.id,
-        "hash_md5": nuevo_hash,
+        "hash_md5": hashes["md5"],
+        "hash_sha256": hashes["sha256"],
         "categoria": categoria,
         "tipo_archivo": tipo_archivo,
         "tamano_kb": round(nuevo_doc.tamano_kb, 2),
@@ -137,21 +125,195 @@ async def upload_file(
     }
 
 
+# ===============================
+# ENDPOINT: SUBIR VARIOS DOCUMENTOS (LOTE)
+# ===============================
+@router.post("/upload-batch")
+async def upload_batch(
+    files: List[UploadFile] = File(...),
+    versiones: List[str] = Form(...),
+    categorias: List[str] = Form(None),
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user)
+):
+    """
+    Sube N archivos en una sola petición. `versiones` y `categorias` van en
+    el mismo orden que `files` (o un único valor para todos).
+    Las validaciones corren en paralelo, los duplicados se buscan con una
+    sola consulta y los registros de 'documentos' e 'historial_documentos'
+    se insertan juntos (un INSERT por tabla) en una sola transacción.
+    Retorna un resultado por archivo: ok, duplicado, corrupto o rechazado.
+    """
+    if len(files) > MAX_ARCHIVOS_LOTE:
+        raise HTTPException(status_code=400, detail=f"Máximo {MAX_ARCHIVOS_LOTE} archivos por lote")
+
+    for lista in (versiones, categorias):
+        if lista and len(lista) not in (1, len(files)):
+            raise HTTPException(status_code=400, detail="versiones/categorias no coinciden con la cantidad de archivos")
+
+    def valor_para(lista, i):
+        if not lista:
+            return None
+        return lista[0] if len(lista) == 1 else lista[i]
+
+    resultados = []
+    pendientes = []  # (indice, file, extension, version, categoria, tmp_path, hashes, tamano)
+
+    try:
+        # 1️⃣ Guardar en staging (por bloques) y descartar extensiones/tamaños inválidos
+        for i, file in enumerate(files):
+            version = valor_para(versiones, i)
+            categoria = valor_para(categorias, i)
+            extension = Path(file.filename).suffix.lower()
+            resultados.append({"archivo": file.filename, "version": version, "estado": None, "detalle": None})
+
+            if extension not in ALLOWED_EXTENSIONS:
+                resultados[i].update(estado="rechazado", detalle=f"Tipo de archivo '{extension}' no permitido")
+                continue
+            try:
+                tmp_path, hashes, tamano_bytes = await guardar_upload_por_bloques(file, TMP_DIR, MAX_SIZE_BYTES)
+            except ArchivoDemasiadoGrande:
+                resultados[i].update(estado="rechazado", detalle=f"Archivo demasiado grande (máx {MAX_SIZE_MB} MB)")
+                continue
+            pendientes.append((i, file, extension, version, categoria, tmp_path, hashes, tamano_bytes))
+
+        # 2️⃣ Validar todos en paralelo en el pool de procesos
+        validaciones = await asyncio.gather(
+            *(servicio_validacion.validar(p[5], p[2]) for p in pendientes),
+            return_exceptions=True
+        )
+
+        # 3️⃣ Duplicados: una sola consulta para todo el lote + repetidos dentro del lote
+        existentes = await run_in_threadpool(
+            versiones_existentes, db, current_user.id, [(p[6]["sha256"], p[3]) for p in pendientes]
+        )
+        nuevos, indices = [], []
+        for p, error in zip(pendientes, validaciones):
+            i, file, extension, version, categoria, tmp_path, hashes, tamano_bytes = p
+            if isinstance(error, ArchivoInvalido):
+                await ejecutar(borrar, tmp_path)
+                resultados[i].update(estado="corrupto", detalle=str(error))
+                continue
+            if isinstance(error, Exception):
+                raise error
+            if (hashes["sha256"], version) in existentes:
+                await ejecutar(borrar, tmp_path)
+                resultados[i].update(
+                    estado="duplicado",
+                    detalle=f"Ya subiste anteriormente el archivo '{file.filename}' con la versión '{version}'"
+                )
+                continue
+            existentes.add((hashes["sha256"], version))
+            indices.append(i)
+            nuevos.append({
+                "nombre_archivo": file.filename, "extension": extension, "version": version,
+                "categoria": categoria, "hashes": hashes, "ruta_temporal": tmp_path,
+                "tamano_bytes": tamano_bytes, "content_type": file.content_type,
+            })
+
+        # 4️⃣ Un INSERT por tabla y una sola transacción para todo el lote
+        # (los archivos pasan al almacén al confirmar)
+        documentos = await run_in_threadpool(registrar_documentos, db, current_user, nuevos)
+        for i, doc in zip(indices, documentos):
+            resultados[i].update(
+                estado="ok",
+                documento_id=doc.id,
+                hash_md5=doc.hash_md5,
+                hash_sha256=doc.hash_sha256,
+                tamano_kb=round(doc.tamano_kb, 2),
+            )
+        await run_in_threadpool(db.commit)
+    except BaseException:
+        # Nada se movió al almacén: todo lo del lote sigue en staging
+        await run_in_threadpool(db.rollback)
+        for p in pendientes:
+            await ejecutar(borrar, p[5])
+        raise
+
+    resumen = {}
+    for r in resultados:
+        resumen[r["estado"]] = resumen.get(r["estado"], 0) + 1
+
+    return {"usuario": current_user.nombre, "resumen": resumen, "resultados": resultados}
+
+
+# ===============================
+# ENDPOINT: SUBIR PAQUETE (ZIP / TRD / CCD)
+# ===============================
+@router.post("/upload-paquete", status_code=status.HTTP_202_ACCEPTED)
+async def upload_paquete(
+    file: UploadFile = File(...),
+    version: str = Form(...),
+    categoria: str = Form(None),
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user)
+):
+    """
+    Registra el paquete y cada archivo que contiene, sin descomprimirlo a
+    disco. metadata.xml (si viene) define versión y categoría del paquete
+    y de cada documento; si no, se usan `version` y `categoria`.
+    El paquete queda en staging y se ingresa como trabajo en segundo plano:
+    responde 202 y el resultado se consulta en GET /trabajos/{id}.
+    """
+    extension = Path(file.filename).suffix.lower()
+    if extension not in PAQUETE_EXTENSIONES:
+        raise HTTPException(status_code=400, detail=f"Tipo de paquete '{extension}' no permitido")
+
+    try:
+        tmp_path, hashes, tamano_bytes = await guardar_upload_por_bloques(file, TMP_DIR, MAX_PAQUETE_MB * 1024 * 1024)
+    except ArchivoDemasiadoGrande:
+        raise HTTPException(status_code=400, detail=f"Paquete demasiado grande (máx {MAX_PAQUETE_MB} MB)")
+
+    try:
+        if not await ejecutar(zipfile.is_zipfile, tmp_path):
+            raise PaqueteInvalido("No es un paquete ZIP válido")
+        # El duplicado del paquete se verifica en el trabajo, con la versión de metadata.xml si la trae
+        trabajo = await run_in_threadpool(
+            encolar_paquete, db, current_user.id, tmp_path, file.filename, hashes, tamano_bytes,
+            version, categoria, ALLOWED_EXTENSIONS, file.content_type
+        )
+    except PaqueteInvalido as e:
+        await ejecutar(borrar, tmp_path)
+        raise HTTPException(status_code=400, detail=str(e))
+    except BaseException:
+        await ejecutar(borrar, tmp_path)
+        raise
+
+    return {"trabajo_id": trabajo.id, "estado": trabajo.estado, "estado_url": f"/trabajos/{trabajo.id}"}
+
+
+# ===============================
+# ENDPOINT: PRE-FILTRO DE DUPLICADOS
+# ===============================
+@router.get("/filtro-duplicados")
+def estadisticas_filtro(current_user=Depends(get_current_user)):
+    """Tamaño y tasa de falsos positivos del pre-filtro del usuario (para dimensionarlo)."""
+    return filtro_duplicados.estadisticas_usuario(current_user.id)
+
+
 # ===============================
 # ENDPOINT: HISTORIAL DE DOCUMENTOS POR USUARIO
 # ===============================
 @router.get("/historial")
-def historial_documento(nombre_archivo: str, db: Session = Depends(get_db), current_user=Depends(get_current_user)):
+def historial_documento(
+    nombre_archivo: str,
+    limite: int = Query(PAGINA_POR_DEFECTO, ge=1, le=PAGINA_MAXIMA),
+    cursor: str | None = Query(None, description="valor de 'siguiente' de la página anterior"),
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user)
+):
     """
-    Retorna todas las versiones existentes de un documento por nombre
+    Retorna las versiones existentes de un documento por nombre, por fecha
+    y de a `limite`; `siguiente` es el cursor de la página que sigue.
     Solo para el usuario logueado.
     """
-    resultados = db.query(HistorialDocumento).filter(
-       HistorialDocumento.nombre_archivo.ilike(nombre_archivo),
-    HistorialDocumento.usuario_id == current_user.id
-).order_by(HistorialDocumento.fecha_subida).all()
+    try:
+        pagina = pagina_historial(db, current_user.id, nombre_archivo, limite, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    resultados = pagina["filas"]
 
-    if not resultados:
+    if not resultados and not cursor:
         raise HTTPException(404, detail=f"No se encontraron versiones para '{nombre_archivo}'")
 
     historial = [
@@ -165,5 +327,130 @@ def historial_documento(nombre_archivo: str, db: Session = Depends(get_db), curr
 
     return {
         "nombre_archivo": nombre_archivo,
-        "historial": historial
+        "historial": historial,
+        "siguiente": pagina["siguiente"]
     }
+
+
+# ===============================
+# ENDPOINT: BUSCAR DOCUMENTOS POR NOMBRE
+# ===============================
+@router.get("/buscar")
+def buscar(
+    q: str = Query(..., min_length=1, description="texto a buscar en el nombre (sin distinguir mayúsculas)"),
+    limite: int = Query(BUSQUEDA_POR_DEFECTO, ge=1, le=BUSQUEDA_MAXIMA),
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user)
+):
+    """
+    Documentos del usuario logueado cuyo nombre coincide con `q`, con su
+    versión vigente. Orden de relevancia por `coincidencia`: exacta,
+    prefijo, contiene y similar (tolerante a errores, solo PostgreSQL).
+    """
+    resultados = buscar_documentos(db, current_user.id, q, limite)
+    return {
+        "q": q,
+        "resultados": [
+            {
+                "nombre": v.nombre_archivo,
+                "coincidencia": nivel,
+                "version": v.version,
+                "total_versiones": v.total_versiones,
+                "categoria": v.categoria,
+                "fecha_subida": v.fecha_subida.strftime("%Y-%m-%d %H:%M:%S") if v.fecha_subida else None,
+                "documento_id": v.documento_id,
+            }
+            for nivel, v in resultados
+        ]
+    }
+
+
+# ===============================
+# ENDPOINT: DESCARGAR DOCUMENTO
+# ===============================
+@router.get("/{documento_id}/descargar")
+def descargar_documento(documento_id: int, db: Session = Depends(get_db), current_user=Depends(get_current_user)):
+    """
+    Devuelve el archivo de un documento del usuario. Se envía desde un
+    enlace propio en el staging (se borra al terminar la respuesta): si
+    mientras tanto la versión pasa a guardarse como delta (ALMACEN_DELTAS),
+    la descarga no se corta. Si ya es un delta se reconstruye ahí mismo.
+    """
+    doc = db.query(Documento).filter(
+        Documento.id == documento_id,
+        Documento.usuario_id == current_user.id
+    ).first()
+    if not doc:
+        raise HTTPException(status_code=404, detail="Documento no encontrado")
+
+    descarga = {"filename": doc.nombre_archivo, "media_type": doc.content_type or "application/octet-stream"}
+    destino = TMP_DIR / f"{uuid.uuid4().hex}.descarga"
+    try:
+        _enlazar(Path(doc.ruta_guardado), destino)
+    except FileNotFoundError:
+        _reconstruir_para_descarga(db, doc, destino)
+    return FileResponse(destino, background=BackgroundTask(borrar, destino), **descarga)
+
+
+def _enlazar(origen: Path, destino: Path):
+    """Enlace duro a la versión completa (copia si el sistema de archivos no admite enlaces)."""
+    try:
+        os.link(origen, destino)
+    except FileNotFoundError:
+        raise
+    except OSError:
+        shutil.copyfile(origen, destino)
+
+
+def _reconstruir_para_descarga(db: Session, doc: Documento, destino: Path):
+    """
+    Reconstruye en `destino` una versión guardada como delta. Se intenta
+    dos veces: la cadena de deltas puede cambiar mientras se lee (su base
+    también se comprime).
+    """
+    for _ in range(2):
+        blob = db.query(Blob).filter(Blob.ruta == doc.ruta_guardado).first()
+        if blob is None or not blob.base_hash:
+            raise HTTPException(status_code=404, detail="El archivo del documento no está en el almacén")
+        try:
+            reconstruir_blob(db, blob, destino)
+            return
+        except (DeltaInvalido, FileNotFoundError) as e:
+            borrar(destino)
+            error = e
+            db.expire_all()  # releer la cadena de deltas
+    raise HTTPException(status_code=500, detail=f"No se pudo reconstruir la versión: {error}")
+
+
+# ===============================
+# ENDPOINT: ELIMINAR DOCUMENTO
+# ===============================
+@router.delete("/{documento_id}")
+def eliminar_documento(documento_id: int, db: Session = Depends(get_db), current_user=Depends(get_current_user)):
+    """
+    Elimina el registro del documento del usuario. El archivo físico solo
+    se borra cuando ningún otro documento usa el mismo contenido.
+    El historial se conserva.
+    """
+    doc = db.query(Documento).filter(
+        Documento.id == documento_id,
+        Documento.usuario_id == current_user.id
+    ).first()
+    if not doc:
+        raise HTTPException(status_code=404, detail="Documento no encontrado")
+
+    rutas_huerfanas = liberar_blob(db, doc.ruta_guardado)
+    # La versión sigue vigente en el historial, pero ya sin archivo
+    db.query(DocumentoVigente).filter(DocumentoVigente.documento_id == doc.id).update(
+        {DocumentoVigente.documento_id: None}, synchronize_session=False
+    )
+    # Si era un paquete, sus miembros quedan como documentos sueltos
+    db.query(Documento).filter(Documento.paquete_id == doc.id).update(
+        {Documento.paquete_id: None}, synchronize_session=False
+    )
+    db.delete(doc)
+    db.commit()
+    for ruta in rutas_huerfanas:
+        ruta.unlink(missing_ok=True)
+
+    return {"mensaje": f"Documento '{doc.nombre_archivo}' eliminado", "archivo_borrado": bool(rutas_huerfanas)}
@@ -0,0 +1,199 @@
+# app/api/documentos_sesiones.py
+from fastapi import APIRouter, Depends, Form, HTTPException, Request
+from pathlib import Path
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import ClientDisconnect
+from decouple import config
+from app.api.auth import get_current_user
+from app.api.documentos import get_db
+from app.utils.validaciones import ALLOWED_EXTENSIONS
+from app.models.sesion_carga import SesionCarga
+from app.services.document_service import (
+    ArchivoInvalido, validar_archivo, buscar_duplicado, registrar_documento
+)
+from app.services.sesiones_carga import (
+    OffsetInvalido, SesionOcupada, crear_sesion, tomar_sesion, liberar_sesion, escribir_bloque, cerrar_sesion,
+    hash_final, ruta_parcial
+)
+
+router = APIRouter(prefix="/documentos/sesiones", tags=["Subida por sesiones"])
+
+# Las sesiones permiten archivos mucho más grandes que la subida simple
+MAX_SESION_MB = config("MAX_SESION_MB", default=1024, cast=int)
+CHUNK_SUGERIDO = 8 * 1024 * 1024  # 8 MB
+
+
+def _obtener_sesion(db: Session, sesion_id: str, usuario_id: int) -> SesionCarga:
+    sesion = db.query(SesionCarga).filter(
+        SesionCarga.id == sesion_id,
+        SesionCarga.usuario_id == usuario_id
+    ).first()
+    if not sesion:
+        raise HTTPException(status_code=404, detail="Sesión de carga no encontrada")
+    return sesion
+
+
+def _estado(sesion: SesionCarga):
+    return {
+        "sesion_id": sesion.id,
+        "nombre_archivo": sesion.nombre_archivo,
+        "offset": sesion.offset_confirmado,
+        "tamano_total": sesion.tamano_total,
+        "estado": sesion.estado,
+    }
+
+
+# ===============================
+# ENDPOINT: CREAR SESIÓN
+# ===============================
+@router.post("")
+def crear(
+    nombre_archivo: str = Form(...),
+    tamano_total: int = Form(...),
+    version: str = Form(...),
+    categoria: str = Form(None),
+    content_type: str = Form(None),
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user)
+):
+    """
+    Abre una sesión de subida reanudable. El cliente luego envía bloques
+    con PUT /documentos/sesiones/{id}?offset=N y cierra con /finalizar.
+    """
+    extension = Path(nombre_archivo).suffix.lower()
+    if extension not in ALLOWED_EXTENSIONS:
+        raise HTTPException(status_code=400, detail=f"Tipo de archivo '{extension}' no permitido")
+    if tamano_total <= 0:
+        raise HTTPException(status_code=400, detail="El archivo está vacío")
+    if tamano_total > MAX_SESION_MB * 1024 * 1024:
+        raise HTTPException(status_code=400, detail=f"Archivo demasiado grande (máx {MAX_SESION_MB} MB)")
+
+    sesion = crear_sesion(
+        db, current_user.id, nombre_archivo, extension, version,
+        categoria, content_type, tamano_total
+    )
+    return {**_estado(sesion), "chunk_sugerido": CHUNK_SUGERIDO}
+
+
+# ===============================
+# ENDPOINT: CONSULTAR OFFSET CONFIRMADO
+# ===============================
+@router.get("/{sesion_id}")
+def consultar(sesion_id: str, db: Session = Depends(get_db), current_user=Depends(get_current_user)):
+    return _estado(_obtener_sesion(db, sesion_id, current_user.id))
+
+
+# ===============================
+# ENDPOINT: ENVIAR BLOQUE
+# ===============================
+@router.put("/{sesion_id}")
+async def enviar_bloque(
+    sesion_id: str,
+    offset: int,
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user)
+):
+    """
+    Recibe el cuerpo crudo del bloque. Si `offset` no coincide con el
+    confirmado, o hay otro bloque de la sesión en curso, responde 409 con
+    el offset confirmado para que el cliente reanude.
+    """
+    sesion = await run_in_threadpool(_obtener_sesion, db, sesion_id, current_user.id)
+
+    try:
+        nuevo_offset = await escribir_bloque(db, sesion, offset, request.stream())
+    except (OffsetInvalido, SesionOcupada) as e:
+        raise HTTPException(status_code=409, detail={"mensaje": str(e), "offset": sesion.offset_confirmado})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail={"mensaje": str(e), "offset": sesion.offset_confirmado})
+    except ClientDisconnect:
+        # Lo recibido ya quedó confirmado; el cliente consultará el offset al reconectar
+        return _estado(sesion)
+
+    return {**_estado(sesion), "offset": nuevo_offset}
+
+
+# ===============================
+# ENDPOINT: FINALIZAR SESIÓN
+# ===============================
+@router.post("/{sesion_id}/finalizar")
+def finalizar(sesion_id: str, db: Session = Depends(get_db), current_user=Depends(get_current_user)):
+    """
+    Verifica que llegaron todos los bytes y ejecuta las mismas validaciones
+    y el mismo registro que /documentos/upload.
+    """
+    sesion = _obtener_sesion(db, sesion_id, current_user.id)
+    # Se toma como un bloque más (en el offset final): ningún PUT la cambia mientras se registra
+    try:
+        escritor = tomar_sesion(db, sesion, sesion.tamano_total)
+    except SesionOcupada as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except OffsetInvalido:
+        raise HTTPException(
+            status_code=409,
+            detail={"mensaje": "Faltan bloques por enviar", "offset": sesion.offset_confirmado}
+        )
+
+    try:
+        hashes = hash_final(sesion)
+
+        tmp_path = ruta_parcial(sesion)
+        try:
+            validar_archivo(tmp_path, sesion.extension)
+        except ArchivoInvalido as e:
+            cerrar_sesion(db, sesion, "cancelada", escritor)
+            raise HTTPException(status_code=400, detail=str(e))
+
+        if buscar_duplicado(db, current_user.id, hashes["sha256"], sesion.version):
+            cerrar_sesion(db, sesion, "cancelada", escritor)
+            raise HTTPException(
+                status_code=400,
+                detail=f"Ya subiste anteriormente el archivo '{sesion.nombre_archivo}' con la versión '{sesion.version}'"
+            )
+
+        nuevo_doc = registrar_documento(
+            db,
+            current_user,
+            nombre_archivo=sesion.nombre_archivo,
+            extension=sesion.extension,
+            version=sesion.version,
+            categoria=sesion.categoria,
+            hashes=hashes,
+            ruta_temporal=tmp_path,
+            tamano_bytes=sesion.tamano_total,
+            content_type=sesion.content_type,
+        )
+    except HTTPException:
+        raise
+    except Exception:
+        db.rollback()
+        liberar_sesion(db, sesion, escritor)  # el cliente puede reintentar el /finalizar
+        raise
+    cerrar_sesion(db, sesion, "finalizada", escritor)
+
+    return {
+        "mensaje": f"Archivo '{nuevo_doc.nombre_archivo}' cargado correctamente.",
+        "documento_id": nuevo_doc.id,
+        "hash_md5": hashes["md5"],
+        "hash_sha256": hashes["sha256"],
+        "categoria": nuevo_doc.categoria,
+        "tamano_kb": round(nuevo_doc.tamano_kb, 2),
+        "version": nuevo_doc.version,
+        "usuario": current_user.nombre
+    }
+
+
+# ===============================
+# ENDPOINT: CANCELAR SESIÓN
+# ===============================
+@router.delete("/{sesion_id}")
+def cancelar(sesion_id: str, db: Session = Depends(get_db), current_user=Depends(get_current_user)):
+    sesion = _obtener_sesion(db, sesion_id, current_user.id)
+    if sesion.estado in ("abierta", "escribiendo"):
+        try:
+            cerrar_sesion(db, sesion, "cancelada")
+        except SesionOcupada as e:
+            raise HTTPException(status_code=409, detail=str(e))
+    return _estado(sesion)
@@ -1,20 +1,22 @@
 # app/api/documentos_url.py
 from fastapi import APIRouter, Depends, HTTPException, status
-from pydantic import BaseModel, HttpUrl
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from decouple import config
 from app.core.database import get_db
 from app.api.auth import get_current_user
 from app.models.documento import Documento
-from app.services.documentos_url_service import process_external_document
-from datetime import datetime
-from email.utils import parsedate_to_datetime
+from app.services.documentos_url_service import (
+    process_external_document, descargar_lote, normalize_google_url, nuevo_documento_url, resumen_documento,
+    metadatos_extra, registrar_lote_urls, con_resumen, encolar_urls, URLRequest
+)
+from app.services.almacenamiento import borrar
+from app.services.cache_urls import buscar_entrada, buscar_entradas, estadisticas_cache
 
 router = APIRouter(tags=["Documentos desde URL"])
 
-class URLRequest(BaseModel):
-    url: HttpUrl
-    version: str | None = "1.0"
-    categoria: str | None = None
+URL_MAX_LOTE = config("URL_MAX_LOTE", default=500, cast=int)
+
 
 @router.post("/desde-url")
 def desde_url(req: URLRequest, db: Session = Depends(get_db), usuario = Depends(get_current_user)):
@@ -22,8 +24,10 @@ def desde_url(req: URLRequest, db: Session = Depends(get_db), usuario = Depends(
     Recibe una URL pública (Drive/OneDrive/directa), descarga el archivo,
     extrae metadatos y lo registra en la tabla 'documentos'.
     """
+    # Si la URL ya se descargó antes, la petición es condicional (ETag/Last-Modified)
+    cache = buscar_entrada(db, normalize_google_url(str(req.url)))
     try:
-        metadata = process_external_document(str(req.url),usuario.id)
+        metadata = process_external_document(str(req.url), usuario.id, cache=cache)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"No se pudo procesar la URL: {str(e)}")
 
@@ -32,55 +36,78 @@ def desde_url(req: URLRequest, db: Session = Depends(get_db), usuario = Depends(
     if not hash_val:
         raise HTTPException(status_code=500, detail="No se pudo calcular el hash del archivo")
 
-    existe = db.query(Documento).filter(Documento.hash_archivo == hash_val).first()
+    # Deduplicación por SHA-256: coincide también con lo subido por /upload
+    existe = db.query(Documento).filter(Documento.hash_sha256 == hash_val).first()
     duplicado = bool(existe)
 
-        # Convertir last_modified HTTP a datetime
-    last_modified_str = metadata.get("last_modified")
-    if last_modified_str:
-        try:
-            creado_en = parsedate_to_datetime(last_modified_str)
-        except Exception:
-            creado_en = datetime.utcnow()
-    else:
-        creado_en = datetime.utcnow()
-
-    nuevo = Documento(
-        nombre_archivo=metadata.get("nombre_archivo", "sin_nombre"),
-        extension=metadata.get("extension", ""),
-        version=metadata.get("version", "1.0"),
-        hash_archivo=hash_val,
-        ruta_guardado=metadata.get("ruta_guardado", ""),
-        tamano_kb=float(metadata.get("tamano_kb", 0)),
-        duplicado=duplicado,
-        usuario_id=usuario.id,
-        creado_en=creado_en,
-        content_type=metadata.get("content_type"),
-        last_modified=metadata.get("last_modified"),
-        categoria=req.categoria,
-        servidor=metadata.get("servidor")
-    )
-
-    db.add(nuevo)
-    db.commit()
+    staging = None if metadata.get("desde_cache") else metadata["ruta_guardado"]
+    try:
+        nuevo = nuevo_documento_url(db, metadata, usuario.id, req.categoria, duplicado)
+        db.commit()
+    except LookupError:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="El contenido en caché fue eliminado; vuelve a intentarlo")
+    except Exception:
+        db.rollback()
+        if staging:
+            borrar(staging)
+        raise
     db.refresh(nuevo)
 
     # Preparar respuesta rica con metadatos extra
     response = {
         "status": "ok",
         "mensaje": "Documento registrado",
-        "documento": {
-            "id": nuevo.id,
-            "nombre": nuevo.nombre_archivo,
-            "extension": nuevo.extension,
-            "version": nuevo.version,
-            "tamano_kb": nuevo.tamano_kb,
-            "ruta_guardado": nuevo.ruta_guardado,
-            "duplicado": nuevo.duplicado,
-            "creado_en": nuevo.creado_en.isoformat() if nuevo.creado_en else None,
-            "categoria": nuevo.categoria
-        },
-        "metadatos_extra": {k: v for k, v in metadata.items() if k not in ("nombre_archivo", "extension", "version", "hash_archivo", "ruta_guardado", "tamano_kb")}
+        "documento": resumen_documento(nuevo),
+        "metadatos_extra": metadatos_extra(metadata)
     }
 
     return response
+
+
+@router.post("/desde-url/lote")
+async def desde_url_lote(reqs: list[URLRequest], db: Session = Depends(get_db), usuario = Depends(get_current_user)):
+    """
+    Igual que /desde-url pero para una lista de URLs. Las descargas se hacen
+    en paralelo (con límite global y por servidor) y los documentos se
+    registran en una sola transacción. Retorna un resultado por URL.
+    """
+    if not reqs:
+        raise HTTPException(status_code=400, detail="La lista de URLs está vacía")
+    if len(reqs) > URL_MAX_LOTE:
+        raise HTTPException(status_code=400, detail=f"Máximo {URL_MAX_LOTE} URLs por lote")
+
+    urls = [str(r.url) for r in reqs]
+    cache = await run_in_threadpool(buscar_entradas, db, [normalize_google_url(u) for u in urls])
+    descargas = await descargar_lote([(u, r.version or "1.0") for u, r in zip(urls, reqs)], usuario.id, cache=cache)
+    resultados = await run_in_threadpool(registrar_lote_urls, db, usuario.id, reqs, descargas)
+    return con_resumen(resultados)
+
+
+def _trabajo_encolado(trabajo) -> dict:
+    return {"trabajo_id": trabajo.id, "estado": trabajo.estado, "estado_url": f"/trabajos/{trabajo.id}"}
+
+
+@router.post("/desde-url/trabajo", status_code=status.HTTP_202_ACCEPTED)
+def desde_url_trabajo(req: URLRequest, db: Session = Depends(get_db), usuario = Depends(get_current_user)):
+    """
+    Como /desde-url pero sin esperar la descarga: responde 202 con el id del
+    trabajo; el avance y el resultado se consultan en GET /trabajos/{id}.
+    """
+    return _trabajo_encolado(encolar_urls(db, usuario.id, [req]))
+
+
+@router.post("/desde-url/lote/trabajo", status_code=status.HTTP_202_ACCEPTED)
+def desde_url_lote_trabajo(reqs: list[URLRequest], db: Session = Depends(get_db), usuario = Depends(get_current_user)):
+    """Versión en segundo plano de /desde-url/lote."""
+    if not reqs:
+        raise HTTPException(status_code=400, detail="La lista de URLs está vacía")
+    if len(reqs) > URL_MAX_LOTE:
+        raise HTTPException(status_code=400, detail=f"Máximo {URL_MAX_LOTE} URLs por lote")
+    return _trabajo_encolado(encolar_urls(db, usuario.id, reqs))
+
+
+@router.get("/desde-url/cache")
+def estadisticas_cache_urls(usuario = Depends(get_current_user)):
+    """Aciertos/fallos de la caché de URLs y bytes que no hubo que descargar."""
+    return estadisticas_cache.resumen()
@@ -1,7 +1,11 @@
-from fastapi import APIRouter, Depends
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from app.database import SessionLocal
-from app.models.historial_documento import HistorialDocumento
+from app.services.document_service import (
+    pagina_versiones, pagina_vigentes, consulta_ultima_version, PAGINA_POR_DEFECTO, PAGINA_MAXIMA
+)
+from app.services.deltas import espacio_por_documento
 from app.api.auth import get_current_user
 
 router = APIRouter(prefix="/documentos/versiones", tags=["Versiones"])
@@ -16,40 +20,104 @@ def get_db():
 
 # --- Listar documentos y sus versiones ---
 @router.get("/")
-def listar_documentos_versiones(db: Session = Depends(get_db), current_user=Depends(get_current_user)):
+def listar_documentos_versiones(
+    limite: int = Query(PAGINA_POR_DEFECTO, ge=1, le=PAGINA_MAXIMA, description="versiones por página"),
+    cursor: str | None = Query(None, description="valor de 'siguiente' de la página anterior"),
+    prefijo: str | None = Query(None, description="nombres que empiezan con este texto"),
+    desde: datetime | None = Query(None, description="subidas desde esta fecha (incluida)"),
+    hasta: datetime | None = Query(None, description="subidas antes de esta fecha"),
+    categoria: str | None = None,
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user)
+):
     """
-    Devuelve todos los documentos con sus versiones del usuario logueado.
-    Ejemplo de respuesta:
+    Devuelve los documentos con sus versiones del usuario logueado, de a
+    `limite` versiones por página ordenadas por nombre y versión ("9.0"
+    antes que "10.0"). Para seguir, pedir de nuevo con `cursor` =
+    `siguiente`; un documento puede continuar en la página siguiente. Ejemplo de respuesta:
     {
         "documentos": [
             {"nombre": "Manual.pdf", "versiones": [...]},
             ...
-        ]
+        ],
+        "siguiente": "WyJNYW51YWwucGRmIiwgNDJd"
     }
     """
-    # 1️⃣ Obtener todos los registros del historial del usuario
-    registros = (
-        db.query(HistorialDocumento)
-        .filter(HistorialDocumento.usuario_id == current_user.id)
-        .order_by(HistorialDocumento.nombre_archivo, HistorialDocumento.version.desc())
-        .all()
-    )
-
-    # 2️⃣ Agrupar por nombre_archivo
-    documentos_dict = {}
-    for r in registros:
-        if r.nombre_archivo not in documentos_dict:
-            documentos_dict[r.nombre_archivo] = []
-        documentos_dict[r.nombre_archivo].append({
-            "version": r.version,
-            "fecha_subida": str(r.fecha_subida) if r.fecha_subida else None,
-            "usuario": current_user.nombre,
-        })
-
-    # 3️⃣ Convertir a lista
-    documentos = [
-        {"nombre": nombre, "versiones": versiones}
-        for nombre, versiones in documentos_dict.items()
-    ]
-
-    return {"documentos": documentos}
+    try:
+        return pagina_versiones(db, current_user.id, limite, cursor, prefijo=prefijo, desde=desde,
+                                hasta=hasta, categoria=categoria)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+# --- Versiones vigentes (una por documento) ---
+@router.get("/vigentes")
+def listar_vigentes(
+    limite: int = Query(PAGINA_POR_DEFECTO, ge=1, le=PAGINA_MAXIMA, description="documentos por página"),
+    cursor: str | None = Query(None, description="valor de 'siguiente' de la página anterior"),
+    prefijo: str | None = Query(None, description="nombres que empiezan con este texto"),
+    categoria: str | None = None,
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user)
+):
+    """
+    La versión vigente (la más alta) de cada documento del usuario
+    logueado, por nombre y de a `limite` documentos. Se lee de
+    documentos_vigentes: el costo depende de los documentos, no de las
+    versiones. `documento_id` es None si el archivo de esa versión se eliminó.
+    """
+    try:
+        pagina = pagina_vigentes(db, current_user.id, limite, cursor, prefijo=prefijo, categoria=categoria)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "documentos": [
+            {
+                "nombre": v.nombre_archivo,
+                "version": v.version,
+                "fecha_subida": v.fecha_subida.strftime("%Y-%m-%d %H:%M:%S") if v.fecha_subida else None,
+                "usuario": v.usuario,
+                "categoria": v.categoria,
+                "total_versiones": v.total_versiones,
+                "documento_id": v.documento_id,
+            }
+            for v in pagina["filas"]
+        ],
+        "siguiente": pagina["siguiente"]
+    }
+
+
+# --- Espacio ahorrado por el almacenamiento en deltas ---
+@router.get("/espacio")
+def espacio_versiones(
+    nombre_archivo: str | None = None,
+    prefijo: str | None = Query(None, description="nombres que empiezan con este texto"),
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user)
+):
+    """
+    Por documento del usuario logueado: versiones, bytes originales, bytes
+    en disco (las versiones anteriores guardadas como delta ocupan menos)
+    y el ahorro, más el total.
+    """
+    return espacio_por_documento(db, current_user.id, nombre_archivo, prefijo)
+
+
+# --- Última versión de un documento ---
+@router.get("/ultima")
+def ultima_version(
+    nombre_archivo: str,
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user)
+):
+    """Versión más alta de un documento del usuario logueado (orden de versión, no de fecha)."""
+    fila = consulta_ultima_version(db, current_user.id, nombre_archivo)
+    if not fila:
+        raise HTTPException(status_code=404, detail=f"No se encontraron versiones para '{nombre_archivo}'")
+    return {
+        "nombre_archivo": fila.nombre_archivo,
+        "version": fila.version,
+        "usuario": fila.usuario,
+        "categoria": fila.categoria,
+        "fecha_subida": fila.fecha_subida.strftime("%Y-%m-%d %H:%M:%S")
+    }
@@ -0,0 +1,40 @@
+# app/api/trabajos.py
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from app.api.auth import get_current_user
+from app.api.documentos import get_db
+from app.models.trabajo import Trabajo
+from app.services.trabajos import estado_trabajo
+
+router = APIRouter(prefix="/trabajos", tags=["Trabajos en segundo plano"])
+
+
+# ===============================
+# ENDPOINT: LISTAR MIS TRABAJOS
+# ===============================
+@router.get("")
+def listar_trabajos(
+    estado: str | None = None,
+    limite: int = 50,
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user)
+):
+    consulta = db.query(Trabajo).filter(Trabajo.usuario_id == current_user.id)
+    if estado:
+        consulta = consulta.filter(Trabajo.estado == estado)
+    trabajos = consulta.order_by(Trabajo.creado_en.desc()).limit(min(limite, 200)).all()
+    return {"trabajos": [estado_trabajo(t) for t in trabajos]}
+
+
+# ===============================
+# ENDPOINT: ESTADO Y PROGRESO
+# ===============================
+@router.get("/{trabajo_id}")
+def consultar_trabajo(trabajo_id: str, db: Session = Depends(get_db), current_user=Depends(get_current_user)):
+    trabajo = db.query(Trabajo).filter(
+        Trabajo.id == trabajo_id,
+        Trabajo.usuario_id == current_user.id
+    ).first()
+    if not trabajo:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return estado_trabajo(trabajo)
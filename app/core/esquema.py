@@ -0,0 +1,157 @@
+# app/core/esquema.py
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.schema import CreateIndex
+from app.database import Base
+from app.services.vigentes import reconstruir_vigentes
+from app.utils.versiones import clave_de_version
+
+LOTE_CLAVES = 5000  # filas por UPDATE al completar clave_version
+
+
+def actualizar_esquema(engine):
+    """
+    Complementa Base.metadata.create_all() en bases ya existentes:
+    create_all solo crea tablas nuevas, así que aquí se agregan las
+    columnas e índices que falten y se quitan restricciones obsoletas.
+    """
+    inspector = inspect(engine)
+    agregadas = set()
+    with engine.begin() as conn:
+        for tabla in Base.metadata.sorted_tables:
+            if not inspector.has_table(tabla.name):
+                continue
+
+            existentes = {c["name"] for c in inspector.get_columns(tabla.name)}
+            for col in tabla.columns:
+                if col.name not in existentes:
+                    tipo = col.type.compile(dialect=engine.dialect)
+                    # Se agregan como NULL para no fallar con filas existentes
+                    conn.execute(text(f"ALTER TABLE {tabla.name} ADD COLUMN {col.name} {tipo}"))
+                    agregadas.add((tabla.name, col.name))
+
+            # IF NOT EXISTS: el inspector no siempre refleja índices funcionales (lower())
+            for indice in tabla.indexes:
+                if _aplica(indice, engine.dialect.name):
+                    conn.execute(CreateIndex(indice, if_not_exists=True))
+
+        # Completar hash_md5/hash_sha256 de filas anteriores a partir de hash_archivo
+        # (/upload guardaba MD5 de 32 caracteres y /desde-url SHA-256 de 64)
+        if inspector.has_table("documentos"):
+            conn.execute(text(
+                "UPDATE documentos SET hash_md5 = hash_archivo "
+                "WHERE hash_md5 IS NULL AND length(hash_archivo) = 32"
+            ))
+            conn.execute(text(
+                "UPDATE documentos SET hash_sha256 = hash_archivo "
+                "WHERE hash_sha256 IS NULL AND length(hash_archivo) = 64"
+            ))
+
+        # hash_archivo dejó de ser único: el mismo contenido puede estar
+        # en varias filas (otro usuario u otra versión) y comparte blob
+        if engine.dialect.name == "postgresql" and inspector.has_table("documentos"):
+            for uc in inspector.get_unique_constraints("documentos"):
+                if uc["column_names"] == ["hash_archivo"]:
+                    conn.execute(text(f'ALTER TABLE documentos DROP CONSTRAINT "{uc["name"]}"'))
+
+        # La categoría del historial se copia de su documento (solo al crear la columna)
+        if ("historial_documentos", "categoria") in agregadas:
+            conn.execute(text(
+                "UPDATE historial_documentos SET categoria = ("
+                "SELECT d.categoria FROM documentos d "
+                "WHERE d.usuario_id = historial_documentos.usuario_id "
+                "AND d.nombre_archivo = historial_documentos.nombre_archivo "
+                "AND d.version = historial_documentos.version LIMIT 1)"
+            ))
+
+        # En PostgreSQL reemplazado por ix_vigentes_usuario_lower_nombre_c (rango de prefijo en COLLATE "C")
+        if engine.dialect.name == "postgresql":
+            conn.execute(text("DROP INDEX IF EXISTS ix_vigentes_usuario_lower_nombre"))
+
+        # Reemplazados por ix_historial_usuario_nombre_clave (orden por versión)
+        conn.execute(text("DROP INDEX IF EXISTS ix_historial_usuario_nombre_version"))
+        conn.execute(text("DROP INDEX IF EXISTS ix_historial_usuario_nombre_id"))
+
+        # clave_version de las filas anteriores a la columna (se calcula en Python)
+        for tabla in ("documentos", "historial_documentos"):
+            if (tabla, "clave_version") in agregadas:
+                _completar_claves(conn, tabla)
+
+        # documentos_vigentes recién creada en una base con historial: se arma una vez
+        if (
+            inspector.has_table("historial_documentos")
+            and conn.execute(text("SELECT 1 FROM historial_documentos LIMIT 1")).first()
+            and not conn.execute(text("SELECT 1 FROM documentos_vigentes LIMIT 1")).first()
+        ):
+            reconstruir_vigentes(conn)
+
+    _indices_busqueda(engine)
+
+
+def _aplica(indice, dialecto: str) -> bool:
+    """create_all respeta Index.ddl_if(dialect=...); CreateIndex no, así que se filtra aquí."""
+    condicion = indice._ddl_if
+    if condicion is None or condicion.dialect is None:
+        return True
+    return dialecto in ((condicion.dialect,) if isinstance(condicion.dialect, str) else condicion.dialect)
+
+
+def _indices_busqueda(engine):
+    """
+    Búsqueda de nombres por subcadena (app/services/busqueda.py): índice de
+    trigramas (pg_trgm) en PostgreSQL o tabla FTS5 con tokenizador trigram
+    en SQLite, sobre documentos_vigentes. Va en su propia transacción: sin
+    permisos para la extensión o sin FTS5 la búsqueda usa LIKE sin índice.
+    """
+    try:
+        with engine.begin() as conn:
+            if engine.dialect.name == "postgresql":
+                conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+                conn.execute(text(
+                    "CREATE INDEX IF NOT EXISTS ix_vigentes_nombre_trgm ON documentos_vigentes "
+                    "USING gin (lower(nombre_archivo) gin_trgm_ops)"
+                ))
+            elif engine.dialect.name == "sqlite":
+                if conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'vigentes_fts'")).first():
+                    return
+                conn.execute(text(
+                    "CREATE VIRTUAL TABLE vigentes_fts USING fts5(nombre_archivo, usuario_id UNINDEXED, "
+                    "content='documentos_vigentes', content_rowid='id', tokenize='trigram')"
+                ))
+                # La tabla FTS sigue a documentos_vigentes (solo cambios de nombre o usuario)
+                conn.execute(text(
+                    "CREATE TRIGGER vigentes_fts_ai AFTER INSERT ON documentos_vigentes BEGIN "
+                    "INSERT INTO vigentes_fts(rowid, nombre_archivo, usuario_id) "
+                    "VALUES (new.id, new.nombre_archivo, new.usuario_id); END"
+                ))
+                conn.execute(text(
+                    "CREATE TRIGGER vigentes_fts_ad AFTER DELETE ON documentos_vigentes BEGIN "
+                    "INSERT INTO vigentes_fts(vigentes_fts, rowid, nombre_archivo, usuario_id) "
+                    "VALUES ('delete', old.id, old.nombre_archivo, old.usuario_id); END"
+                ))
+                conn.execute(text(
+                    "CREATE TRIGGER vigentes_fts_au AFTER UPDATE OF nombre_archivo, usuario_id "
+                    "ON documentos_vigentes BEGIN "
+                    "INSERT INTO vigentes_fts(vigentes_fts, rowid, nombre_archivo, usuario_id) "
+                    "VALUES ('delete', old.id, old.nombre_archivo, old.usuario_id); "
+                    "INSERT INTO vigentes_fts(rowid, nombre_archivo, usuario_id) "
+                    "VALUES (new.id, new.nombre_archivo, new.usuario_id); END"
+                ))
+                conn.execute(text("INSERT INTO vigentes_fts(vigentes_fts) VALUES ('rebuild')"))
+    except DBAPIError as e:
+        print(f"⚠️ Búsqueda por subcadena sin índice: {e.orig}")
+
+
+def _completar_claves(conn, tabla: str):
+    ultimo = 0
+    while True:
+        filas = conn.execute(text(
+            f"SELECT id, version FROM {tabla} WHERE id > :ultimo ORDER BY id LIMIT {LOTE_CLAVES}"
+        ), {"ultimo": ultimo}).all()
+        if not filas:
+            return
+        conn.execute(
+            text(f"UPDATE {tabla} SET clave_version = :clave WHERE id = :id"),
+            [{"id": id_, "clave": clave_de_version(version)} for id_, version in filas]
+        )
+        ultimo = filas[-1][0]
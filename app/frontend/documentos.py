@@ -3,6 +3,59 @@ import requests
 
 API_BASE = "http://127.0.0.1:8000"
 
+# Archivos por encima de este tamaño se suben por sesión reanudable
+UMBRAL_SESION_BYTES = 8 * 1024 * 1024
+MAX_REINTENTOS = 5
+
+
+def subir_por_sesiones(archivo, version, categoria, headers):
+    """
+    Sube el archivo en bloques usando /documentos/sesiones.
+    Si un bloque falla, consulta el offset confirmado y continúa desde ahí
+    en lugar de reenviar todo el archivo.
+    """
+    contenido = archivo.getvalue()
+    resp = requests.post(f"{API_BASE}/documentos/sesiones", data={
+        "nombre_archivo": archivo.name,
+        "tamano_total": len(contenido),
+        "version": version,
+        "categoria": categoria,
+        "content_type": archivo.type,
+    }, headers=headers)
+    if not resp.ok:
+        return resp
+
+    sesion = resp.json()
+    sesion_id = sesion["sesion_id"]
+    chunk = sesion["chunk_sugerido"]
+    offset = sesion["offset"]
+    progreso = st.progress(0, text="Subiendo por bloques...")
+    reintentos = 0
+
+    while offset < len(contenido):
+        try:
+            resp = requests.put(
+                f"{API_BASE}/documentos/sesiones/{sesion_id}",
+                params={"offset": offset},
+                data=contenido[offset:offset + chunk],
+                headers=headers,
+            )
+            if resp.status_code == 400:
+                return resp
+            if not resp.ok and resp.status_code != 409:
+                resp.raise_for_status()
+            reintentos = 0
+        except requests.RequestException:
+            reintentos += 1
+            if reintentos > MAX_REINTENTOS:
+                raise
+        # El servidor es quien sabe cuántos bytes quedaron confirmados
+        offset = requests.get(f"{API_BASE}/documentos/sesiones/{sesion_id}", headers=headers).json()["offset"]
+        progreso.progress(offset / len(contenido), text=f"Subiendo por bloques... {offset // 1024} KB")
+
+    progreso.empty()
+    return requests.post(f"{API_BASE}/documentos/sesiones/{sesion_id}/finalizar", headers=headers)
+
 
 def documentos_page(cambiar_vista):
     """Pantalla para subir documentos luego del login."""
@@ -159,14 +212,17 @@ def documentos_page(cambiar_vista):
                     tamano_mb = round(tamano_bytes / (1024 * 1024), 2)
                     
                     headers = {"Authorization": f"Bearer {st.session_state.token}"}
-                    files = {"file": (archivo.name, archivo.getvalue())}
-                    data = {
-                        "nombre": nombre,
-                        "version": version,
-                        "categoria": categoria,
-                        "extension": extension,
-                    }
-                    resp = requests.post(f"{API_BASE}/documentos/upload", files=files, data=data, headers=headers)
+                    if tamano_bytes > UMBRAL_SESION_BYTES:
+                        resp = subir_por_sesiones(archivo, version, categoria, headers)
+                    else:
+                        files = {"file": (archivo.name, archivo.getvalue())}
+                        data = {
+                            "nombre": nombre,
+                            "version": version,
+                            "categoria": categoria,
+                            "extension": extension,
+                        }
+                        resp = requests.post(f"{API_BASE}/documentos/upload", files=files, data=data, headers=headers)
 
                     if resp.ok:
                         st.success("✅ Documento subido correctamente.")
@@ -117,29 +117,45 @@ def versiones_page(cambiar_vista):
         st.markdown("## 📘 Versiones Vigentes")
         st.info("Aquí podrás ver las versiones activas y sus detalles más recientes.")
 
-        if st.button("📂 Consultar versiones"):
+        # La API entrega los documentos por páginas: "siguiente" es el cursor de la que sigue
+        if "vigentes" not in st.session_state:
+            st.session_state.vigentes = None
+            st.session_state.vigentes_siguiente = None
+
+        def cargar_vigentes(cursor=None):
             try:
                 headers = {"Authorization": f"Bearer {st.session_state.token}"}
-                res = requests.get(f"{API_BASE}/documentos/versiones", headers=headers)
+                params = {"cursor": cursor} if cursor else {}
+                res = requests.get(f"{API_BASE}/documentos/versiones/vigentes", headers=headers, params=params)
                 if res.ok:
                     data = res.json()
-                    documentos = data.get("documentos", [])
-
-                    if documentos:
-                        st.success(f"📄 Se encontraron {len(documentos)} documento(s) con versiones registradas.")
-                        for doc in documentos:
-                            with st.expander(f"📘 {doc['nombre']} ({len(doc.get('versiones', []))} versiones)"):
-                                for v in doc["versiones"]:
-                                    st.markdown(
-                                        f"- 🔖 **Versión:** {v['version']} | 📅 {v['fecha_subida']} | 👤 {v['usuario']}"
-                                    )
-                    else:
-                        st.warning("⚠️ No se encontraron documentos con versiones registradas.")
+                    anteriores = st.session_state.vigentes if cursor else []
+                    st.session_state.vigentes = anteriores + data.get("documentos", [])
+                    st.session_state.vigentes_siguiente = data.get("siguiente")
                 else:
                     st.error(f"❌ Error al obtener las versiones: {res.status_code}")
             except Exception as e:
                 st.error(f"❌ Error de conexión: {e}")
 
+        if st.button("📂 Consultar versiones"):
+            cargar_vigentes()
+
+        documentos = st.session_state.vigentes
+        if documentos is not None:
+            if documentos:
+                mas = " (hay más)" if st.session_state.vigentes_siguiente else ""
+                st.success(f"📄 Se encontraron {len(documentos)} documento(s) con versiones registradas{mas}.")
+                for doc in documentos:
+                    with st.expander(f"📘 {doc['nombre']} ({doc['total_versiones']} versiones)"):
+                        st.markdown(
+                            f"- 🔖 **Versión vigente:** {doc['version']} | 📅 {doc['fecha_subida']} | 👤 {doc['usuario']}"
+                        )
+                if st.session_state.vigentes_siguiente and st.button("⬇ Cargar más"):
+                    cargar_vigentes(st.session_state.vigentes_siguiente)
+                    st.rerun()
+            else:
+                st.warning("⚠️ No se encontraron documentos con versiones registradas.")
+
         st.button("⬅ Volver al panel principal", on_click=lambda: cambiar_vista("dashboard"))
 
         st.markdown('</div>', unsafe_allow_html=True)
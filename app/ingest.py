@@ -0,0 +1,277 @@
+# app/ingest.py
+# Carga masiva por línea de comandos, directo contra la base y el almacén
+# (sin pasar por HTTP). Pensado para las cargas iniciales de millones de
+# documentos:
+#
+#   python -m app.ingest carpeta /mnt/escaneos --usuario 1 [--workers 8] [--batch-size 1000]
+#   python -m app.ingest paquete expediente.zip --usuario 1
+#   python -m app.ingest urls urls.txt --usuario 1
+#
+# --dry-run lee, hashea, valida y cuenta duplicados sin copiar ni registrar
+# nada. Muestra el avance mientras corre y al final un resumen con
+# archivos/s, MB/s, duplicados, corruptos y segundos por etapa.
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+from pydantic import ValidationError
+from app.database import engine, Base, SessionLocal
+from app.core.esquema import actualizar_esquema
+import app.models  # noqa: F401  (registra todas las tablas)
+from app.models.documento import Documento
+from app.services.almacenamiento import borrar, ejecutor_almacenamiento
+from app.services.cache_urls import buscar_entradas
+from app.services.paquetes import PaqueteInvalido
+from app.services.documentos_url_service import (
+    descargar_lote, normalize_google_url, registrar_lote_urls, URLRequest, URL_CONCURRENCIA, URL_CONCURRENCIA_HOST
+)
+from app.services.validacion import servicio_validacion
+from app.utils.etapas import Etapas
+from app.utils.ingesta import INGESTA_WORKERS, INGESTA_LOTE, nueva_ingesta, ingresar_carpeta, ingesta_paquete
+from app.utils.reportes import ReporteErrores, FORMATOS, REPORTE_FORMATO
+
+MB = 1024 * 1024
+
+
+class ProgresoConsola:
+    """
+    Avance en stderr con la misma firma que ContextoTrabajo.progreso. En
+    una terminal reescribe una sola línea; redirigido, escribe una línea
+    cada tanto para no llenar el log.
+    """
+
+    def __init__(self, bytes_procesados=None):
+        self.bytes_procesados = bytes_procesados  # callable opcional
+        self.inicio = time.monotonic()
+        self.terminal = sys.stderr.isatty()
+        self.cada_s = 0.5 if self.terminal else 10.0
+        self._ultimo = 0.0
+
+    def __call__(self, actual: int, total: int | None = None, forzar: bool = False):
+        self._actual, self._total = actual, total or getattr(self, "_total", None)
+        ahora = time.monotonic()
+        if not forzar and ahora - self._ultimo < self.cada_s:
+            return
+        self._ultimo = ahora
+        segundos = max(ahora - self.inicio, 1e-6)
+        partes = [f"{actual:,}" + (f"/{total:,}" if total else "") + " archivos",
+                  f"{actual / segundos:,.1f} archivos/s"]
+        if self.bytes_procesados:
+            mb = self.bytes_procesados() / MB
+            partes += [f"{mb:,.1f} MB", f"{mb / segundos:,.1f} MB/s"]
+        linea = " | ".join(partes)
+        if self.terminal:
+            sys.stderr.write(f"\r{linea}\033[K")
+        else:
+            sys.stderr.write(linea + "\n")
+        sys.stderr.flush()
+
+    def terminar(self):
+        """Deja a la vista el conteo final."""
+        if self._ultimo:
+            self(self._actual, self._total, forzar=True)
+            if self.terminal:
+                sys.stderr.write("\n")
+
+
+# ===============================
+# MODOS
+# ===============================
+def ingesta_carpeta(db, args, consola: ProgresoConsola) -> dict:
+    estado = nueva_ingesta(db, args.usuario, args.ruta, args.version, args.categoria, args.batch_size,
+                           consola, incremental=not args.completa, simulacion=args.dry_run,
+                           formato_reporte=args.reporte)
+    consola.bytes_procesados = lambda: estado.bytes
+    return ingresar_carpeta(estado, args.ruta, args.workers)
+
+
+def ingesta_paquete_cli(db, args, consola: ProgresoConsola) -> dict:
+    resultado = ingesta_paquete(args.ruta, args.usuario, db, args.version, args.categoria,
+                                simulacion=args.dry_run, progreso=consola, tamano_lote=args.batch_size,
+                                formato_reporte=args.reporte)
+    segundos = max(resultado["segundos"], 1e-6)
+    return {
+        **resultado,
+        "archivos": resultado["miembros"],
+        "archivos_por_s": round(resultado["miembros"] / segundos, 1),
+        "mb_por_s": round(resultado["bytes"] / MB / segundos, 2),
+    }
+
+
+def leer_urls(ruta: str):
+    """Una URL por línea, opcionalmente con versión y categoría separadas por tabulador."""
+    with open(ruta, encoding="utf-8") as f:
+        for linea in f:
+            linea = linea.strip()
+            if not linea or linea.startswith("#"):
+                continue
+            campos = linea.split("\t")
+            yield campos[0], (campos[1] if len(campos) > 1 else None), (campos[2] if len(campos) > 2 else None)
+
+
+def _simular_lote(db, reqs: list[URLRequest], descargas: list, vistos: set) -> list[dict]:
+    """
+    Como registrar_lote_urls pero sin registrar: marca duplicados y borra lo
+    descargado. `vistos` son los hashes de las tandas anteriores de la corrida.
+    """
+    exitosas = [m for m in descargas if isinstance(m, dict)]
+    hashes = {m["hash_archivo"] for m in exitosas}
+    existentes = vistos
+    if hashes:
+        existentes.update(h for (h,) in db.query(Documento.hash_sha256).filter(Documento.hash_sha256.in_(hashes)).distinct())
+    resultados = []
+    for req, metadata in zip(reqs, descargas):
+        if not isinstance(metadata, dict):
+            resultados.append({"url": str(req.url), "estado": "error", "detalle": f"No se pudo procesar la URL: {metadata}"})
+            continue
+        if metadata["ruta_guardado"]:
+            borrar(metadata["ruta_guardado"])
+        duplicado = metadata["hash_archivo"] in existentes
+        existentes.add(metadata["hash_archivo"])
+        resultados.append({"url": str(req.url), "estado": "ok", "documento": {"duplicado": duplicado}})
+    return resultados
+
+
+def ingesta_urls(db, args, consola: ProgresoConsola) -> dict:
+    """
+    Descarga las URLs de a `--batch-size` (con `--workers` descargas a la
+    vez) y registra cada tanda en una transacción, como /desde-url/lote.
+    """
+    etapas = Etapas()
+    inicio = time.monotonic()
+    concurrencia = args.workers or URL_CONCURRENCIA
+    tamano_lote = args.batch_size or INGESTA_LOTE
+    cuenta = {"archivos": 0, "registrados": 0, "duplicados": 0, "errores": 0, "bytes": 0}
+    reporte = ReporteErrores("ingesta_urls", args.reporte)
+    vistos = set()
+    consola.bytes_procesados = lambda: cuenta["bytes"]
+
+    def procesar(reqs: list[URLRequest]):
+        base = cuenta["archivos"]
+        cache = buscar_entradas(db, [normalize_google_url(str(r.url)) for r in reqs])
+        with etapas.medir("descarga"):
+            descargas = asyncio.run(descargar_lote(
+                [(str(r.url), r.version or "1.0") for r in reqs], args.usuario,
+                concurrencia=concurrencia, por_host=min(URL_CONCURRENCIA_HOST, concurrencia),
+                cache=cache, al_terminar=lambda n: consola(base + n)
+            ))
+        cuenta["bytes"] += sum(m["tamano_bytes"] for m in descargas if isinstance(m, dict) and not m["desde_cache"])
+        with etapas.medir("registro"):
+            if args.dry_run:
+                resultados = _simular_lote(db, reqs, descargas, vistos)
+            else:
+                resultados = registrar_lote_urls(db, args.usuario, reqs, descargas)
+        cuenta["archivos"] += len(reqs)
+        for r in resultados:
+            if r["estado"] != "ok":
+                cuenta["errores"] += 1
+                reporte.agregar(r["url"], r["estado"], r["detalle"])
+            elif r["documento"]["duplicado"]:
+                cuenta["duplicados"] += 1
+            else:
+                cuenta["registrados"] += 1
+
+    with reporte:
+        lote = []
+        for url, version, categoria in leer_urls(args.ruta):
+            try:
+                lote.append(URLRequest(url=url, version=version or args.version, categoria=categoria or args.categoria))
+            except ValidationError:
+                cuenta["archivos"] += 1
+                cuenta["errores"] += 1
+                reporte.agregar(url, "error", "URL inválida")
+            if len(lote) >= tamano_lote:
+                procesar(lote)
+                lote = []
+        if lote:
+            procesar(lote)
+
+    segundos = max(time.monotonic() - inicio, 1e-6)
+    resumen = {
+        **cuenta,
+        "segundos": round(segundos, 2),
+        "archivos_por_s": round(cuenta["archivos"] / segundos, 1),
+        "mb_por_s": round(cuenta["bytes"] / MB / segundos, 2),
+        "etapas_s": etapas.resumen(),
+        "simulacion": args.dry_run,
+    }
+    if reporte.ruta:
+        resumen["reporte"] = reporte.ruta
+    return resumen
+
+
+MODOS = {"carpeta": ingesta_carpeta, "paquete": ingesta_paquete_cli, "urls": ingesta_urls}
+
+
+def imprimir_resumen(resumen: dict):
+    filas = [
+        ("Archivos", resumen.get("archivos", 0)),
+        ("Registrados", resumen.get("registrados", 0)),
+        ("Modificados", resumen.get("modificados")),
+        ("Sin cambios", resumen.get("sin_cambios")),
+        ("Duplicados", resumen.get("duplicados", 0)),
+        ("Corruptos", resumen.get("corruptos")),
+        ("Errores", resumen.get("errores", 0)),
+        ("Omitidos", resumen.get("omitidos")),
+        ("MB", round(resumen.get("bytes", 0) / MB, 1)),
+        ("Segundos", resumen["segundos"]),
+        ("Archivos/s", resumen["archivos_por_s"]),
+        ("MB/s", resumen["mb_por_s"]),
+    ]
+    print("\nSimulación (--dry-run): no se registró nada" if resumen.get("simulacion") else "\nResumen")
+    for etiqueta, valor in filas:
+        if valor is not None:
+            print(f"  {etiqueta:<14}{valor:>14,}")
+    if resumen.get("etapas_s"):
+        print("Segundos por etapa (las de los workers se suman entre procesos)")
+        for etapa, segundos in sorted(resumen["etapas_s"].items(), key=lambda e: -e[1]):
+            print(f"  {etapa:<14}{segundos:>14,.2f}")
+    if resumen.get("reporte"):
+        print(f"Reporte de errores: {resumen['reporte']}")
+
+
+def main(argv=None):
+    comunes = argparse.ArgumentParser(add_help=False)
+    comunes.add_argument("--usuario", type=int, required=True, help="id del usuario dueño de los documentos")
+    comunes.add_argument("--version", default="1.0")
+    comunes.add_argument("--categoria")
+    comunes.add_argument("--workers", type=int,
+                         help=f"procesos de hash/validación (por defecto {INGESTA_WORKERS}) "
+                              f"o descargas simultáneas en 'urls' (por defecto {URL_CONCURRENCIA})")
+    comunes.add_argument("--batch-size", type=int, default=INGESTA_LOTE, help="documentos por commit")
+    comunes.add_argument("--dry-run", action="store_true", help="validar y contar sin registrar nada")
+    comunes.add_argument("--reporte", choices=list(FORMATOS), default=REPORTE_FORMATO,
+                         help="formato del reporte de errores")
+
+    parser = argparse.ArgumentParser(description="Carga masiva de documentos directo a la base (sin HTTP)")
+    modos = parser.add_subparsers(dest="modo", required=True)
+    carpeta = modos.add_parser("carpeta", parents=[comunes], help="carpeta local, recursiva")
+    carpeta.add_argument("ruta")
+    carpeta.add_argument("--completa", action="store_true", help="ignorar el manifiesto y leer todo")
+    modos.add_parser("paquete", parents=[comunes], help="paquete ZIP/TRD/CCD").add_argument("ruta")
+    modos.add_parser("urls", parents=[comunes], help="archivo de texto con una URL por línea").add_argument("ruta")
+    args = parser.parse_args(argv)
+
+    if not Path(args.ruta).exists():
+        parser.error(f"No existe: {args.ruta}")
+
+    Base.metadata.create_all(bind=engine)
+    actualizar_esquema(engine)
+
+    db = SessionLocal()
+    consola = ProgresoConsola()
+    try:
+        resumen = MODOS[args.modo](db, args, consola)
+    except (ValueError, PaqueteInvalido) as e:
+        parser.exit(1, f"Error: {e}\n")
+    finally:
+        consola.terminar()
+        db.close()
+        servicio_validacion.cerrar()
+        ejecutor_almacenamiento.cerrar()
+    imprimir_resumen(resumen)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 # main.py
 from fastapi import FastAPI, Request
-from app.database import engine, Base
+from app.database import engine, Base, SessionLocal
+from app.core.esquema import actualizar_esquema
 from app.api import auth
 from app.api import documentos
 from app.api import documentos_versiones
@@ -8,13 +9,41 @@ from fastapi.responses import HTMLResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from app.api import documentos_url
+from app.api import documentos_sesiones
+from app.api import trabajos
+from app.services.validacion import servicio_validacion
+from app.services.almacenamiento import ejecutor_almacenamiento
+from app.services.filtro_duplicados import filtro_duplicados
+from app.services.sesiones_carga import limpiar_en_segundo_plano
+from app.services.trabajos import pool_trabajos, TRABAJOS_EN_PROCESO
 
 # Crear todas las tablas en la base de datos (si no existen)
 Base.metadata.create_all(bind=engine)
+actualizar_esquema(engine)
 
 # Crear la aplicación FastAPI
 app = FastAPI(title="Gestor Documental")
 
+@app.on_event("startup")
+def calentar_filtro_duplicados():
+    filtro_duplicados.calentar_en_segundo_plano(SessionLocal)
+
+@app.on_event("startup")
+def vencer_sesiones_de_carga():
+    limpiar_en_segundo_plano(SessionLocal)
+
+@app.on_event("startup")
+def iniciar_trabajos():
+    # Con TRABAJOS_EN_PROCESO=False la cola la atiende `python -m app.worker`
+    if TRABAJOS_EN_PROCESO:
+        pool_trabajos.iniciar(SessionLocal)
+
+@app.on_event("shutdown")
+def cerrar_pools():
+    pool_trabajos.detener()
+    servicio_validacion.cerrar()
+    ejecutor_almacenamiento.cerrar()
+
 # Montar directorio estático
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
 
@@ -67,6 +96,8 @@ async def historial_page(request: Request):
 app.include_router(auth.router, prefix="/auth", tags=["Autenticación"])
 app.include_router(documentos.router, prefix="/documentos")        # Upload, historial
 app.include_router(documentos_versiones.router)                    # Versiones API
+app.include_router(documentos_sesiones.router)                     # Subida reanudable por bloques
+app.include_router(trabajos.router)                                # Estado de trabajos en segundo plano
 
 # ===============================
 # Nota:
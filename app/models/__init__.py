@@ -1,2 +1,9 @@
 from app.models.usuario import Usuario
 from app.models.documento import Documento
+from app.models.historial_documento import HistorialDocumento
+from app.models.sesion_carga import SesionCarga
+from app.models.blob import Blob
+from app.models.cache_url import CacheURL
+from app.models.trabajo import Trabajo
+from app.models.manifiesto_ingesta import ManifiestoIngesta
+from app.models.documento_vigente import DocumentoVigente
@@ -0,0 +1,17 @@
+# app/models/blob.py
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, func
+from app.database import Base
+
+class Blob(Base):
+    """Contenido físico almacenado una sola vez, direccionado por su hash."""
+    __tablename__ = "blobs"
+
+    hash = Column(String, primary_key=True)
+    ruta = Column(String, unique=True, nullable=False)  # uploads/blobs/ab/cd/<hash>
+    tamano_bytes = Column(BigInteger, nullable=False)
+    referencias = Column(Integer, nullable=False, default=0)  # filas de 'documentos' que lo usan
+    # Versión anterior guardada como delta (app/services/deltas.py): el
+    # archivo es '<ruta>.delta' y se reconstruye a partir del blob base_hash
+    base_hash = Column(String, nullable=True, index=True)
+    tamano_almacenado = Column(BigInteger, nullable=True)  # bytes del delta (NULL: archivo completo)
+    creado_en = Column(DateTime, server_default=func.now())
@@ -0,0 +1,20 @@
+# app/models/cache_url.py
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, func
+from app.database import Base
+
+class CacheURL(Base):
+    """Última descarga de cada URL externa: validadores HTTP y blob donde quedó el contenido."""
+    __tablename__ = "cache_urls"
+
+    url = Column(String, primary_key=True)  # URL normalizada (normalize_google_url)
+    etag = Column(String, nullable=True)
+    last_modified = Column(String, nullable=True)
+    hash_sha256 = Column(String, nullable=False, index=True)  # -> blobs.hash
+    hash_md5 = Column(String, nullable=True)
+    tamano_bytes = Column(BigInteger, nullable=False)
+    nombre_archivo = Column(String, nullable=False)
+    extension = Column(String, nullable=False)
+    content_type = Column(String, nullable=True)
+    servidor = Column(String, nullable=True)
+    aciertos = Column(Integer, nullable=False, default=0)  # respuestas 304 aprovechadas
+    actualizado_en = Column(DateTime, server_default=func.now(), onupdate=func.now())
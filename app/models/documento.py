@@ -1,15 +1,25 @@
 # app/models/documento.py
-from sqlalchemy import Column, Integer, String, Boolean, Float, DateTime, ForeignKey, func
+from sqlalchemy import Column, Integer, String, Boolean, Float, DateTime, ForeignKey, Index, func
 from app.database import Base
+from app.utils.versiones import clave_al_insertar
 
 class Documento(Base):
     __tablename__ = "documentos"
+    __table_args__ = (
+        # Chequeo de duplicados por usuario: (usuario_id, hash_sha256, version)
+        Index("ix_documentos_usuario_hash_version", "usuario_id", "hash_sha256", "version"),
+        # Versiones de un documento en orden (la última primero con ORDER BY ... DESC)
+        Index("ix_documentos_usuario_nombre_clave", "usuario_id", "nombre_archivo", "clave_version"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     nombre_archivo = Column(String, nullable=False)
     extension = Column(String, nullable=False)
     version = Column(String, nullable=True)
-    hash_archivo = Column(String, unique=True, nullable=False)
+    clave_version = Column(String, nullable=True, default=clave_al_insertar)  # ver app/utils/versiones.py
+    hash_archivo = Column(String, index=True, nullable=False)  # el mismo contenido puede estar en varias filas
+    hash_md5 = Column(String, index=True, nullable=True)
+    hash_sha256 = Column(String, index=True, nullable=True)  # hash fuerte: deduplicación
     ruta_guardado = Column(String, nullable=False)
     tamano_kb = Column(Float, nullable=False)
     duplicado = Column(Boolean, default=False)
@@ -19,4 +29,6 @@ class Documento(Base):
     content_type = Column(String, nullable=True)
     last_modified = Column(String, nullable=True)
     servidor = Column(String, nullable=True)
-    categoria = Column(String, nullable=True) 
\ No newline at end of file
+    categoria = Column(String, nullable=True)
+    # Miembros de un paquete ZIP/TRD/CCD: apunta al documento del paquete
+    paquete_id = Column(Integer, ForeignKey("documentos.id"), nullable=True, index=True)
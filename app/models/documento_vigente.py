@@ -0,0 +1,45 @@
+# app/models/documento_vigente.py
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, UniqueConstraint, Index, func
+from app.database import Base
+
+class DocumentoVigente(Base):
+    """
+    Versión vigente (la más alta) de cada documento del usuario. Es una
+    proyección de 'historial_documentos' que se mantiene al registrar y
+    se puede reconstruir (python -m app.services.vigentes): el listado de
+    vigentes lee una fila por documento en vez de todo el historial.
+    """
+    __tablename__ = "documentos_vigentes"
+    __table_args__ = (
+        # Una fila por documento; también da el orden del listado por nombre
+        UniqueConstraint("usuario_id", "nombre_archivo", name="uq_vigentes_usuario_nombre"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    usuario_id = Column(Integer, ForeignKey("usuarios.id"), nullable=False)
+    nombre_archivo = Column(String, nullable=False)
+    historial_id = Column(Integer, ForeignKey("historial_documentos.id"), nullable=False)
+    documento_id = Column(Integer, ForeignKey("documentos.id", ondelete="SET NULL"), nullable=True)
+    version = Column(String, nullable=True)
+    clave_version = Column(String, nullable=True)
+    categoria = Column(String, nullable=True)
+    usuario = Column(String, nullable=False)
+    fecha_subida = Column(DateTime, nullable=True)
+    total_versiones = Column(Integer, nullable=False, default=1)
+
+
+# Búsqueda por nombre exacto o prefijo sin distinguir mayúsculas (app/services/busqueda.py);
+# la búsqueda por subcadena usa pg_trgm o FTS5 (ver app/core/esquema.py).
+# El rango del prefijo se compara byte a byte: en PostgreSQL con COLLATE "C" (la
+# intercalación del idioma ignora '_' y espacios y el rango dejaría nombres afuera),
+# en SQLite con la intercalación BINARY por defecto.
+Index(
+    "ix_vigentes_usuario_lower_nombre",
+    DocumentoVigente.usuario_id,
+    func.lower(DocumentoVigente.nombre_archivo),
+).ddl_if(dialect="sqlite")
+Index(
+    "ix_vigentes_usuario_lower_nombre_c",
+    DocumentoVigente.usuario_id,
+    func.lower(DocumentoVigente.nombre_archivo).collate("C"),
+).ddl_if(dialect="postgresql")
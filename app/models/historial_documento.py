@@ -1,15 +1,32 @@
 # app/models/historial_documento.py
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index, func
 from app.database import Base
+from app.utils.versiones import clave_al_insertar
 from datetime import datetime
 
 class HistorialDocumento(Base):
     __tablename__ = "historial_documentos"
+    __table_args__ = (
+        # Listado de versiones paginado en orden de versión y "última versión"
+        Index("ix_historial_usuario_nombre_clave", "usuario_id", "nombre_archivo", "clave_version", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     nombre_archivo = Column(String, nullable=False)
     version = Column(String, nullable=True)
+    clave_version = Column(String, nullable=True, default=clave_al_insertar)  # ver app/utils/versiones.py
     usuario = Column(String, nullable=False)  # puedes mantener para mostrar
     usuario_id = Column(Integer, ForeignKey("usuarios.id"), nullable=False)  # nuevo
     fecha_subida = Column(DateTime, default=datetime.utcnow)
     hash_md5 = Column(String, nullable=False)
+    categoria = Column(String, nullable=True)  # copia de la del documento, para filtrar el listado
+
+
+# Historial de un documento por nombre sin distinguir mayúsculas, ya ordenado
+# por fecha (índice funcional sobre lower())
+Index(
+    "ix_historial_usuario_lower_nombre_fecha",
+    HistorialDocumento.usuario_id,
+    func.lower(HistorialDocumento.nombre_archivo),
+    HistorialDocumento.fecha_subida,
+)
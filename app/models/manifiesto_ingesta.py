@@ -0,0 +1,25 @@
+# app/models/manifiesto_ingesta.py
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, ForeignKey, UniqueConstraint, func
+from app.database import Base
+
+class ManifiestoIngesta(Base):
+    """
+    Estado de cada archivo ya ingresado desde una carpeta origen. Si tamaño,
+    mtime e inodo no cambiaron, la siguiente ingesta lo salta sin leerlo.
+    """
+    __tablename__ = "manifiesto_ingesta"
+    __table_args__ = (
+        UniqueConstraint("usuario_id", "raiz", "ruta", name="uq_manifiesto_usuario_raiz_ruta"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    usuario_id = Column(Integer, ForeignKey("usuarios.id"), nullable=False)
+    raiz = Column(String, nullable=False)   # carpeta origen (ruta absoluta)
+    ruta = Column(String, nullable=False)   # relativa a la raíz, con '/'
+    tamano_bytes = Column(BigInteger, nullable=False)
+    mtime_ns = Column(BigInteger, nullable=False)
+    inodo = Column(BigInteger, nullable=False)
+    hash_sha256 = Column(String, nullable=False)
+    version = Column(String, nullable=True)  # última versión registrada desde esta ruta
+    error = Column(String, nullable=True)    # no pasó la validación: se salta hasta que cambie
+    actualizado_en = Column(DateTime, server_default=func.now(), onupdate=func.now())
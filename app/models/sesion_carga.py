@@ -0,0 +1,21 @@
+# app/models/sesion_carga.py
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, ForeignKey, func
+from app.database import Base
+
+class SesionCarga(Base):
+    __tablename__ = "sesiones_carga"
+
+    id = Column(String(32), primary_key=True, index=True)  # uuid4 hex
+    usuario_id = Column(Integer, ForeignKey("usuarios.id"), nullable=False, index=True)
+    nombre_archivo = Column(String, nullable=False)
+    extension = Column(String, nullable=False)
+    version = Column(String, nullable=False)
+    categoria = Column(String, nullable=True)
+    content_type = Column(String, nullable=True)
+    tamano_total = Column(BigInteger, nullable=False)
+    offset_confirmado = Column(BigInteger, nullable=False, default=0)
+    # abierta | escribiendo (un PUT en curso) | finalizada | cancelada | vencida (abandonada, ver SESION_TTL_H)
+    estado = Column(String, nullable=False, default="abierta")
+    escritor = Column(String(32), nullable=True)  # token del PUT que tiene tomada la sesión
+    creado_en = Column(DateTime, server_default=func.now())
+    actualizado_en = Column(DateTime, server_default=func.now(), onupdate=func.now())
@@ -0,0 +1,27 @@
+# app/models/trabajo.py
+from sqlalchemy import Column, Integer, String, Text, JSON, DateTime, ForeignKey, Index, func
+from app.database import Base
+
+class Trabajo(Base):
+    """Trabajo en segundo plano (descargas, ingestas) procesado por app/services/trabajos.py."""
+    __tablename__ = "trabajos"
+    __table_args__ = (
+        # El worker busca el pendiente más antiguo
+        Index("ix_trabajos_estado_creado", "estado", "creado_en"),
+    )
+
+    id = Column(String(32), primary_key=True)  # uuid4 hex
+    tipo = Column(String, nullable=False)       # nombre registrado con @tarea
+    usuario_id = Column(Integer, ForeignKey("usuarios.id"), nullable=False, index=True)
+    estado = Column(String, nullable=False, default="pendiente")  # pendiente | en_curso | completado | fallido
+    parametros = Column(JSON, nullable=False)
+    resultado = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    progreso_actual = Column(Integer, nullable=False, default=0)
+    progreso_total = Column(Integer, nullable=True)
+    intentos = Column(Integer, nullable=False, default=0)
+    worker = Column(String, nullable=True)  # host:pid:hilo que lo tomó
+    creado_en = Column(DateTime, server_default=func.now())
+    iniciado_en = Column(DateTime, nullable=True)
+    terminado_en = Column(DateTime, nullable=True)
+    actualizado_en = Column(DateTime, server_default=func.now(), onupdate=func.now())  # latido del worker
@@ -0,0 +1,254 @@
+# app/services/almacenamiento.py
+import asyncio
+import functools
+import os
+import tempfile
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from decouple import config
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.models.blob import Blob
+from app.utils.delta import decodificar, DeltaInvalido
+
+# Almacenamiento direccionado por contenido: uploads/blobs/ab/cd/<hash>
+UPLOAD_DIR = Path("uploads")
+BLOBS_DIR = UPLOAD_DIR / "blobs"
+TMP_DIR = UPLOAD_DIR / "_tmp"  # staging de subidas, mismo disco que los blobs
+BLOBS_DIR.mkdir(parents=True, exist_ok=True)
+TMP_DIR.mkdir(parents=True, exist_ok=True)
+
+# Límites de admisión del pool de E/S de disco
+STORAGE_WORKERS = config("STORAGE_WORKERS", default=4, cast=int)
+STORAGE_MAX_PENDIENTES = config("STORAGE_MAX_PENDIENTES", default=64, cast=int)
+
+
+class EjecutorAlmacenamiento:
+    """
+    Pool de hilos dedicado a la E/S de disco (escrituras, mkdir, borrados,
+    detección de tipo, movimientos al almacén). Los endpoints async hacen
+    `await ejecutor_almacenamiento.ejecutar(...)`, así una escritura lenta no
+    frena el event loop ni a peticiones como /auth/login.
+    Como máximo `max_pendientes` operaciones por event loop esperan o
+    corren a la vez; el resto espera su turno sin ocupar hilos. Cada loop
+    tiene su semáforo: el código sync que descarga con asyncio.run (trabajos,
+    /desde-url) usa el mismo pool que el loop de uvicorn.
+    """
+
+    def __init__(self, workers: int, max_pendientes: int):
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="almacenamiento")
+        self._max_pendientes = max_pendientes
+        self._semaforos = weakref.WeakKeyDictionary()
+
+    async def ejecutar(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        semaforo = self._semaforos.get(loop)
+        if semaforo is None:
+            semaforo = self._semaforos[loop] = asyncio.Semaphore(self._max_pendientes)
+        async with semaforo:
+            return await loop.run_in_executor(self._pool, functools.partial(fn, *args, **kwargs))
+
+    def cerrar(self):
+        self._pool.shutdown(wait=True)
+
+
+ejecutor_almacenamiento = EjecutorAlmacenamiento(STORAGE_WORKERS, STORAGE_MAX_PENDIENTES)
+
+
+def borrar(ruta: Path):
+    Path(ruta).unlink(missing_ok=True)
+
+
+def ruta_blob(hash_archivo: str) -> Path:
+    """Directorios fragmentados por los primeros caracteres del hash."""
+    return BLOBS_DIR / hash_archivo[:2] / hash_archivo[2:4] / hash_archivo
+
+
+def ruta_delta(blob: Blob) -> Path:
+    """Archivo de un blob guardado como delta de su base (ver app/services/deltas.py)."""
+    return Path(f"{blob.ruta}.delta")
+
+
+# ===============================
+# ARCHIVOS QUE SE MUEVEN AL CONFIRMAR
+# ===============================
+def al_confirmar(db, fn, *args):
+    """
+    Ejecuta `fn(*args)` después del próximo commit de `db`; si la
+    transacción se revierte no se ejecuta. Así un rollback no deja en el
+    almacén archivos que ninguna fila referencia.
+    """
+    db.info.setdefault("al_confirmar", []).append((fn, args))
+
+
+@event.listens_for(Session, "after_commit")
+def _ejecutar_al_confirmar(db):
+    if db.in_nested_transaction():
+        return  # se liberó un savepoint: la transacción sigue abierta
+    for fn, args in db.info.pop("al_confirmar", []):
+        try:
+            fn(*args)
+        except OSError as e:
+            print(f"⚠️ No se pudo completar {fn.__name__}{args}: {e}")
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _descartar_al_confirmar(db, transaccion):
+    if transaccion.parent is None:  # un savepoint revertido no anula la transacción
+        db.info.pop("al_confirmar", None)
+
+
+def _mover(ruta_origen: Path, destino: Path):
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    os.replace(ruta_origen, destino)
+
+
+def guardar_blob(db, ruta_origen: Path, hash_archivo: str, tamano_bytes: int) -> Blob:
+    """
+    Suma una referencia al blob y, al hacer commit, mueve `ruta_origen` al
+    almacén (o la descarta si el contenido ya estaba). No hace commit: la
+    referencia se confirma junto con la fila del documento. Si la
+    transacción se revierte, `ruta_origen` sigue en staging y la borra el
+    llamador.
+    """
+    return guardar_blobs(db, [(ruta_origen, hash_archivo, tamano_bytes)])[hash_archivo]
+
+
+def guardar_blobs(db, archivos: list[tuple[Path, str, int]]) -> dict[str, Blob]:
+    """
+    guardar_blob para un lote de (ruta_origen, hash, tamano_bytes): una
+    consulta para los blobs que ya existen, un INSERT para los nuevos y un
+    UPDATE de referencias por contenido. Si el mismo contenido viene más de
+    una vez, cada copia suma una referencia y solo la primera se mueve.
+    Retorna los blobs por hash.
+    """
+    tamanos = {h: t for _, h, t in archivos}
+    blobs = {}
+    while True:
+        blobs.update((b.hash, b) for b in db.query(Blob).filter(Blob.hash.in_(list(tamanos.keys() - blobs.keys()))))
+        faltan = [Blob(hash=h, ruta=str(ruta_blob(h)), tamano_bytes=t, referencias=0)
+                  for h, t in tamanos.items() if h not in blobs]
+        if not faltan:
+            break
+        try:
+            with db.begin_nested():
+                db.add_all(faltan)
+            blobs.update((b.hash, b) for b in faltan)
+            break
+        except IntegrityError:
+            continue  # otra subida concurrente creó alguno de los mismos blobs: se vuelven a leer
+
+    referencias = {}
+    en_camino = set()      # contenidos que este lote mueve al almacén
+    bases_anteriores = []  # bases de deltas que vuelven a quedar completos
+    for ruta_origen, hash_archivo, _ in archivos:
+        blob = blobs[hash_archivo]
+        referencias[hash_archivo] = referencias.get(hash_archivo, 0) + 1
+        if hash_archivo in en_camino or Path(blob.ruta).exists():
+            al_confirmar(db, borrar, ruta_origen)
+            continue
+        en_camino.add(hash_archivo)
+        al_confirmar(db, _mover, Path(ruta_origen), Path(blob.ruta))
+        if blob.base_hash:
+            # Estaba guardado como delta y volvió a subirse: queda completo otra vez
+            bases_anteriores.append(blob.base_hash)
+            al_confirmar(db, borrar, ruta_delta(blob))
+
+    for hash_archivo, n in referencias.items():
+        cambios = {Blob.referencias: Blob.referencias + n}
+        if blobs[hash_archivo].base_hash and hash_archivo in en_camino:
+            cambios.update({Blob.base_hash: None, Blob.tamano_almacenado: None})
+        db.query(Blob).filter(Blob.hash == hash_archivo).update(cambios, synchronize_session=False)
+    for base_hash in bases_anteriores:
+        # La base puede haber quedado sin referencias ni deltas que dependan de ella
+        base = db.query(Blob).filter(Blob.hash == base_hash).with_for_update().first()
+        for ruta in _eliminar_sin_uso(db, base):
+            al_confirmar(db, borrar, ruta)
+    return {b.hash: b for b in db.query(Blob).filter(Blob.hash.in_(list(blobs))).populate_existing()}
+
+
+def referenciar_blob(db, hash_archivo: str) -> Blob:
+    """
+    Suma una referencia a un blob que ya está en el almacén (sin archivo de
+    origen). Lanza LookupError si el blob fue eliminado. No hace commit.
+    """
+    actualizadas = db.query(Blob).filter(Blob.hash == hash_archivo).update(
+        {Blob.referencias: Blob.referencias + 1}, synchronize_session=False
+    )
+    if not actualizadas:
+        raise LookupError(f"El blob {hash_archivo} ya no existe en el almacén")
+    return db.query(Blob).filter(Blob.hash == hash_archivo).one()
+
+
+def liberar_blob(db, ruta_guardado: str) -> list[Path]:
+    """
+    Resta una referencia al blob de `ruta_guardado`. Cuando nadie lo usa
+    elimina la fila y retorna las rutas de los archivos para borrarlos
+    después del commit. Un blob que es base de deltas se conserva aunque no
+    tenga referencias; al borrar un delta se revisa si su base quedó libre.
+    No hace commit.
+    """
+    blob = db.query(Blob).filter(Blob.ruta == str(ruta_guardado)).with_for_update().first()
+    if blob is None:
+        return []  # archivo guardado antes del almacén por contenido
+
+    blob.referencias -= 1
+    return _eliminar_sin_uso(db, blob)
+
+
+def _eliminar_sin_uso(db, blob: Blob | None) -> list[Path]:
+    """
+    Elimina `blob` si no tiene referencias ni deltas que dependan de él, y
+    sigue por su base. Retorna las rutas de los archivos para borrarlos
+    después del commit.
+    """
+    rutas = []
+    while blob is not None and blob.referencias <= 0 and not tiene_dependientes(db, blob.hash):
+        db.delete(blob)
+        db.flush()  # la sesión no hace autoflush: la base no debe verlo como dependiente
+        rutas += [Path(blob.ruta), ruta_delta(blob)]
+        if not blob.base_hash:
+            break
+        blob = db.query(Blob).filter(Blob.hash == blob.base_hash).with_for_update().first()
+    return rutas
+
+
+def tiene_dependientes(db, hash_archivo: str) -> bool:
+    """True si algún blob está guardado como delta de este."""
+    return db.query(Blob.hash).filter(Blob.base_hash == hash_archivo).first() is not None
+
+
+def reconstruir_blob(db, blob: Blob, destino: Path):
+    """
+    Escribe en `destino` el contenido completo de un blob guardado como
+    delta, aplicando los deltas desde la versión completa más cercana.
+    Verifica el SHA-256 del resultado. Lanza DeltaInvalido.
+    """
+    base = db.query(Blob).filter(Blob.hash == blob.base_hash).first() if blob.base_hash else None
+    if base is None:
+        raise DeltaInvalido(f"El blob {blob.hash} no tiene archivo ni base para reconstruirlo")
+    with contenido_blob(db, base) as ruta_base:
+        hashes = decodificar(ruta_base, ruta_delta(blob), destino)
+    if hashes.sha256 != blob.hash:
+        raise DeltaInvalido(f"El blob {blob.hash} reconstruido no coincide con su hash")
+
+
+@contextmanager
+def contenido_blob(db, blob: Blob):
+    """
+    Ruta con el contenido completo del blob: su archivo si está completo o
+    una reconstrucción temporal en el staging (se borra al salir).
+    """
+    if Path(blob.ruta).exists():
+        yield Path(blob.ruta)
+        return
+    fd, tmp = tempfile.mkstemp(dir=TMP_DIR, suffix=".reconstruido")
+    os.close(fd)
+    try:
+        reconstruir_blob(db, blob, Path(tmp))
+        yield Path(tmp)
+    finally:
+        borrar(tmp)
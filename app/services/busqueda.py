@@ -0,0 +1,145 @@
+# app/services/busqueda.py
+# Búsqueda de documentos por nombre sobre documentos_vigentes (una fila por
+# documento), sin distinguir mayúsculas. Los resultados van por nivel de
+# coincidencia: exacta, prefijo, contiene y (solo PostgreSQL) similar.
+#   - exacta/prefijo: rangos del índice ix_vigentes_usuario_lower_nombre(_c);
+#     las exactas se consultan aparte ("acta 01.pdf" va antes que "acta.pdf"
+#     en el rango del prefijo y con el límite podría quedar afuera)
+#   - contiene: índice de trigramas pg_trgm o tabla FTS5 en SQLite
+#   - similar: operador % de pg_trgm (nombres con errores de tipeo)
+# Sin esos índices (o con menos de 3 letras) "contiene" usa LIKE.
+# El texto buscado se pasa a minúsculas con lower() de la base, igual que
+# el nombre: en SQLite lower() solo cambia ASCII y lo de Python no coincidiría.
+from sqlalchemy import and_, func, literal, or_, text
+from app.models.documento_vigente import DocumentoVigente
+
+BUSQUEDA_POR_DEFECTO = 20
+BUSQUEDA_MAXIMA = 100
+MIN_TRIGRAMA = 3  # los índices de trigramas no sirven para textos más cortos
+MAYOR_CARACTER = "\U0010ffff"  # cota superior del rango de un prefijo (orden por código)
+_motores = {}
+
+
+def motor_busqueda(db) -> str:
+    """
+    'trigramas' (pg_trgm), 'fts5' (SQLite) o 'like', según lo que haya creado
+    actualizar_esquema. Solo se recuerda un índice encontrado: 'like' se
+    vuelve a consultar por si el índice se crea después.
+    """
+    bind = db.get_bind()
+    if bind.url in _motores:
+        return _motores[bind.url]
+    motor = "like"
+    if bind.dialect.name == "postgresql":
+        if db.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).first():
+            motor = "trigramas"
+    elif bind.dialect.name == "sqlite":
+        if db.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'vigentes_fts'")).first():
+            motor = "fts5"
+    if motor != "like":
+        _motores[bind.url] = motor
+    return motor
+
+
+def _nombre(db):
+    """lower(nombre_archivo) con la intercalación del índice (ver app/models/documento_vigente.py)."""
+    nombre = func.lower(DocumentoVigente.nombre_archivo)
+    return nombre.collate("C") if db.get_bind().dialect.name == "postgresql" else nombre
+
+
+def _escapar_like(q: str):
+    """`q` en minúsculas de la base, con % y _ escapados (se usan con escape='/')."""
+    return func.lower(q.replace("/", "//").replace("%", "/%").replace("_", "/_"))
+
+
+def _patron_contiene(q: str):
+    """'%q%' para LIKE."""
+    return literal("%") + _escapar_like(q) + literal("%")
+
+
+def _base(db, usuario_id: int):
+    return db.query(DocumentoVigente).filter(DocumentoVigente.usuario_id == usuario_id)
+
+
+def consulta_exactas(db, usuario_id: int, q: str, limite: int):
+    """
+    Nombres que son `q`, con o sin una extensión ("informe" encuentra
+    "Informe.pdf" pero no "informe.v2.pdf"): la igualdad y el rango de `q.`
+    del mismo índice que el prefijo.
+    """
+    nombre = _nombre(db)
+    texto = func.lower(q)
+    con_punto = texto + literal(".")
+    return _base(db, usuario_id).filter(or_(
+        nombre == texto,
+        and_(
+            nombre >= con_punto, nombre < con_punto + literal(MAYOR_CARACTER),
+            ~nombre.like(_escapar_like(q) + literal(".%.%"), escape="/")
+        )
+    )).order_by(nombre).limit(limite)
+
+
+def consulta_prefijo(db, usuario_id: int, q: str, limite: int):
+    """Nombres que empiezan con `q` (sin distinguir mayúsculas): un rango del índice."""
+    nombre = _nombre(db)
+    prefijo = func.lower(q)
+    return _base(db, usuario_id).filter(
+        nombre >= prefijo, nombre < prefijo + literal(MAYOR_CARACTER)
+    ).order_by(nombre).limit(limite)
+
+
+def _contiene(db, usuario_id: int, q: str, limite: int, excluir: set, motor: str) -> list:
+    nombre = func.lower(DocumentoVigente.nombre_archivo)
+    query = _base(db, usuario_id)
+    if excluir:
+        query = query.filter(DocumentoVigente.id.notin_(excluir))
+    if motor == "fts5" and len(q) >= MIN_TRIGRAMA:
+        coincidencias = text(
+            "SELECT rowid FROM vigentes_fts WHERE vigentes_fts MATCH :frase AND usuario_id = :usuario"
+        ).bindparams(frase='"' + q.replace('"', '""') + '"', usuario=usuario_id)
+        query = query.filter(DocumentoVigente.id.in_(coincidencias))
+    else:
+        # En PostgreSQL el índice gin_trgm_ops resuelve este LIKE
+        query = query.filter(nombre.like(_patron_contiene(q), escape="/"))
+    texto = func.lower(q)
+    if motor == "trigramas":
+        return query.order_by(func.similarity(nombre, texto).desc(), nombre).limit(limite).all()
+    # Más arriba cuanto antes aparece el texto y más corto es el nombre
+    posicion = func.strpos(nombre, texto) if db.get_bind().dialect.name == "postgresql" else func.instr(nombre, texto)
+    return query.order_by(posicion, func.length(nombre), nombre).limit(limite).all()
+
+
+def _similares(db, usuario_id: int, q: str, limite: int, excluir: set) -> list:
+    nombre = func.lower(DocumentoVigente.nombre_archivo)
+    texto = func.lower(q)
+    query = _base(db, usuario_id).filter(nombre.op("%")(texto))
+    if excluir:
+        query = query.filter(DocumentoVigente.id.notin_(excluir))
+    return query.order_by(nombre.op("<->")(texto), nombre).limit(limite).all()
+
+
+def buscar_documentos(db, usuario_id: int, q: str, limite: int = BUSQUEDA_POR_DEFECTO) -> list[tuple]:
+    """
+    Hasta `limite` documentos del usuario cuyo nombre coincide con `q`, como
+    (nivel, DocumentoVigente) en orden de relevancia. Cada nivel se consulta
+    solo si los anteriores no llenaron el límite.
+    """
+    q = q.strip()
+    if not q:
+        return []
+    motor = motor_busqueda(db)
+    resultados = [("exacta", v) for v in consulta_exactas(db, usuario_id, q, limite)]
+    vistos = {v.id for _, v in resultados}
+    if len(resultados) < limite:
+        # Las exactas también están en el rango del prefijo: con `limite` filas alcanza
+        for v in consulta_prefijo(db, usuario_id, q, limite):
+            if v.id not in vistos and len(resultados) < limite:
+                resultados.append(("prefijo", v))
+                vistos.add(v.id)
+    if len(resultados) < limite:
+        for v in _contiene(db, usuario_id, q, limite - len(resultados), vistos, motor):
+            resultados.append(("contiene", v))
+            vistos.add(v.id)
+    if len(resultados) < limite and motor == "trigramas":
+        resultados += [("similar", v) for v in _similares(db, usuario_id, q, limite - len(resultados), vistos)]
+    return resultados
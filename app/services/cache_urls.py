@@ -0,0 +1,120 @@
+# app/services/cache_urls.py
+# Caché de descargas externas por URL normalizada. Guarda ETag y
+# Last-Modified de la última descarga junto con el blob donde quedó el
+# contenido; al volver a pedir la URL se envían If-None-Match /
+# If-Modified-Since y un 304 reutiliza el blob sin descargar nada.
+import threading
+from sqlalchemy.exc import IntegrityError
+from app.models.blob import Blob
+from app.models.cache_url import CacheURL
+
+
+class EstadisticasCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.aciertos = 0          # 304: se reutilizó el blob
+        self.fallos = 0            # descarga completa (sin entrada o contenido cambiado)
+        self.revalidaciones = 0    # peticiones enviadas con validadores
+        self.bytes_ahorrados = 0
+        self.bytes_descargados = 0
+
+    def registrar(self, acierto: bool, tamano_bytes: int, condicional: bool):
+        with self._lock:
+            if condicional:
+                self.revalidaciones += 1
+            if acierto:
+                self.aciertos += 1
+                self.bytes_ahorrados += tamano_bytes
+            else:
+                self.fallos += 1
+                self.bytes_descargados += tamano_bytes
+
+    def resumen(self):
+        total = self.aciertos + self.fallos
+        return {
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "revalidaciones": self.revalidaciones,
+            "tasa_aciertos": self.aciertos / total if total else 0.0,
+            "bytes_ahorrados": self.bytes_ahorrados,
+            "bytes_descargados": self.bytes_descargados,
+        }
+
+
+estadisticas_cache = EstadisticasCache()
+
+
+def _como_dict(entrada: CacheURL) -> dict:
+    # Copia plana: se usa fuera de la sesión (hilos del event loop)
+    return {
+        "url": entrada.url,
+        "etag": entrada.etag,
+        "last_modified": entrada.last_modified,
+        "hash_sha256": entrada.hash_sha256,
+        "hash_md5": entrada.hash_md5,
+        "tamano_bytes": entrada.tamano_bytes,
+        "nombre_archivo": entrada.nombre_archivo,
+        "extension": entrada.extension,
+        "content_type": entrada.content_type,
+        "servidor": entrada.servidor,
+    }
+
+
+def buscar_entradas(db, urls: list[str]) -> dict[str, dict]:
+    """
+    Entradas de caché de las URLs normalizadas dadas, solo si el blob
+    todavía existe (si se liberó hay que descargar de nuevo).
+    """
+    if not urls:
+        return {}
+    filas = db.query(CacheURL).join(Blob, Blob.hash == CacheURL.hash_sha256).filter(
+        CacheURL.url.in_(set(urls)),
+        CacheURL.etag.isnot(None) | CacheURL.last_modified.isnot(None)
+    ).all()
+    return {f.url: _como_dict(f) for f in filas}
+
+
+def buscar_entrada(db, url: str) -> dict | None:
+    return buscar_entradas(db, [url]).get(url)
+
+
+def cabeceras_condicionales(entrada: dict | None) -> dict:
+    if not entrada:
+        return {}
+    cabeceras = {}
+    if entrada.get("etag"):
+        cabeceras["If-None-Match"] = entrada["etag"]
+    if entrada.get("last_modified"):
+        cabeceras["If-Modified-Since"] = entrada["last_modified"]
+    return cabeceras
+
+
+def guardar_entrada(db, metadata: dict):
+    """
+    Crea o actualiza la entrada de la URL descargada. No hace commit:
+    se confirma junto con el documento que referencia el blob.
+    """
+    url = metadata.get("url_normalizada")
+    if not url or not (metadata.get("etag") or metadata.get("last_modified")):
+        return  # el servidor no da validadores: no hay forma de revalidar
+    entrada = db.get(CacheURL, url)
+    if entrada is None:
+        try:
+            with db.begin_nested():
+                entrada = CacheURL(url=url, aciertos=0, hash_sha256=metadata["hash_sha256"],
+                                   tamano_bytes=0, nombre_archivo="", extension="")
+                db.add(entrada)
+        except IntegrityError:
+            # Otra descarga concurrente de la misma URL creó la entrada
+            entrada = db.get(CacheURL, url)
+    if metadata.get("desde_cache"):
+        entrada.aciertos = (entrada.aciertos or 0) + 1
+    entrada.etag = metadata.get("etag")
+    entrada.last_modified = metadata.get("last_modified")
+    entrada.hash_sha256 = metadata["hash_sha256"]
+    entrada.hash_md5 = metadata.get("hash_md5")
+    entrada.tamano_bytes = int(metadata.get("tamano_bytes", 0))
+    entrada.nombre_archivo = metadata.get("nombre_archivo", "sin_nombre")
+    entrada.extension = metadata.get("extension", "")
+    entrada.content_type = metadata.get("content_type")
+    entrada.servidor = metadata.get("servidor")
@@ -0,0 +1,243 @@
+# app/services/deltas.py
+# Almacenamiento de versiones como deltas (ALMACEN_DELTAS). La versión
+# vigente de cada documento queda completa; cuando llega una versión más
+# alta, la anterior se reescribe como delta binario contra ella (su
+# sucesora), así una planilla de 50 MB con unas celdas cambiadas ocupa
+# unos KB por versión. La conversión corre como trabajo en segundo plano
+# encolado en la misma transacción del registro; si el delta no es más
+# chico, el blob queda completo. Las lecturas reconstruyen el contenido
+# (almacenamiento.contenido_blob).
+#
+# Para convertir el historial ya cargado y ver el espacio ahorrado:
+#
+#   python -m app.services.deltas [--usuario ID] [--solo-reporte]
+import argparse
+import os
+from pathlib import Path
+from decouple import config
+from sqlalchemy import func, text
+from app.models.blob import Blob
+from app.models.documento import Documento
+from app.models.documento_vigente import DocumentoVigente
+from app.services.almacenamiento import contenido_blob, ruta_delta, borrar
+from app.services.trabajos import tarea, encolar
+from app.utils.delta import codificar
+from app.utils.versiones import clave_de_version
+
+ALMACEN_DELTAS = config("ALMACEN_DELTAS", default=False, cast=bool)
+# Deltas a aplicar como máximo para leer una versión; al llegar al tope la versión queda completa
+ALMACEN_DELTA_MAX_CADENA = config("ALMACEN_DELTA_MAX_CADENA", default=16, cast=int)
+# Versiones más grandes se guardan siempre completas (el índice de bloques crece con el tamaño)
+ALMACEN_DELTA_MAX_MB = config("ALMACEN_DELTA_MAX_MB", default=256, cast=int)
+LOTE_DOCUMENTOS = 500
+
+
+# ===============================
+# REGISTRO: ENCOLAR LA CONVERSIÓN
+# ===============================
+def vigente_anterior(db, usuario_id: int, nombre_archivo: str):
+    """Versión vigente del documento antes de registrar una nueva (None si no hay)."""
+    return db.query(
+        DocumentoVigente.clave_version, DocumentoVigente.historial_id, Documento.hash_sha256
+    ).join(Documento, Documento.id == DocumentoVigente.documento_id).filter(
+        DocumentoVigente.usuario_id == usuario_id,
+        DocumentoVigente.nombre_archivo == nombre_archivo
+    ).first()
+
+
+def encolar_si_reemplaza(db, anterior, historial, hash_nuevo: str):
+    """
+    Si la versión recién registrada pasa a ser la vigente, encola la
+    conversión de la anterior en delta. Sin commit: el trabajo solo existe
+    si el registro se confirma.
+    """
+    if anterior is None or anterior.hash_sha256 in (None, hash_nuevo):
+        return
+    if (anterior.clave_version or "", anterior.historial_id) >= (clave_de_version(historial.version), historial.id):
+        return  # se subió una versión más baja: la vigente no cambia
+    encolar(db, "delta_version", historial.usuario_id,
+            {"hash_anterior": anterior.hash_sha256, "hash_base": hash_nuevo}, commit=False)
+
+
+# ===============================
+# CONVERSIÓN
+# ===============================
+def _bases(db, blob: Blob) -> list[str]:
+    """Hashes de la cadena de bases de `blob`, hasta el primero completo."""
+    cadena = []
+    while blob is not None and blob.base_hash:
+        cadena.append(blob.base_hash)
+        blob = db.query(Blob).filter(Blob.hash == blob.base_hash).first()
+    return cadena
+
+
+def _profundidad_dependientes(db, hash_archivo: str) -> int:
+    """Largo de la cadena más larga de deltas que dependen de este blob."""
+    return db.execute(text(
+        "WITH RECURSIVE dependientes(hash, nivel) AS ("
+        " SELECT hash, 1 FROM blobs WHERE base_hash = :hash"
+        " UNION ALL"
+        " SELECT b.hash, d.nivel + 1 FROM blobs b JOIN dependientes d ON b.base_hash = d.hash"
+        ") SELECT max(nivel) FROM dependientes"
+    ), {"hash": hash_archivo}).scalar() or 0
+
+
+def _motivo_para_no_convertir(db, anterior: Blob | None, base: Blob | None) -> str | None:
+    if anterior is None or base is None:
+        return "blob_inexistente"
+    if anterior.hash == base.hash:
+        return "mismo_contenido"
+    if anterior.base_hash:
+        return "ya_es_delta"
+    if not Path(anterior.ruta).exists():
+        return "sin_archivo"
+    if anterior.tamano_bytes > ALMACEN_DELTA_MAX_MB * 1024 * 1024:
+        return "demasiado_grande"
+    cadena = [base.hash] + _bases(db, base)
+    if anterior.hash in cadena:
+        return "ciclo"  # la base ya se reconstruye a partir de este blob
+    if len(cadena) + _profundidad_dependientes(db, anterior.hash) > ALMACEN_DELTA_MAX_CADENA:
+        return "cadena_larga"
+    return None
+
+
+def comprimir_como_delta(db, hash_anterior: str, hash_base: str) -> dict:
+    """
+    Reescribe el blob `hash_anterior` como delta contra `hash_base` y hace
+    commit. El delta se escribe y se confirma antes de borrar el archivo
+    completo: un corte en el medio deja ambos, nunca ninguno. Retorna el
+    estado ("delta" o "completo" con el motivo) y los bytes ahorrados.
+    """
+    # Bloqueados: liberar_blob no puede borrar la base mientras se la usa
+    anterior = db.query(Blob).filter(Blob.hash == hash_anterior).with_for_update().first()
+    base = db.query(Blob).filter(Blob.hash == hash_base).with_for_update().first()
+    motivo = _motivo_para_no_convertir(db, anterior, base)
+    if motivo:
+        db.rollback()
+        return {"hash": hash_anterior, "estado": "completo", "motivo": motivo, "bytes_ahorrados": 0}
+
+    ruta_completa = Path(anterior.ruta)
+    destino = ruta_delta(anterior)
+    tmp = destino.with_name(destino.name + ".tmp")
+    try:
+        with contenido_blob(db, base) as ruta_base:
+            tamano = codificar(ruta_base, ruta_completa, tmp)
+        if tamano is None:
+            db.rollback()
+            return {"hash": hash_anterior, "estado": "completo", "motivo": "delta_no_conviene", "bytes_ahorrados": 0}
+        os.replace(tmp, destino)
+    finally:
+        borrar(tmp)
+
+    anterior.base_hash = base.hash
+    anterior.tamano_almacenado = tamano
+    ahorrados = anterior.tamano_bytes - tamano
+    db.commit()
+    ruta_completa.unlink(missing_ok=True)
+    return {"hash": hash_anterior, "estado": "delta", "bytes_ahorrados": ahorrados}
+
+
+@tarea("delta_version")
+def tarea_delta_version(db, trabajo, hash_anterior: str, hash_base: str):
+    return comprimir_como_delta(db, hash_anterior, hash_base)
+
+
+def compactar(db, usuario_id: int | None = None) -> dict:
+    """
+    Convierte en deltas el historial ya cargado: en cada documento con
+    más de una versión, cada versión contra la siguiente (de la más alta a
+    la más baja). Recorre documentos_vigentes por lotes.
+    """
+    resumen = {"documentos": 0, "deltas": 0, "completos": 0, "bytes_ahorrados": 0}
+    ultimo_id = 0
+    while True:
+        query = db.query(DocumentoVigente.id, DocumentoVigente.usuario_id, DocumentoVigente.nombre_archivo).filter(
+            DocumentoVigente.total_versiones > 1, DocumentoVigente.id > ultimo_id
+        )
+        if usuario_id is not None:
+            query = query.filter(DocumentoVigente.usuario_id == usuario_id)
+        documentos = query.order_by(DocumentoVigente.id).limit(LOTE_DOCUMENTOS).all()
+        if not documentos:
+            return resumen
+        for _, uid, nombre in documentos:
+            hashes = [h for (h,) in db.query(Documento.hash_sha256).filter(
+                Documento.usuario_id == uid, Documento.nombre_archivo == nombre
+            ).order_by(Documento.clave_version.desc(), Documento.id.desc())]
+            for sucesor, version in zip(hashes, hashes[1:]):
+                if version == sucesor:
+                    continue
+                r = comprimir_como_delta(db, version, sucesor)
+                resumen["deltas" if r["estado"] == "delta" else "completos"] += 1
+                resumen["bytes_ahorrados"] += r["bytes_ahorrados"]
+            resumen["documentos"] += 1
+        ultimo_id = documentos[-1][0]
+
+
+# ===============================
+# REPORTE DE ESPACIO
+# ===============================
+def espacio_por_documento(db, usuario_id: int, nombre_archivo: str | None = None,
+                          prefijo: str | None = None) -> dict:
+    """Por documento: versiones, bytes originales, bytes en disco y ahorro."""
+    almacenados = func.coalesce(Blob.tamano_almacenado, Blob.tamano_bytes)
+    query = db.query(
+        Documento.nombre_archivo,
+        func.count().label("versiones"),
+        func.sum(Blob.tamano_bytes).label("originales"),
+        func.sum(almacenados).label("almacenados"),
+    ).join(Blob, Blob.ruta == Documento.ruta_guardado).filter(Documento.usuario_id == usuario_id)
+    if nombre_archivo:
+        query = query.filter(Documento.nombre_archivo == nombre_archivo)
+    if prefijo:
+        query = query.filter(Documento.nombre_archivo.startswith(prefijo, autoescape=True))
+    documentos = [
+        _fila_espacio({"nombre": f.nombre_archivo, "versiones": f.versiones}, f.originales or 0, f.almacenados or 0)
+        for f in query.group_by(Documento.nombre_archivo).order_by(Documento.nombre_archivo)
+    ]
+    total = _fila_espacio(
+        {"versiones": sum(d["versiones"] for d in documentos)},
+        sum(d["bytes_originales"] for d in documentos), sum(d["bytes_almacenados"] for d in documentos)
+    )
+    return {"documentos": documentos, "total": total}
+
+
+def _fila_espacio(fila: dict, originales: int, almacenados: int) -> dict:
+    fila.update(
+        bytes_originales=originales,
+        bytes_almacenados=almacenados,
+        bytes_ahorrados=originales - almacenados,
+        ahorro_pct=round(100 * (originales - almacenados) / originales, 1) if originales else 0.0,
+    )
+    return fila
+
+
+def main():
+    from app.database import engine, Base, SessionLocal
+    from app.core.esquema import actualizar_esquema
+    import app.models  # noqa: F401
+
+    parser = argparse.ArgumentParser(description="Convierte las versiones anteriores en deltas y reporta el espacio")
+    parser.add_argument("--usuario", type=int, help="solo los documentos de este usuario")
+    parser.add_argument("--solo-reporte", action="store_true", help="no convertir, solo mostrar el espacio")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    actualizar_esquema(engine)
+    db = SessionLocal()
+    try:
+        if not args.solo_reporte:
+            resumen = compactar(db, args.usuario)
+            print(f"✅ {resumen['documentos']:,} documentos: {resumen['deltas']:,} versiones como delta, "
+                  f"{resumen['completos']:,} completas, {resumen['bytes_ahorrados'] / 1024 / 1024:,.1f} MB ahorrados")
+        usuarios = [args.usuario] if args.usuario else [u for (u,) in db.query(Documento.usuario_id).distinct()]
+        for uid in usuarios:
+            total = espacio_por_documento(db, uid)["total"]
+            print(f"Usuario {uid}: {total['versiones']:,} versiones, "
+                  f"{total['bytes_originales'] / 1024 / 1024:,.1f} MB -> {total['bytes_almacenados'] / 1024 / 1024:,.1f} MB "
+                  f"({total['ahorro_pct']}% ahorrado)")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
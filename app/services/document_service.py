@@ -1,6 +1,350 @@
+import base64
+import binascii
+import json
 from pathlib import Path
+from datetime import datetime
+from sqlalchemy import func, tuple_, JSON
+from sqlalchemy.dialects.postgresql import aggregate_order_by
 from app.core.config import UPLOAD_DIR
+from app.models.documento import Documento
+from app.models.historial_documento import HistorialDocumento
+from app.models.documento_vigente import DocumentoVigente
+from app.services.almacenamiento import guardar_blobs
+from app.services.validacion import ArchivoInvalido, servicio_validacion
+from app.services.filtro_duplicados import filtro_duplicados
+from app.services.vigentes import actualizar_vigente
+from app.services import deltas
+
 
 def listar_documentos():
     """Lista todos los documentos subidos."""
     return [f.name for f in UPLOAD_DIR.iterdir() if f.is_file()]
+
+
+def validar_archivo(file_path: Path, extension: str):
+    """
+    Validaciones específicas según la extensión, en el pool de validación.
+    Lanza ArchivoInvalido con el mensaje que se muestra al usuario.
+    Para handlers async usar `await servicio_validacion.validar(...)`.
+    """
+    servicio_validacion.validar_sync(file_path, extension)
+
+
+def versiones_existentes(db, usuario_id: int, pares: list) -> set:
+    """
+    Pares (sha256, version) ya registrados por el usuario, en una sola consulta.
+    Los pares que el pre-filtro descarta no se consultan.
+    """
+    candidatos = [
+        (h, v) for h, v in pares
+        if filtro_duplicados.quizas_existe(db, usuario_id, h, v)
+    ]
+    if not candidatos:
+        return set()
+    filas = db.query(Documento.hash_sha256, Documento.version).filter(
+        Documento.usuario_id == usuario_id,
+        Documento.hash_sha256.in_({h for h, _ in candidatos})
+    ).all()
+    existentes = {(h, v) for h, v in filas}
+    for par in candidatos:
+        filtro_duplicados.registrar_resultado(par in existentes)
+    return existentes
+
+
+# -----------------------------
+# Consultas de los endpoints (cubiertas por índices, ver app/test/test_documentos.py)
+# -----------------------------
+def consulta_duplicado(db, usuario_id: int, hash_sha256: str, version: str):
+    return db.query(Documento).filter(
+        Documento.usuario_id == usuario_id,
+        Documento.hash_sha256 == hash_sha256,
+        Documento.version == version
+    )
+
+
+def consulta_historial(db, usuario_id: int, nombre_archivo: str, despues_de: list | None = None):
+    """
+    Versiones de un documento por nombre (sin distinguir mayúsculas), por
+    fecha. `despues_de` es el [fecha_subida, id] de la última fila vista.
+    Las dos partes se pasan a minúsculas en la base: el lower() de Python y
+    el de SQLite no coinciden fuera de ASCII ('INFORMACIÓN.pdf').
+    """
+    query = db.query(HistorialDocumento).filter(
+        HistorialDocumento.usuario_id == usuario_id,
+        func.lower(HistorialDocumento.nombre_archivo) == func.lower(nombre_archivo)
+    )
+    if despues_de:
+        fecha, id_ = despues_de
+        query = query.filter(
+            tuple_(HistorialDocumento.fecha_subida, HistorialDocumento.id) > tuple_(datetime.fromisoformat(fecha), id_)
+        )
+    return query.order_by(HistorialDocumento.fecha_subida, HistorialDocumento.id)
+
+
+def consulta_versiones(db, usuario_id: int, despues_de: list | None = None, prefijo: str | None = None,
+                       desde: datetime | None = None, hasta: datetime | None = None,
+                       categoria: str | None = None):
+    """
+    Filas del historial del usuario en orden de (nombre_archivo,
+    clave_version, id), que es el orden del índice: cada documento con sus
+    versiones de menor a mayor y cada página un rango del índice a partir de
+    `despues_de` ([nombre_archivo, clave_version, id] de la última fila
+    vista). El prefijo también acota el inicio del rango; fechas y categoría
+    filtran dentro de él.
+    """
+    query = db.query(HistorialDocumento).filter(HistorialDocumento.usuario_id == usuario_id)
+    if despues_de:
+        query = query.filter(
+            tuple_(HistorialDocumento.nombre_archivo, HistorialDocumento.clave_version, HistorialDocumento.id)
+            > tuple_(*despues_de)
+        )
+    if prefijo:
+        query = query.filter(
+            HistorialDocumento.nombre_archivo >= prefijo,
+            HistorialDocumento.nombre_archivo.startswith(prefijo, autoescape=True)
+        )
+    if desde:
+        query = query.filter(HistorialDocumento.fecha_subida >= desde)
+    if hasta:
+        query = query.filter(HistorialDocumento.fecha_subida < hasta)
+    if categoria:
+        query = query.filter(HistorialDocumento.categoria == categoria)
+    return query.order_by(HistorialDocumento.nombre_archivo, HistorialDocumento.clave_version, HistorialDocumento.id)
+
+
+def consulta_ultima_version(db, usuario_id: int, nombre_archivo: str):
+    """
+    Fila del historial con la versión más alta de un documento ("10.0" va
+    después de "9.0"): el primer elemento del índice recorrido al revés.
+    """
+    return db.query(HistorialDocumento).filter(
+        HistorialDocumento.usuario_id == usuario_id,
+        HistorialDocumento.nombre_archivo == nombre_archivo
+    ).order_by(HistorialDocumento.clave_version.desc(), HistorialDocumento.id.desc()).first()
+
+
+# -----------------------------
+# Paginación por cursor (keyset)
+# -----------------------------
+PAGINA_POR_DEFECTO = 100
+PAGINA_MAXIMA = 1000
+
+
+def codificar_cursor(valores: list) -> str:
+    """Cursor opaco para la siguiente página: los valores de la última fila vista."""
+    return base64.urlsafe_b64encode(json.dumps(valores, default=str).encode()).decode().rstrip("=")
+
+
+def decodificar_cursor(cursor: str, tipos: tuple = (str, int)) -> list:
+    """
+    Lanza ValueError si el cursor no es válido o sus valores no son uno por
+    cada tipo de `tipos` (el cursor viene del cliente: un tipo incorrecto
+    llegaría a la consulta).
+    """
+    try:
+        valores = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError, UnicodeDecodeError):
+        raise ValueError("Cursor inválido")
+    if not isinstance(valores, list) or len(valores) != len(tipos):
+        raise ValueError("Cursor inválido")
+    for valor, tipo in zip(valores, tipos):
+        # bool es subclase de int
+        if not isinstance(valor, tipo) or isinstance(valor, bool):
+            raise ValueError("Cursor inválido")
+    return valores
+
+
+def _fecha_texto(dialecto: str, columna):
+    if dialecto == "postgresql":
+        return func.to_char(columna, "YYYY-MM-DD HH24:MI:SS")
+    return func.strftime("%Y-%m-%d %H:%M:%S", columna)
+
+
+def _versiones_json(dialecto: str, filas):
+    """Arreglo JSON con las versiones de cada grupo, armado en la base."""
+    campos = [
+        "version", filas.c.version,
+        "fecha_subida", _fecha_texto(dialecto, filas.c.fecha_subida),
+        "usuario", filas.c.usuario,
+        "categoria", filas.c.categoria,
+    ]
+    if dialecto == "postgresql":
+        return func.json_agg(
+            aggregate_order_by(func.json_build_object(*campos), filas.c.clave_version, filas.c.id), type_=JSON
+        )
+    # SQLite agrega en el orden de la subconsulta (nombre_archivo, clave_version, id)
+    return func.json_group_array(func.json_object(*campos), type_=JSON)
+
+
+def pagina_versiones(db, usuario_id: int, limite: int = PAGINA_POR_DEFECTO, cursor: str | None = None,
+                     **filtros) -> dict:
+    """
+    Una página de `limite` filas del historial agrupadas por documento
+    (GROUP BY + agregación JSON en la base). Un documento con más
+    versiones que la página continúa en la siguiente con el mismo nombre.
+    `siguiente` es el cursor para pedir la próxima página (None si la
+    página no se llenó: no hay más).
+    """
+    despues_de = decodificar_cursor(cursor, tipos=(str, str, int)) if cursor else None
+    filas = consulta_versiones(db, usuario_id, despues_de, **filtros).limit(limite).subquery()
+    dialecto = db.get_bind().dialect.name
+    grupos = db.query(
+        filas.c.nombre_archivo,
+        _versiones_json(dialecto, filas).label("versiones"),
+        func.count().label("filas"),
+    ).group_by(filas.c.nombre_archivo).order_by(filas.c.nombre_archivo).all()
+
+    siguiente = None
+    if grupos and sum(g.filas for g in grupos) == limite:
+        # Página llena: el cursor es la última fila (en el orden del índice)
+        ultima = db.query(filas.c.nombre_archivo, filas.c.clave_version, filas.c.id).order_by(
+            filas.c.nombre_archivo.desc(), filas.c.clave_version.desc(), filas.c.id.desc()
+        ).first()
+        siguiente = codificar_cursor(list(ultima))
+    return {
+        "documentos": [{"nombre": g.nombre_archivo, "versiones": g.versiones} for g in grupos],
+        "siguiente": siguiente,
+    }
+
+
+def pagina_historial(db, usuario_id: int, nombre_archivo: str, limite: int = PAGINA_POR_DEFECTO,
+                     cursor: str | None = None) -> dict:
+    """Una página del historial de un documento, por fecha."""
+    despues_de = decodificar_cursor(cursor) if cursor else None
+    filas = consulta_historial(db, usuario_id, nombre_archivo, despues_de).limit(limite + 1).all()
+    siguiente = None
+    if len(filas) > limite:
+        filas = filas[:limite]
+        siguiente = codificar_cursor([filas[-1].fecha_subida.isoformat(), filas[-1].id])
+    return {"filas": filas, "siguiente": siguiente}
+
+
+def consulta_vigentes(db, usuario_id: int, despues_de: str | None = None, prefijo: str | None = None,
+                      categoria: str | None = None):
+    """
+    Una fila por documento (documentos_vigentes) en orden de nombre, el
+    orden de uq_vigentes_usuario_nombre; `despues_de` es el último nombre visto.
+    """
+    query = db.query(DocumentoVigente).filter(DocumentoVigente.usuario_id == usuario_id)
+    if despues_de:
+        query = query.filter(DocumentoVigente.nombre_archivo > despues_de)
+    if prefijo:
+        query = query.filter(
+            DocumentoVigente.nombre_archivo >= prefijo,
+            DocumentoVigente.nombre_archivo.startswith(prefijo, autoescape=True)
+        )
+    if categoria:
+        query = query.filter(DocumentoVigente.categoria == categoria)
+    return query.order_by(DocumentoVigente.nombre_archivo)
+
+
+def pagina_vigentes(db, usuario_id: int, limite: int = PAGINA_POR_DEFECTO, cursor: str | None = None,
+                    **filtros) -> dict:
+    """Una página de versiones vigentes: `limite` documentos, sin leer el historial."""
+    despues_de = decodificar_cursor(cursor, tipos=(str,))[0] if cursor else None
+    filas = consulta_vigentes(db, usuario_id, despues_de, **filtros).limit(limite + 1).all()
+    siguiente = None
+    if len(filas) > limite:
+        filas = filas[:limite]
+        siguiente = codificar_cursor([filas[-1].nombre_archivo])
+    return {"filas": filas, "siguiente": siguiente}
+
+
+def buscar_duplicado(db, usuario_id: int, hash_sha256: str, version: str):
+    """
+    Busca el mismo contenido con la misma versión, solo dentro del usuario.
+    Si el pre-filtro asegura que no existe, no se consulta la base.
+    """
+    if not filtro_duplicados.quizas_existe(db, usuario_id, hash_sha256, version):
+        return None
+    duplicado = consulta_duplicado(db, usuario_id, hash_sha256, version).first()
+    filtro_duplicados.registrar_resultado(duplicado is not None)
+    return duplicado
+
+
+def registrar_documento(
+    db,
+    usuario,
+    nombre_archivo: str,
+    extension: str,
+    version: str,
+    categoria: str | None,
+    hashes: dict,
+    ruta_temporal: Path,
+    tamano_bytes: int,
+    content_type: str | None = None,
+    commit: bool = True,
+    paquete_id: int | None = None,
+):
+    """
+    Pasa el archivo al almacén por contenido (compartido entre usuarios;
+    se mueve al confirmar, ver guardar_blob) y guarda el documento en la tabla 'documentos', su entrada en
+    'historial_documentos' y la versión vigente en una sola transacción.
+    Con commit=False el llamador confirma (cargas por lote).
+    Retorna el Documento creado.
+    """
+    [nuevo_doc] = registrar_documentos(db, usuario, [{
+        "nombre_archivo": nombre_archivo, "extension": extension, "version": version, "categoria": categoria,
+        "hashes": hashes, "ruta_temporal": ruta_temporal, "tamano_bytes": tamano_bytes,
+        "content_type": content_type, "paquete_id": paquete_id,
+    }])
+    if commit:
+        db.commit()
+        db.refresh(nuevo_doc)
+    return nuevo_doc
+
+
+def registrar_documentos(db, usuario, archivos: list[dict]) -> list[Documento]:
+    """
+    registrar_documento para un lote, sin commit. Cada elemento trae los
+    argumentos de registrar_documento (content_type y paquete_id son
+    opcionales). Los blobs se resuelven juntos (ver guardar_blobs) y las
+    filas de 'documentos' e 'historial_documentos' se insertan con un
+    INSERT por tabla; la versión vigente se actualiza archivo por archivo,
+    en orden, porque dos versiones del mismo documento pueden venir juntas.
+    Retorna los Documento en el orden de `archivos`.
+    """
+    if not archivos:
+        return []
+    blobs = guardar_blobs(db, [(a["ruta_temporal"], a["hashes"]["sha256"], a["tamano_bytes"]) for a in archivos])
+    ahora = datetime.now()
+    documentos = [
+        Documento(
+            nombre_archivo=a["nombre_archivo"],
+            extension=a["extension"],
+            version=a["version"],
+            hash_archivo=a["hashes"]["sha256"],
+            hash_md5=a["hashes"]["md5"],
+            hash_sha256=a["hashes"]["sha256"],
+            ruta_guardado=blobs[a["hashes"]["sha256"]].ruta,
+            tamano_kb=a["tamano_bytes"] / 1024,
+            duplicado=False,
+            usuario_id=usuario.id,
+            categoria=a["categoria"],
+            content_type=a.get("content_type"),
+            last_modified=ahora.strftime("%Y-%m-%d %H:%M:%S"),
+            paquete_id=a.get("paquete_id"),
+        )
+        for a in archivos
+    ]
+    historial = [
+        HistorialDocumento(
+            nombre_archivo=a["nombre_archivo"],
+            version=a["version"],
+            usuario=usuario.nombre,
+            usuario_id=usuario.id,
+            fecha_subida=ahora,
+            hash_md5=a["hashes"]["md5"],
+            categoria=a["categoria"],
+        )
+        for a in archivos
+    ]
+    db.add_all(documentos)
+    db.add_all(historial)
+    db.flush()  # ids para las filas vigentes (un INSERT por tabla)
+    for a, nuevo_doc, nuevo_historial in zip(archivos, documentos, historial):
+        anterior = deltas.vigente_anterior(db, usuario.id, a["nombre_archivo"]) if deltas.ALMACEN_DELTAS else None
+        actualizar_vigente(db, nuevo_historial, nuevo_doc.id)
+        deltas.encolar_si_reemplaza(db, anterior, nuevo_historial, a["hashes"]["sha256"])
+        filtro_duplicados.agregar(usuario.id, a["hashes"]["sha256"], a["version"])
+    return documentos
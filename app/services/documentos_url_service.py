@@ -1,8 +1,38 @@
+import asyncio
 import os
-import hashlib
-import requests
+import tempfile
+from collections import defaultdict
+from urllib.parse import urlsplit
+import httpx
+from pydantic import BaseModel, HttpUrl
+from datetime import datetime
+from email.utils import parsedate_to_datetime
 from pathlib import Path
-from app.config import UPLOAD_DIR
+from app.models.documento import Documento
+from app.services.almacenamiento import TMP_DIR, ejecutor_almacenamiento, guardar_blob, referenciar_blob, borrar
+from app.services.cache_urls import buscar_entradas, cabeceras_condicionales, estadisticas_cache, guardar_entrada
+from app.services.trabajos import tarea, encolar
+from app.utils.hashing import HashMultiple, CHUNK_SIZE
+from decouple import config
+
+# Tamaño máximo de un documento descargado desde URL
+URL_MAX_MB = config("URL_MAX_MB", default=100, cast=int)
+URL_MAX_BYTES = URL_MAX_MB * 1024 * 1024
+# Descarga masiva: descargas simultáneas en total y por servidor
+URL_CONCURRENCIA = config("URL_CONCURRENCIA", default=16, cast=int)
+URL_CONCURRENCIA_HOST = config("URL_CONCURRENCIA_HOST", default=4, cast=int)
+URL_TIMEOUT_S = 10
+
+
+class DescargaDemasiadoGrande(Exception):
+    """La descarga supera el tamaño máximo permitido."""
+
+
+class URLRequest(BaseModel):
+    """Una URL a registrar (API, trabajos en segundo plano y app/ingest.py)."""
+    url: HttpUrl
+    version: str | None = "1.0"
+    categoria: str | None = None
 
 
 def normalize_google_url(url: str, desired_format="xlsx"):
@@ -39,68 +69,334 @@ def normalize_google_url(url: str, desired_format="xlsx"):
     
 
 
-def process_external_document(url: str, usuario_id: int, version: str = "1.0"):
-    """
-    Descarga un archivo desde la URL pública, lo guarda en /uploads
-    y retorna la info necesaria para BD.
-    """
-    try:
-        # 1) Normalizar URL si es Google
-        url = normalize_google_url(url)
+def nombre_desde_respuesta(url: str, headers) -> tuple[str, str]:
+    """Deduce (nombre_archivo, extension) a partir de las cabeceras HTTP o la URL."""
+    content_disp = headers.get("Content-Disposition", "")
+    filename = None
 
-        # 2) Descargar archivo
-        response = requests.get(url, timeout=10)
-        if response.status_code != 200:
-            raise Exception("No fue posible descargar el archivo (URL inválida o privada).")
+    if "filename=" in content_disp:
+        filename = content_disp.split("filename=")[-1].strip().strip('"')
+    else:
+        filename = url.split("/")[-1]
 
-        # 3) Obtener nombre
-        content_disp = response.headers.get("Content-Disposition", "")
-        filename = None
+    # Evitar nombres como 'export'
+    if filename.lower() in ("export", "download", ""):
+        filename += ".bin"
 
-        if "filename=" in content_disp:
-            filename = content_disp.split("filename=")[-1].strip().strip('"')
-        else:
-            filename = url.split("/")[-1]
+    # Asegurar extensión
+    if "." not in filename:
+        guessed_ext = headers.get("Content-Type", "").split("/")[-1]
+        filename += f".{guessed_ext}"
 
-        # Evitar nombres como 'export'
-        if filename.lower() in ("export", "download", ""):
-            filename += ".bin"
+    return filename, filename.split(".")[-1]
 
-        # Asegurar extensión
-        if "." not in filename:
-            guessed_ext = response.headers.get("Content-Type", "").split("/")[-1]
-            filename += f".{guessed_ext}"
 
-        extension = filename.split(".")[-1]
+def verificar_content_length(headers, max_bytes: int):
+    """Rechaza antes de descargar si el servidor ya anuncia un tamaño mayor al permitido."""
+    content_length = headers.get("Content-Length")
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+        raise DescargaDemasiadoGrande(
+            f"El archivo remoto pesa {int(content_length) / (1024 * 1024):.1f} MB (máx {max_bytes // (1024 * 1024)} MB)"
+        )
 
-        # 4) Guardar archivo
-        storage_path = Path(UPLOAD_DIR) / filename
-        with open(storage_path, "wb") as f:
-            f.write(response.content)
 
-        # 5) Hash
-        file_hash = hashlib.sha256(response.content).hexdigest()
+def _metadata_desde_cache(entrada: dict, usuario_id: int, version: str) -> dict:
+    """Metadatos de un 304: el contenido es el del blob ya guardado."""
+    estadisticas_cache.registrar(True, entrada["tamano_bytes"], condicional=True)
+    return {
+        "nombre_archivo": entrada["nombre_archivo"],
+        "extension": entrada["extension"],
+        "version": version,
+        "ruta_guardado": None,  # no hay staging: el router referencia el blob existente
+        "tamano_kb": round(entrada["tamano_bytes"] / 1024, 2),
+        "tamano_bytes": entrada["tamano_bytes"],
+        "hash_archivo": entrada["hash_sha256"],
+        "hash_md5": entrada["hash_md5"],
+        "hash_sha256": entrada["hash_sha256"],
+        "usuario_id": usuario_id,
+        "content_type": entrada["content_type"],
+        "last_modified": entrada["last_modified"],
+        "servidor": entrada["servidor"],
+        "etag": entrada["etag"],
+        "url_normalizada": entrada["url"],
+        "desde_cache": True,
+    }
 
-        # 6) Metadatos extra HTTP
-        metadata_extra = {
-            "content_type": response.headers.get("Content-Type"),
-            "last_modified": response.headers.get("Last-Modified"),
-            "servidor": response.headers.get("Server")
-        }
 
-        # 7) Retorno al router
+def process_external_document(url: str, usuario_id: int, version: str = "1.0", max_bytes: int | None = None,
+                              cache: dict | None = None):
+    """
+    Versión síncrona de descargar_externo para handlers sync: corre la
+    descarga en un event loop propio con un cliente httpx de un solo uso.
+    """
+    async def descargar():
+        async with httpx.AsyncClient(timeout=URL_TIMEOUT_S, follow_redirects=True) as client:
+            return await descargar_externo(client, url, usuario_id, version, max_bytes, cache=cache)
+
+    return asyncio.run(descargar())
+
+
+async def descargar_externo(client: httpx.AsyncClient, url: str, usuario_id: int,
+                            version: str = "1.0", max_bytes: int | None = None,
+                            cache: dict | None = None):
+    """
+    Descarga un archivo desde la URL pública por bloques sobre un cliente
+    httpx compartido, lo guarda en staging (uploads/_tmp) mientras calcula
+    los hashes y retorna la info necesaria para BD. La escritura a disco
+    corre en el pool de almacenamiento. Aborta en cuanto la descarga supera
+    `max_bytes` (URL_MAX_MB por defecto). Con `cache` (entrada de
+    app.services.cache_urls) la petición es condicional y un 304 retorna
+    los metadatos guardados con desde_cache=True, sin descargar.
+    """
+    max_bytes = max_bytes or URL_MAX_BYTES
+    ejecutar = ejecutor_almacenamiento.ejecutar
+    storage_path = None
+    try:
+        url = normalize_google_url(url)
+
+        async with client.stream("GET", url, headers=cabeceras_condicionales(cache)) as response:
+            if response.status_code == 304 and cache:
+                return _metadata_desde_cache(cache, usuario_id, version)
+            if response.status_code != 200:
+                raise Exception("No fue posible descargar el archivo (URL inválida o privada).")
+            verificar_content_length(response.headers, max_bytes)
+
+            filename, extension = nombre_desde_respuesta(url, response.headers)
+
+            hasher = HashMultiple()
+            fd, tmp = await ejecutar(tempfile.mkstemp, dir=TMP_DIR, suffix=".part")
+            storage_path = Path(tmp)
+            with os.fdopen(fd, "wb") as f:
+                async for bloque in response.aiter_bytes(CHUNK_SIZE):
+                    if hasher.tamano + len(bloque) > max_bytes:
+                        raise DescargaDemasiadoGrande(
+                            f"El archivo remoto supera el máximo de {max_bytes // (1024 * 1024)} MB"
+                        )
+                    hasher.update(bloque)
+                    await ejecutar(f.write, bloque)
+
+            metadata_extra = {
+                "content_type": response.headers.get("Content-Type"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "servidor": response.headers.get("Server"),
+                "etag": response.headers.get("ETag"),
+                "url_normalizada": url,
+                "desde_cache": False,
+            }
+            estadisticas_cache.registrar(False, hasher.tamano, condicional=bool(cache))
+
         return {
             "nombre_archivo": filename,
             "extension": extension,
             "version": version,
             "ruta_guardado": str(storage_path),
-            "tamano_kb": round(len(response.content) / 1024, 2),
-            "hash_archivo": file_hash,
+            "tamano_kb": round(hasher.tamano / 1024, 2),
+            "tamano_bytes": hasher.tamano,
+            "hash_archivo": hasher.sha256,
+            "hash_md5": hasher.md5,
+            "hash_sha256": hasher.sha256,
             "usuario_id": usuario_id,
             **metadata_extra
         }
 
-    except requests.exceptions.RequestException:
+    except httpx.HTTPError:
+        if storage_path:
+            storage_path.unlink(missing_ok=True)
         raise Exception("Error al conectar con la URL (no hay acceso o requiere login).")
+    except DescargaDemasiadoGrande:
+        if storage_path:
+            storage_path.unlink(missing_ok=True)
+        raise
     except Exception as e:
+        if storage_path:
+            storage_path.unlink(missing_ok=True)
         raise Exception(f"Error inesperado: {str(e)}")
+    except BaseException:
+        # Cancelación de la tarea: limpiar sin envolver
+        if storage_path:
+            storage_path.unlink(missing_ok=True)
+        raise
+
+
+async def descargar_lote(pedidos: list[tuple[str, str]], usuario_id: int,
+                         concurrencia: int = URL_CONCURRENCIA,
+                         por_host: int = URL_CONCURRENCIA_HOST,
+                         max_bytes: int | None = None,
+                         cache: dict[str, dict] | None = None,
+                         al_terminar=None) -> list:
+    """
+    Descarga en paralelo una lista de (url, version) con un solo cliente
+    (conexiones reutilizadas). Como máximo `concurrencia` descargas a la vez
+    y `por_host` contra un mismo servidor, así el tiempo total depende del
+    límite y no del largo de la lista. `cache` son las entradas por URL
+    normalizada (ver buscar_entradas) para pedir cada URL en forma condicional.
+    `al_terminar(n)` se llama con la cantidad de descargas ya terminadas.
+    Retorna, en el mismo orden, el diccionario de metadatos o la excepción.
+    """
+    global_sem = asyncio.Semaphore(concurrencia)
+    por_servidor = defaultdict(lambda: asyncio.Semaphore(por_host))
+    limites = httpx.Limits(max_connections=concurrencia, max_keepalive_connections=concurrencia)
+    terminadas = [0]
+
+    async with httpx.AsyncClient(timeout=URL_TIMEOUT_S, limits=limites, follow_redirects=True) as client:
+        async def descargar(url: str, version: str):
+            normalizada = normalize_google_url(url)
+            host = urlsplit(normalizada).hostname
+            # Primero el cupo del servidor: si está saturado no se ocupa un cupo global
+            try:
+                async with por_servidor[host], global_sem:
+                    return await descargar_externo(client, url, usuario_id, version, max_bytes,
+                                                   cache=(cache or {}).get(normalizada))
+            finally:
+                terminadas[0] += 1
+                if al_terminar:
+                    al_terminar(terminadas[0])
+
+        return await asyncio.gather(
+            *(descargar(url, version) for url, version in pedidos),
+            return_exceptions=True
+        )
+
+
+# ===============================
+# REGISTRO DE LO DESCARGADO
+# ===============================
+def _fecha_creacion(last_modified_str: str | None) -> datetime:
+    """Convierte last_modified HTTP a datetime (o ahora si no viene o no se puede leer)."""
+    if last_modified_str:
+        try:
+            return parsedate_to_datetime(last_modified_str)
+        except Exception:
+            pass
+    return datetime.utcnow()
+
+
+def nuevo_documento_url(db, metadata: dict, usuario_id: int, categoria: str | None,
+                        duplicado: bool) -> Documento:
+    """
+    Mueve el archivo al almacén por contenido y agrega el Documento a la
+    sesión (sin commit). Si vino de la caché (304) solo referencia el blob;
+    lanza LookupError si ese blob ya no existe.
+    """
+    hash_val = metadata["hash_archivo"]
+    if metadata.get("desde_cache"):
+        blob = referenciar_blob(db, hash_val)
+    else:
+        # Si el contenido ya existe en el almacén, solo suma una referencia
+        blob = guardar_blob(db, Path(metadata["ruta_guardado"]), hash_val, int(metadata.get("tamano_bytes", 0)))
+    metadata["ruta_guardado"] = blob.ruta
+    guardar_entrada(db, metadata)
+
+    nuevo = Documento(
+        nombre_archivo=metadata.get("nombre_archivo", "sin_nombre"),
+        extension=metadata.get("extension", ""),
+        version=metadata.get("version", "1.0"),
+        hash_archivo=hash_val,
+        hash_md5=metadata.get("hash_md5"),
+        hash_sha256=hash_val,
+        ruta_guardado=metadata.get("ruta_guardado", ""),
+        tamano_kb=float(metadata.get("tamano_kb", 0)),
+        duplicado=duplicado,
+        usuario_id=usuario_id,
+        creado_en=_fecha_creacion(metadata.get("last_modified")),
+        content_type=metadata.get("content_type"),
+        last_modified=metadata.get("last_modified"),
+        categoria=categoria,
+        servidor=metadata.get("servidor")
+    )
+    db.add(nuevo)
+    return nuevo
+
+
+def resumen_documento(doc: Documento) -> dict:
+    return {
+        "id": doc.id,
+        "nombre": doc.nombre_archivo,
+        "extension": doc.extension,
+        "version": doc.version,
+        "tamano_kb": doc.tamano_kb,
+        "ruta_guardado": doc.ruta_guardado,
+        "duplicado": doc.duplicado,
+        "creado_en": doc.creado_en.isoformat() if doc.creado_en else None,
+        "categoria": doc.categoria
+    }
+
+
+def metadatos_extra(metadata: dict) -> dict:
+    return {k: v for k, v in metadata.items() if k not in ("nombre_archivo", "extension", "version", "hash_archivo", "ruta_guardado", "tamano_kb", "tamano_bytes")}
+
+
+def registrar_lote_urls(db, usuario_id: int, reqs: list, descargas: list) -> list[dict]:
+    """
+    Registra todas las descargas exitosas en una sola transacción. `reqs`
+    son los pedidos (con .url y .categoria) en el mismo orden que `descargas`.
+    """
+    exitosas = [m for m in descargas if isinstance(m, dict)]
+    staging = [Path(m["ruta_guardado"]) for m in exitosas if m["ruta_guardado"]]
+    # Una sola consulta de duplicados para todo el lote
+    hashes = {m["hash_archivo"] for m in exitosas}
+    existentes = set()
+    if hashes:
+        existentes = {h for (h,) in db.query(Documento.hash_sha256).filter(Documento.hash_sha256.in_(hashes)).distinct()}
+
+    resultados = []
+    nuevos = []
+    try:
+        for req, metadata in zip(reqs, descargas):
+            resultado = {"url": str(req.url), "estado": None, "detalle": None}
+            resultados.append(resultado)
+            if not isinstance(metadata, dict):
+                resultado.update(estado="error", detalle=f"No se pudo procesar la URL: {metadata}")
+                continue
+            hash_val = metadata["hash_archivo"]
+            duplicado = hash_val in existentes
+            try:
+                doc = nuevo_documento_url(db, metadata, usuario_id, req.categoria, duplicado)
+            except LookupError:
+                resultado.update(estado="error", detalle="El contenido en caché fue eliminado; vuelve a intentarlo")
+                continue
+            existentes.add(hash_val)
+            nuevos.append((resultado, metadata, doc))
+        db.commit()
+    except Exception:
+        db.rollback()
+        # Tras el rollback nada pasó al almacén: las descargas siguen en staging
+        for ruta in staging:
+            borrar(ruta)
+        raise
+
+    for resultado, metadata, doc in nuevos:
+        resultado.update(
+            estado="ok",
+            documento=resumen_documento(doc),
+            metadatos_extra=metadatos_extra(metadata)
+        )
+    return resultados
+
+
+def con_resumen(resultados: list[dict]) -> dict:
+    resumen = {}
+    for r in resultados:
+        resumen[r["estado"]] = resumen.get(r["estado"], 0) + 1
+    return {"resumen": resumen, "resultados": resultados}
+
+
+# ===============================
+# TRABAJOS EN SEGUNDO PLANO
+# ===============================
+@tarea("desde_url")
+def tarea_desde_url(db, trabajo, urls: list[dict]):
+    """Descarga y registra las URLs fuera de la petición (ver app/services/trabajos.py)."""
+    reqs = [URLRequest(**u) for u in urls]
+    trabajo.progreso(0, len(reqs), forzar=True)
+    cache = buscar_entradas(db, [normalize_google_url(str(r.url)) for r in reqs])
+    descargas = asyncio.run(descargar_lote(
+        [(str(r.url), r.version or "1.0") for r in reqs], trabajo.usuario_id,
+        cache=cache, al_terminar=trabajo.progreso
+    ))
+    return con_resumen(registrar_lote_urls(db, trabajo.usuario_id, reqs, descargas))
+
+
+def encolar_urls(db, usuario_id: int, reqs: list[URLRequest]):
+    """Encola la descarga y registro de `reqs` y retorna el Trabajo."""
+    return encolar(db, "desde_url", usuario_id, {"urls": [r.model_dump(mode="json") for r in reqs]}, total=len(reqs))
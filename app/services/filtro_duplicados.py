@@ -0,0 +1,278 @@
+# app/services/filtro_duplicados.py
+# Pre-filtro probabilístico de duplicados (Bloom escalable por usuario).
+# Un "no está" es definitivo y evita la consulta a la base; un "quizás"
+# cae a la consulta normal. Se calienta al iniciar desde 'documentos', se
+# actualiza en cada inserción y con las filas que insertan otros procesos, y
+# se reconstruye solo si pierde la cuenta de los ids salteados.
+import hashlib
+import math
+import threading
+import time
+from decouple import config
+from sqlalchemy import func
+from app.models.documento import Documento
+
+FILTRO_DUPLICADOS = config("FILTRO_DUPLICADOS", default=True, cast=bool)
+FILTRO_CAPACIDAD_INICIAL = config("FILTRO_CAPACIDAD_INICIAL", default=1024, cast=int)
+FILTRO_TASA_FP = config("FILTRO_TASA_FP", default=0.01, cast=float)
+# Cada proceso (worker de uvicorn) tiene su propio filtro: cada tantos
+# segundos se leen las filas nuevas insertadas por otros procesos
+FILTRO_SYNC_S = config("FILTRO_SYNC_S", default=2.0, cast=float)
+# Los ids no llegan en orden de commit: una transacción larga puede
+# confirmar un id menor que el último leído. Los ids salteados ("huecos")
+# se vuelven a consultar en cada sincronización hasta que aparecen o pasan
+# FILTRO_HUECOS_TTL_S (rollback o borrado). Al calentar solo se anotan los
+# de los últimos FILTRO_VENTANA_IDS ids; si hay más de FILTRO_MAX_HUECOS el
+# filtro deja de descartar y todo va a la base.
+FILTRO_HUECOS_TTL_S = config("FILTRO_HUECOS_TTL_S", default=3600, cast=int)
+FILTRO_VENTANA_IDS = config("FILTRO_VENTANA_IDS", default=10_000, cast=int)
+FILTRO_MAX_HUECOS = config("FILTRO_MAX_HUECOS", default=100_000, cast=int)
+# Desbordado, el filtro se reconstruye en segundo plano (a lo sumo una vez
+# cada tantos segundos); mientras tanto todo va a la base
+FILTRO_RECONSTRUIR_S = config("FILTRO_RECONSTRUIR_S", default=300, cast=int)
+BLOQUE_HUECOS = 1000  # ids por consulta al revisar huecos
+
+
+class FiltroBloom:
+    def __init__(self, capacidad: int, tasa_fp: float):
+        self.capacidad = capacidad
+        self.tasa_fp = tasa_fp
+        self.n_bits = max(8, int(-capacidad * math.log(tasa_fp) / (math.log(2) ** 2)))
+        self.k = max(1, round(self.n_bits / capacidad * math.log(2)))
+        self.bits = bytearray((self.n_bits + 7) // 8)
+        self.elementos = 0
+
+    def _posiciones(self, clave: str):
+        digest = hashlib.blake2b(clave.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.n_bits for i in range(self.k))
+
+    def agregar(self, clave: str):
+        for p in self._posiciones(clave):
+            self.bits[p >> 3] |= 1 << (p & 7)
+        self.elementos += 1
+
+    def __contains__(self, clave: str) -> bool:
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._posiciones(clave))
+
+    @property
+    def lleno(self) -> bool:
+        return self.elementos >= self.capacidad
+
+    def tasa_fp_estimada(self) -> float:
+        return (1 - math.exp(-self.k * self.elementos / self.n_bits)) ** self.k
+
+
+class FiltroEscalable:
+    """Capas de Bloom que crecen x2 en capacidad y con tasa de falsos positivos cada vez menor."""
+
+    def __init__(self, capacidad: int, tasa_fp: float):
+        self.capas = [FiltroBloom(capacidad, tasa_fp / 2)]
+
+    def agregar(self, clave: str):
+        capa = self.capas[-1]
+        if capa.lleno:
+            capa = FiltroBloom(capa.capacidad * 2, capa.tasa_fp / 2)
+            self.capas.append(capa)
+        capa.agregar(clave)
+
+    def __contains__(self, clave: str) -> bool:
+        return any(clave in capa for capa in self.capas)
+
+    def tasa_fp_estimada(self) -> float:
+        acierto = 1.0
+        for capa in self.capas:
+            acierto *= 1 - capa.tasa_fp_estimada()
+        return 1 - acierto
+
+
+class FiltroDuplicados:
+    def __init__(self, capacidad_inicial: int, tasa_fp: float):
+        self.capacidad_inicial = capacidad_inicial
+        self.tasa_fp = tasa_fp
+        self._lock = threading.Lock()
+        self._filtros = {}
+        self._ultimo_id = 0
+        self._huecos = {}  # id salteado -> momento en que se detectó
+        self._desbordado = False
+        self._ultima_sync = 0.0
+        self._lock_sync = threading.Lock()
+        self._session_factory = None
+        self._reconstruyendo = False
+        self._ultima_reconstruccion = 0.0
+        self.listo = False
+        self.descartes = 0          # "no está": consulta a la base evitada
+        self.aciertos = 0           # "quizás" y la base confirmó el duplicado
+        self.falsos_positivos = 0   # "quizás" pero la base no lo tenía
+
+    @staticmethod
+    def _clave(hash_sha256: str, version: str | None) -> str:
+        return f"{hash_sha256}:{version or ''}"
+
+    def agregar(self, usuario_id: int, hash_sha256: str, version: str | None):
+        with self._lock:
+            filtro = self._filtros.get(usuario_id)
+            if filtro is None:
+                filtro = self._filtros[usuario_id] = FiltroEscalable(self.capacidad_inicial, self.tasa_fp)
+            filtro.agregar(self._clave(hash_sha256, version))
+
+    def _cargar(self, filas):
+        for doc_id, usuario_id, hash_sha256, version in filas:
+            self._huecos.pop(doc_id, None)
+            if hash_sha256 is not None:
+                self.agregar(usuario_id, hash_sha256, version)
+
+    def _anotar_huecos(self, desde: int, hasta: int, minimo: int):
+        """Anota los ids entre `desde` y `hasta` (exclusivos) mayores que `minimo`."""
+        desde = max(desde, minimo)
+        if hasta - desde - 1 + len(self._huecos) > FILTRO_MAX_HUECOS:
+            self._desbordado = True
+            return
+        ahora = time.monotonic()
+        for hueco in range(desde + 1, hasta):
+            self._huecos[hueco] = ahora
+
+    def _cargar_desde(self, db, desde_id: int, minimo_hueco: int = 0):
+        """Carga las filas con id > desde_id y anota los ids salteados."""
+        filas = db.query(
+            Documento.id, Documento.usuario_id, Documento.hash_sha256, Documento.version
+        ).filter(Documento.id > desde_id).order_by(Documento.id).yield_per(10_000)
+        anterior = desde_id
+        for fila in filas:
+            if fila[0] > anterior + 1:
+                self._anotar_huecos(anterior, fila[0], minimo_hueco)
+            self._cargar([fila])
+            anterior = fila[0]
+        self._ultimo_id = max(self._ultimo_id, anterior)
+
+    def _revisar_huecos(self, db):
+        """Carga los huecos que ya se confirmaron y olvida los vencidos."""
+        limite = time.monotonic() - FILTRO_HUECOS_TTL_S
+        for hueco in [h for h, desde in self._huecos.items() if desde < limite]:
+            del self._huecos[hueco]
+        pendientes = list(self._huecos)
+        for inicio in range(0, len(pendientes), BLOQUE_HUECOS):
+            self._cargar(db.query(
+                Documento.id, Documento.usuario_id, Documento.hash_sha256, Documento.version
+            ).filter(Documento.id.in_(pendientes[inicio:inicio + BLOQUE_HUECOS])))
+
+    def reconstruir(self, db):
+        """Vacía el filtro y lo vuelve a poblar desde la tabla 'documentos'."""
+        with self._lock_sync:
+            with self._lock:
+                self.listo = False
+                self._filtros = {}
+                self._ultimo_id = 0
+                self._huecos = {}
+                self._desbordado = False
+            tope = db.query(func.max(Documento.id)).scalar() or 0
+            self._cargar_desde(db, 0, minimo_hueco=tope - FILTRO_VENTANA_IDS)
+            self._ultima_sync = time.monotonic()
+            self.listo = True
+
+    def calentar_en_segundo_plano(self, session_factory):
+        """Carga inicial al arrancar sin bloquear el inicio; mientras tanto se consulta la base."""
+        if not FILTRO_DUPLICADOS:
+            return
+        self._session_factory = session_factory
+        self._reconstruir_en_segundo_plano()
+
+    def _reconstruir_en_segundo_plano(self):
+        with self._lock:
+            if self._reconstruyendo:
+                return
+            self._reconstruyendo = True
+            self._ultima_reconstruccion = time.monotonic()
+
+        def reconstruir():
+            db = self._session_factory()
+            try:
+                self.reconstruir(db)
+            except Exception as e:
+                print(f"⚠️ No se pudo reconstruir el filtro de duplicados: {e}")
+            finally:
+                db.close()
+                self._reconstruyendo = False
+
+        threading.Thread(target=reconstruir, name="filtro-duplicados", daemon=True).start()
+
+    def _sincronizar(self, db):
+        if time.monotonic() - self._ultima_sync < FILTRO_SYNC_S:
+            return
+        if not self._lock_sync.acquire(blocking=False):
+            return  # otro hilo ya está sincronizando
+        try:
+            self._revisar_huecos(db)
+            self._cargar_desde(db, self._ultimo_id)
+            self._ultima_sync = time.monotonic()
+        finally:
+            self._lock_sync.release()
+        if (self._desbordado and self._session_factory is not None
+                and time.monotonic() - self._ultima_reconstruccion >= FILTRO_RECONSTRUIR_S):
+            print("🔄 Filtro de duplicados desbordado: reconstruyendo")
+            self._reconstruir_en_segundo_plano()
+
+    def quizas_existe(self, db, usuario_id: int, hash_sha256: str, version: str | None) -> bool:
+        """False = seguro que no existe. True = hay que consultar la base."""
+        if not FILTRO_DUPLICADOS or not self.listo:
+            return True
+        self._sincronizar(db)
+        if self._desbordado:
+            return True
+        filtro = self._filtros.get(usuario_id)
+        if filtro is not None and self._clave(hash_sha256, version) in filtro:
+            return True
+        self.descartes += 1
+        return False
+
+    def registrar_resultado(self, existia: bool):
+        """Resultado de la base tras un "quizás" (solo cuenta si el filtro se consultó)."""
+        if not FILTRO_DUPLICADOS or not self.listo:
+            return
+        if existia:
+            self.aciertos += 1
+        else:
+            self.falsos_positivos += 1
+
+    def estadisticas_usuario(self, usuario_id: int):
+        """Lo que se puede mostrar a un usuario: su propio filtro, sin datos de los demás."""
+        filtro = self._filtros.get(usuario_id)
+        capas = filtro.capas if filtro is not None else []
+        return {
+            "activo": FILTRO_DUPLICADOS,
+            "listo": self.listo,
+            "desbordado": self._desbordado,
+            "elementos": sum(c.elementos for c in capas),
+            "capas": len(capas),
+            "bytes": sum(len(c.bits) for c in capas),
+            "tasa_fp_configurada": self.tasa_fp,
+            "tasa_fp_estimada": filtro.tasa_fp_estimada() if filtro is not None else 0.0,
+        }
+
+    def estadisticas(self):
+        """Todo el proceso (todos los usuarios): para logs y diagnóstico, no para la API."""
+        capas = [c for f in self._filtros.values() for c in f.capas]
+        elementos = sum(c.elementos for c in capas)
+        consultas_bd = self.aciertos + self.falsos_positivos
+        return {
+            "activo": FILTRO_DUPLICADOS,
+            "listo": self.listo,
+            "huecos": len(self._huecos),
+            "desbordado": self._desbordado,
+            "usuarios": len(self._filtros),
+            "elementos": elementos,
+            "capas": len(capas),
+            "bytes": sum(len(c.bits) for c in capas),
+            "tasa_fp_configurada": self.tasa_fp,
+            "tasa_fp_estimada_max": max((f.tasa_fp_estimada() for f in self._filtros.values()), default=0.0),
+            "descartes": self.descartes,
+            "aciertos": self.aciertos,
+            "falsos_positivos": self.falsos_positivos,
+            "tasa_fp_observada": (self.falsos_positivos / (self.falsos_positivos + self.descartes))
+            if (self.falsos_positivos + self.descartes) else 0.0,
+            "consultas_bd": consultas_bd,
+        }
+
+
+filtro_duplicados = FiltroDuplicados(FILTRO_CAPACIDAD_INICIAL, FILTRO_TASA_FP)
@@ -0,0 +1,72 @@
+# app/services/manifiesto.py
+# Manifiesto de ingesta: (ruta, tamaño, mtime_ns, inodo, hash) por carpeta
+# origen y usuario. Permite re-ingestar una carpeta con solo recorrerla:
+# lo que no cambió se salta sin leerlo y lo modificado entra como versión nueva.
+import os
+import re
+from collections import namedtuple
+from pathlib import Path
+from app.models.manifiesto_ingesta import ManifiestoIngesta
+
+EntradaManifiesto = namedtuple("EntradaManifiesto", "id tamano_bytes mtime_ns inodo hash_sha256 version error")
+
+
+def ruta_relativa(raiz: str, ruta: str) -> str:
+    return Path(os.path.relpath(ruta, raiz)).as_posix()
+
+
+def consultar(db, usuario_id: int, raiz: str, rutas: list[str]) -> dict[str, EntradaManifiesto]:
+    """Entradas del manifiesto para las rutas relativas dadas (una consulta por bloque)."""
+    if not rutas:
+        return {}
+    filas = db.query(
+        ManifiestoIngesta.ruta, ManifiestoIngesta.id, ManifiestoIngesta.tamano_bytes,
+        ManifiestoIngesta.mtime_ns, ManifiestoIngesta.inodo, ManifiestoIngesta.hash_sha256,
+        ManifiestoIngesta.version, ManifiestoIngesta.error
+    ).filter(
+        ManifiestoIngesta.usuario_id == usuario_id,
+        ManifiestoIngesta.raiz == raiz,
+        ManifiestoIngesta.ruta.in_(rutas)
+    )
+    return {ruta: EntradaManifiesto(*resto) for ruta, *resto in filas}
+
+
+def sin_cambios(entrada: EntradaManifiesto | None, st: os.stat_result) -> bool:
+    return (
+        entrada is not None
+        and entrada.tamano_bytes == st.st_size
+        and entrada.mtime_ns == st.st_mtime_ns
+        and entrada.inodo == st.st_ino
+    )
+
+
+def siguiente_version(version: str | None) -> str:
+    """'1.0' -> '1.1', '3' -> '4', 'v2.9' -> 'v2.10'; sin número al final agrega '.1'."""
+    if not version:
+        return "1.0"
+    m = re.search(r"(\d+)$", version)
+    if not m:
+        return f"{version}.1"
+    return f"{version[:m.start()]}{int(m.group(1)) + 1}"
+
+
+def guardar(db, usuario_id: int, raiz: str, ruta: str, st: os.stat_result, hash_sha256: str,
+            version: str | None, entrada: EntradaManifiesto | None, error: str | None = None):
+    """
+    Crea o actualiza la entrada (sin commit: va en la transacción del lote).
+    Con `error` la entrada marca un archivo que no pasó la validación.
+    """
+    valores = {
+        "tamano_bytes": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "inodo": st.st_ino,
+        "hash_sha256": hash_sha256,
+        "version": version,
+        "error": error,
+    }
+    if entrada is None:
+        db.add(ManifiestoIngesta(usuario_id=usuario_id, raiz=raiz, ruta=ruta, **valores))
+    else:
+        db.query(ManifiestoIngesta).filter(ManifiestoIngesta.id == entrada.id).update(
+            {getattr(ManifiestoIngesta, k): v for k, v in valores.items()}, synchronize_session=False
+        )
@@ -0,0 +1,353 @@
+# app/services/paquetes.py
+# Ingesta de paquetes ZIP / TRD / CCD sin descomprimir a una carpeta:
+# cada miembro se lee del archivo por bloques, se hashea y se escribe una
+# sola vez en staging (de ahí pasa al almacén por contenido con un rename).
+# Los miembros quedan registrados bajo el documento del paquete
+# (Documento.paquete_id) y por lotes, con versión/categoría de metadata.xml.
+import os
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+import zipfile
+from contextlib import ExitStack
+from pathlib import Path, PurePosixPath
+from decouple import config
+from app.models.blob import Blob
+from app.models.documento import Documento
+from app.models.usuario import Usuario
+from app.services.almacenamiento import TMP_DIR, borrar, contenido_blob
+from app.services.document_service import versiones_existentes, registrar_documento, buscar_duplicado
+from app.services.trabajos import tarea, encolar
+from app.services.validacion import ArchivoInvalido, servicio_validacion
+from app.utils.hashing import HashMultiple, CHUNK_SIZE
+from app.utils.etapas import Etapas
+from app.utils.reportes import ReporteErrores
+
+PAQUETE_EXTENSIONES = {".zip", ".trd", ".ccd"}
+PAQUETE_MAX_MIEMBROS = config("PAQUETE_MAX_MIEMBROS", default=50_000, cast=int)
+PAQUETE_MAX_MIEMBRO_MB = config("PAQUETE_MAX_MIEMBRO_MB", default=200, cast=int)
+PAQUETE_LOTE = config("PAQUETE_LOTE", default=500, cast=int)
+METADATA = "metadata.xml"
+
+
+class PaqueteInvalido(Exception):
+    """El archivo no es un paquete ZIP legible o excede los límites."""
+
+
+def _normalizar(ruta: str) -> str:
+    ruta = ruta.replace("\\", "/")
+    while ruta.startswith(("./", "/")):
+        ruta = ruta[2:] if ruta.startswith("./") else ruta[1:]
+    return ruta.lower()
+
+
+def _etiqueta(elem) -> str:
+    return elem.tag.rsplit("}", 1)[-1].lower()  # sin namespace
+
+
+def _campo(elem, nombre: str) -> str | None:
+    valor = elem.get(nombre)
+    if valor is None:
+        hijo = next((h for h in elem if _etiqueta(h) == nombre), None)
+        valor = hijo.text if hijo is not None else None
+    return valor.strip() if valor and valor.strip() else None
+
+
+def leer_metadata(zf: zipfile.ZipFile) -> tuple[dict, dict]:
+    """
+    Lee metadata.xml en streaming (iterparse). Acepta versión y categoría
+    del paquete como hijos directos de la raíz y, por documento, cualquier
+    elemento con `archivo` (o `ruta`) como atributo o hijo:
+
+        <paquete>
+          <categoria>Actas</categoria><version>1.0</version>
+          <documento archivo="documentos/acta1.pdf" version="2.0" categoria="Actas"/>
+        </paquete>
+
+    Retorna (valores_del_paquete, {ruta_normalizada: valores}).
+    """
+    if METADATA not in zf.NameToInfo:
+        return {}, {}
+    generales, por_archivo = {}, {}
+    profundidad = 0
+    with zf.open(METADATA) as f:
+        try:
+            for evento, elem in ET.iterparse(f, events=("start", "end")):
+                if evento == "start":
+                    profundidad += 1
+                    continue
+                profundidad -= 1
+                archivo = _campo(elem, "archivo") or _campo(elem, "ruta")
+                if archivo and profundidad >= 1:
+                    por_archivo[_normalizar(archivo)] = {
+                        "version": _campo(elem, "version"),
+                        "categoria": _campo(elem, "categoria"),
+                    }
+                    elem.clear()
+                elif profundidad == 1 and _etiqueta(elem) in ("version", "categoria") and elem.text:
+                    generales[_etiqueta(elem)] = elem.text.strip()
+                    elem.clear()
+        except ET.ParseError as e:
+            raise PaqueteInvalido(f"metadata.xml inválido: {e}")
+    return generales, por_archivo
+
+
+def _copiar_miembro(zf: zipfile.ZipFile, info: zipfile.ZipInfo, max_bytes: int):
+    """Lee el miembro por bloques a un archivo de staging calculando los hashes. Retorna (ruta, hashes, tamaño)."""
+    hasher = HashMultiple()
+    fd, tmp = tempfile.mkstemp(dir=TMP_DIR, suffix=".part")
+    try:
+        with zf.open(info) as origen, os.fdopen(fd, "wb") as destino:
+            while True:
+                bloque = origen.read(CHUNK_SIZE)
+                if not bloque:
+                    break
+                # No confiar en el tamaño declarado (ZIP manipulados)
+                if hasher.tamano + len(bloque) > max_bytes:
+                    raise ArchivoInvalido(f"Supera el máximo de {max_bytes // (1024 * 1024)} MB por archivo")
+                hasher.update(bloque)
+                destino.write(bloque)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+    return Path(tmp), hasher.resultado(), hasher.tamano
+
+
+def ingerir_paquete(db, usuario, ruta_paquete: Path, nombre_paquete: str, hashes_paquete: dict,
+                    tamano_paquete: int, version: str, categoria: str | None,
+                    extensiones_permitidas: set, reporte: ReporteErrores, content_type: str | None = None,
+                    simulacion: bool = False, progreso=None, tamano_lote: int | None = None,
+                    reanudar: bool = False) -> dict:
+    """
+    Registra el paquete (que se mueve al almacén como cualquier documento)
+    y luego cada miembro permitido, leyéndolo directo del ZIP. Memoria
+    acotada: un bloque de lectura y un lote de PAQUETE_LOTE miembros.
+    Los duplicados y archivos inválidos se escriben en `reporte` a medida
+    que ocurren (lo cierra el llamador).
+    Con `simulacion` se hashean y validan los miembros y se cuentan los
+    duplicados sin registrar ni mover nada. `progreso(n, total)` recibe
+    los miembros procesados.
+    Con `reanudar` (trabajo retomado tras la caída de su worker) se sigue
+    un paquete que quedó registrado a medias: se lee desde el almacén si ya
+    pasó ahí y se saltan los miembros que ya están vinculados a él.
+    """
+    inicio = time.monotonic()
+    etapas = Etapas()
+    previo = _paquete_previo(db, usuario.id, nombre_paquete, hashes_paquete["sha256"]) if reanudar else None
+    pila = ExitStack()
+    try:
+        origen = ruta_paquete
+        if previo is not None and not ruta_paquete.exists():
+            # Pasó al almacén con el primer lote confirmado
+            origen = pila.enter_context(contenido_blob(db, db.get(Blob, previo.hash_sha256)))
+        zf = pila.enter_context(zipfile.ZipFile(origen))
+    except (zipfile.BadZipFile, OSError) as e:
+        pila.close()
+        raise PaqueteInvalido(f"No es un paquete ZIP válido: {e}")
+
+    # El ZipFile mantiene abierto el archivo aunque registrar_documento lo mueva al almacén
+    with pila:
+        miembros = [i for i in zf.infolist() if not i.is_dir()]
+        if len(miembros) > PAQUETE_MAX_MIEMBROS:
+            raise PaqueteInvalido(f"El paquete tiene {len(miembros)} archivos (máx {PAQUETE_MAX_MIEMBROS})")
+        generales, por_archivo = leer_metadata(zf)
+        version = generales.get("version") or version
+        categoria = generales.get("categoria") or categoria
+        if previo is not None and previo.version != version:
+            previo = None  # es otra subida del mismo archivo, no este paquete a medias
+        if previo is None and buscar_duplicado(db, usuario.id, hashes_paquete["sha256"], version):
+            raise PaqueteInvalido(f"Ya subiste anteriormente el paquete '{nombre_paquete}' con la versión '{version}'")
+
+        paquete_id = None
+        ya_vinculados = set()
+        if previo is not None:
+            paquete_id = previo.id
+            ya_vinculados = set(db.query(Documento.hash_sha256, Documento.version).filter(
+                Documento.paquete_id == previo.id
+            ).all())
+        elif not simulacion:
+            paquete = registrar_documento(
+                db, usuario,
+                nombre_archivo=nombre_paquete,
+                extension=Path(nombre_paquete).suffix.lower(),
+                version=version,
+                categoria=categoria,
+                hashes=hashes_paquete,
+                ruta_temporal=ruta_paquete,
+                tamano_bytes=tamano_paquete,
+                content_type=content_type,
+                commit=False,
+            )
+            db.flush()
+            paquete_id = paquete.id
+
+        resultado = {"paquete_id": paquete_id, "version": version, "categoria": categoria,
+                     "miembros": 0, "registrados": 0, "duplicados": 0, "omitidos": 0, "bytes": 0,
+                     "simulacion": simulacion}
+        lote = []
+        max_bytes = PAQUETE_MAX_MIEMBRO_MB * 1024 * 1024
+
+        def registrar_lote():
+            with etapas.medir("duplicados"):
+                existentes = versiones_existentes(db, usuario.id, [(m["hashes"]["sha256"], m["version"]) for m in lote])
+            inicio_registro = time.perf_counter()
+            for m in lote:
+                clave = (m["hashes"]["sha256"], m["version"])
+                if clave in ya_vinculados:
+                    # Registrado antes de la caída: no es un duplicado
+                    if m["tmp"]:
+                        borrar(m["tmp"])
+                    resultado["registrados"] += 1
+                    continue
+                if clave in existentes:
+                    if m["tmp"]:
+                        borrar(m["tmp"])
+                    resultado["duplicados"] += 1
+                    reporte.agregar(m["miembro"], "duplicado", f"Ya existe con la versión '{m['version']}'")
+                    continue
+                existentes.add(clave)
+                if not simulacion:
+                    registrar_documento(
+                        db, usuario,
+                        nombre_archivo=PurePosixPath(m["miembro"]).name,
+                        extension=PurePosixPath(m["miembro"]).suffix.lower(),
+                        version=m["version"],
+                        categoria=m["categoria"],
+                        hashes=m["hashes"],
+                        ruta_temporal=m["tmp"],
+                        tamano_bytes=m["tamano"],
+                        commit=False,
+                        paquete_id=paquete_id,
+                    )
+                resultado["registrados"] += 1
+            etapas.segundos["registro"] += time.perf_counter() - inicio_registro
+            with etapas.medir("commit"):
+                if simulacion:
+                    db.rollback()
+                else:
+                    db.commit()
+            lote.clear()
+
+        try:
+            for info in miembros:
+                nombre = info.filename
+                if _normalizar(nombre) == METADATA:
+                    continue
+                extension = PurePosixPath(nombre).suffix.lower()
+                if extension not in extensiones_permitidas:
+                    resultado["omitidos"] += 1
+                    continue
+                resultado["miembros"] += 1
+                if progreso:
+                    progreso(resultado["miembros"], len(miembros))
+                try:
+                    with etapas.medir("lectura_hash"):
+                        tmp, hashes, tamano = _copiar_miembro(zf, info, max_bytes)
+                except (ArchivoInvalido, zipfile.BadZipFile, OSError) as e:
+                    # BadZipFile: CRC incorrecto o miembro dañado
+                    reporte.agregar(nombre, "corrupto", str(e))
+                    continue
+                try:
+                    with etapas.medir("validacion"):
+                        servicio_validacion.validar_sync(tmp, extension)
+                except ArchivoInvalido as e:
+                    borrar(tmp)
+                    reporte.agregar(nombre, "corrupto", str(e))
+                    continue
+                except BaseException:
+                    borrar(tmp)  # todavía no está en el lote que se limpia abajo
+                    raise
+                resultado["bytes"] += tamano
+                if simulacion:
+                    borrar(tmp)
+                    tmp = None
+                meta = por_archivo.get(_normalizar(nombre), {})
+                lote.append({
+                    "miembro": nombre, "tmp": tmp, "hashes": hashes, "tamano": tamano,
+                    "version": meta.get("version") or version,
+                    "categoria": meta.get("categoria") or categoria,
+                })
+                if len(lote) >= (tamano_lote or PAQUETE_LOTE):
+                    registrar_lote()
+            registrar_lote()
+        except BaseException:
+            db.rollback()
+            for m in lote:
+                if m["tmp"]:
+                    borrar(m["tmp"])
+            raise
+
+    if previo is not None and ruta_paquete.exists():
+        _completar_paquete_previo(db, previo, ruta_paquete)
+    resultado["errores"] = reporte.filas - resultado["duplicados"]
+    resultado["corruptos"] = reporte.conteo["corrupto"]
+    resultado["segundos"] = round(time.monotonic() - inicio, 2)
+    resultado["etapas_s"] = etapas.resumen()
+    return resultado
+
+
+def _paquete_previo(db, usuario_id: int, nombre_paquete: str, hash_sha256: str):
+    """El paquete que un intento anterior del trabajo dejó registrado, si lo hay."""
+    return db.query(Documento).filter(
+        Documento.usuario_id == usuario_id,
+        Documento.hash_sha256 == hash_sha256,
+        Documento.nombre_archivo == nombre_paquete,
+    ).order_by(Documento.id.desc()).first()
+
+
+def _completar_paquete_previo(db, previo: Documento, ruta_paquete: Path):
+    """
+    La copia en staging de un paquete ya registrado: sobra si el almacén
+    tiene el contenido; si el intento anterior cayó entre el commit y el
+    movimiento, es la única copia y pasa al almacén.
+    """
+    blob = db.get(Blob, previo.hash_sha256)
+    if blob is None or Path(blob.ruta).exists() or blob.base_hash:
+        borrar(ruta_paquete)
+    else:
+        Path(blob.ruta).parent.mkdir(parents=True, exist_ok=True)
+        os.replace(ruta_paquete, blob.ruta)
+
+
+# ===============================
+# TRABAJOS EN SEGUNDO PLANO
+# ===============================
+@tarea("ingesta_paquete")
+def tarea_ingesta_paquete(db, trabajo, ruta: str, nombre: str, hashes: dict, tamano: int, version: str,
+                          categoria: str | None, extensiones: list[str], content_type: str | None = None):
+    """Ingresa un paquete subido que quedó en staging (ver POST /documentos/upload-paquete)."""
+    usuario = db.get(Usuario, trabajo.usuario_id)
+    reporte = ReporteErrores("ingesta_paquete")
+    try:
+        resultado = ingerir_paquete(db, usuario, Path(ruta), nombre, hashes, tamano, version, categoria,
+                                    set(extensiones), reporte, content_type, progreso=trabajo.progreso,
+                                    reanudar=trabajo.intento > 1)
+    except Exception:
+        reporte.cerrar(completo=False)  # lo reportado hasta el corte queda en disco
+        # El trabajo queda fallido y no se reintenta. Si el paquete ya se confirmó,
+        # la copia en staging pasó al almacén y no hay nada que borrar
+        borrar(Path(ruta))
+        raise
+    except BaseException:
+        # Worker detenido: el trabajo vuelve a la cola y el reintento necesita la copia
+        reporte.cerrar(completo=False)
+        raise
+    return cerrar_reporte(resultado, reporte)
+
+
+def cerrar_reporte(resultado: dict, reporte: ReporteErrores) -> dict:
+    """Cierra el reporte de errores y, si hubo, agrega sus rutas al resultado."""
+    info = reporte.cerrar()
+    if reporte.ruta:
+        resultado["reporte"] = reporte.ruta
+        resultado["reporte_resumen"] = info["ruta_resumen"]
+    return resultado
+
+
+def encolar_paquete(db, usuario_id: int, ruta: Path, nombre: str, hashes: dict, tamano: int, version: str,
+                    categoria: str | None, extensiones: set, content_type: str | None = None):
+    """Encola la ingesta del paquete en `ruta` (staging) y retorna el Trabajo."""
+    return encolar(db, "ingesta_paquete", usuario_id, {
+        "ruta": str(ruta), "nombre": nombre, "hashes": hashes, "tamano": tamano, "version": version,
+        "categoria": categoria, "extensiones": sorted(extensiones), "content_type": content_type,
+    })
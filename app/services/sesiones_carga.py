@@ -0,0 +1,250 @@
+# app/services/sesiones_carga.py
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+from decouple import config
+from sqlalchemy import func
+from starlette.concurrency import run_in_threadpool
+from app.models.sesion_carga import SesionCarga
+from app.services.almacenamiento import ejecutor_almacenamiento
+from app.utils.hashing import hash_de_archivo
+from app.utils.reloj import hace_segundos
+
+SESIONES_DIR = Path("uploads") / "_sesiones"
+SESIONES_DIR.mkdir(parents=True, exist_ok=True)
+
+# Sesiones sin actividad por este tiempo se dan por abandonadas y se borra su .part
+SESION_TTL_H = config("SESION_TTL_H", default=24, cast=int)
+SESION_LIMPIEZA_S = config("SESION_LIMPIEZA_S", default=3600, cast=int)
+# Un PUT sin latido por este tiempo (proceso caído) deja de bloquear la sesión
+SESION_BLOQUEO_S = config("SESION_BLOQUEO_S", default=300, cast=int)
+LATIDO_CADA_S = SESION_BLOQUEO_S / 5
+
+# Hash incremental por sesión: {sesion_id: (offset, hasher)}.
+# Si el proceso se reinicia se reconstruye leyendo el .part hasta el offset confirmado.
+_hashes = {}
+
+
+class OffsetInvalido(Exception):
+    """El bloque no empieza en el offset confirmado de la sesión."""
+
+
+class SesionOcupada(Exception):
+    """Otro bloque de la misma sesión se está escribiendo (o la sesión ya se cerró)."""
+
+
+def ruta_parcial(sesion: SesionCarga) -> Path:
+    return SESIONES_DIR / f"{sesion.id}.part"
+
+
+def crear_sesion(db, usuario_id: int, nombre_archivo: str, extension: str, version: str,
+                 categoria: str | None, content_type: str | None, tamano_total: int) -> SesionCarga:
+    sesion = SesionCarga(
+        id=uuid.uuid4().hex,
+        usuario_id=usuario_id,
+        nombre_archivo=nombre_archivo,
+        extension=extension,
+        version=version,
+        categoria=categoria,
+        content_type=content_type,
+        tamano_total=tamano_total,
+        offset_confirmado=0,
+        estado="abierta",
+    )
+    db.add(sesion)
+    db.commit()
+    db.refresh(sesion)
+    ruta_parcial(sesion).touch()
+    return sesion
+
+
+def _hasher_en_offset(sesion: SesionCarga):
+    """Devuelve el HashMultiple posicionado en el offset confirmado de la sesión."""
+    cache = _hashes.get(sesion.id)
+    if cache and cache[0] == sesion.offset_confirmado:
+        return cache[1]
+    return hash_de_archivo(ruta_parcial(sesion), limite=sesion.offset_confirmado)
+
+
+def tomar_sesion(db, sesion: SesionCarga, offset: int) -> str:
+    """
+    Pasa la sesión a 'escribiendo' con un UPDATE condicionado al estado y
+    al offset: de dos PUT simultáneos en el mismo offset solo uno lo logra.
+    Retorna el token del escritor. Un 'escribiendo' sin latido por
+    SESION_BLOQUEO_S (proceso caído a mitad de bloque) se puede retomar.
+    Lanza OffsetInvalido o SesionOcupada.
+    """
+    escritor = uuid.uuid4().hex
+    libre = (SesionCarga.estado == "abierta") | (
+        (SesionCarga.estado == "escribiendo") & (SesionCarga.actualizado_en < hace_segundos(db, SESION_BLOQUEO_S))
+    )
+    tomada = db.query(SesionCarga).filter(
+        SesionCarga.id == sesion.id, SesionCarga.offset_confirmado == offset, libre
+    ).update(
+        {SesionCarga.estado: "escribiendo", SesionCarga.escritor: escritor, SesionCarga.actualizado_en: func.now()},
+        synchronize_session=False
+    )
+    db.commit()
+    db.refresh(sesion)
+    if tomada:
+        return escritor
+    if sesion.estado == "escribiendo":
+        raise SesionOcupada("Otro bloque de esta sesión se está escribiendo")
+    if sesion.estado != "abierta":
+        raise SesionOcupada(f"La sesión está {sesion.estado}")
+    raise OffsetInvalido(f"Offset esperado {sesion.offset_confirmado}, recibido {offset}")
+
+
+def _latido(db, sesion: SesionCarga, escritor: str) -> bool:
+    """Renueva la toma de la sesión; False si otro escritor la retomó."""
+    renovada = db.query(SesionCarga).filter(
+        SesionCarga.id == sesion.id, SesionCarga.escritor == escritor
+    ).update({SesionCarga.actualizado_en: func.now()}, synchronize_session=False)
+    db.commit()
+    return bool(renovada)
+
+
+def _confirmar(db, sesion: SesionCarga, escritor: str, offset: int) -> bool:
+    """Deja la sesión abierta en `offset`, solo si este escritor todavía la tiene."""
+    confirmada = db.query(SesionCarga).filter(
+        SesionCarga.id == sesion.id, SesionCarga.escritor == escritor
+    ).update(
+        {SesionCarga.estado: "abierta", SesionCarga.escritor: None, SesionCarga.offset_confirmado: offset,
+         SesionCarga.actualizado_en: func.now()},
+        synchronize_session=False
+    )
+    db.commit()
+    db.refresh(sesion)
+    return bool(confirmada)
+
+
+async def escribir_bloque(db, sesion: SesionCarga, offset: int, stream) -> int:
+    """
+    Escribe en el .part los bytes de `stream` (async iterator) a partir de `offset`.
+    La E/S de disco corre en el pool de almacenamiento y la de la base en
+    el threadpool. El offset debe coincidir con el confirmado y la sesión
+    queda tomada mientras dura el bloque (ver tomar_sesion); lo que llegue
+    se confirma aunque la conexión se corte a mitad de bloque.
+    Retorna el nuevo offset confirmado.
+    """
+    escritor = await run_in_threadpool(tomar_sesion, db, sesion, offset)
+
+    ejecutar = ejecutor_almacenamiento.ejecutar
+    hasher = await ejecutar(_hasher_en_offset, sesion)
+    escritos = 0
+    ultimo_latido = time.monotonic()
+    try:
+        f = await ejecutar(open, ruta_parcial(sesion), "r+b")
+        try:
+            # Descartar restos de un bloque anterior que no se llegó a confirmar
+            await ejecutar(f.truncate, offset)
+            f.seek(offset)
+            async for bloque in stream:
+                if not bloque:
+                    continue
+                if offset + escritos + len(bloque) > sesion.tamano_total:
+                    raise ValueError("El bloque excede el tamaño declarado del archivo")
+                await ejecutar(f.write, bloque)
+                hasher.update(bloque)
+                escritos += len(bloque)
+                if time.monotonic() - ultimo_latido >= LATIDO_CADA_S:
+                    if not await run_in_threadpool(_latido, db, sesion, escritor):
+                        raise SesionOcupada("La sesión fue retomada por otro bloque")
+                    ultimo_latido = time.monotonic()
+            await ejecutar(f.flush)
+            await ejecutar(os.fsync, f.fileno())
+        finally:
+            await ejecutar(f.close)
+    finally:
+        if await run_in_threadpool(_confirmar, db, sesion, escritor, offset + escritos):
+            _hashes[sesion.id] = (sesion.offset_confirmado, hasher)
+
+    return sesion.offset_confirmado
+
+
+def liberar_sesion(db, sesion: SesionCarga, escritor: str):
+    """Devuelve una sesión tomada a 'abierta' sin cambiar su offset."""
+    _confirmar(db, sesion, escritor, sesion.offset_confirmado)
+
+
+def cerrar_sesion(db, sesion: SesionCarga, estado: str, escritor: str | None = None):
+    """
+    Marca la sesión como finalizada/cancelada y libera el hash en memoria.
+    Sin `escritor` solo cierra una sesión abierta (no una con un PUT en
+    curso); con él, la que ese escritor tiene tomada. Lanza SesionOcupada.
+    """
+    tomada = SesionCarga.escritor == escritor if escritor else SesionCarga.estado == "abierta"
+    cerrada = db.query(SesionCarga).filter(SesionCarga.id == sesion.id, tomada).update(
+        {SesionCarga.estado: estado, SesionCarga.escritor: None}, synchronize_session=False
+    )
+    db.commit()
+    db.refresh(sesion)
+    if not cerrada:
+        raise SesionOcupada(f"La sesión está {sesion.estado}")
+    _hashes.pop(sesion.id, None)
+    ruta_parcial(sesion).unlink(missing_ok=True)
+
+
+def hash_final(sesion: SesionCarga) -> dict:
+    return _hasher_en_offset(sesion).resultado()
+
+
+# ===============================
+# SESIONES ABANDONADAS
+# ===============================
+def expirar_sesiones(db) -> int:
+    """
+    Marca como 'vencida' cada sesión sin actividad por SESION_TTL_H y borra
+    su .part; también los .part sin sesión abierta (creados antes de un
+    corte). Retorna la cantidad de sesiones vencidas.
+    """
+    limite = hace_segundos(db, SESION_TTL_H * 3600)
+    inactiva = SesionCarga.estado.in_(("abierta", "escribiendo")) & (SesionCarga.actualizado_en < limite)
+    ids = [i for (i,) in db.query(SesionCarga.id).filter(inactiva)]
+    vencidas = 0
+    for sesion_id in ids:
+        # Condicionado de nuevo: un PUT pudo reactivarla entre la consulta y el UPDATE
+        if db.query(SesionCarga).filter(SesionCarga.id == sesion_id, inactiva).update(
+            {SesionCarga.estado: "vencida", SesionCarga.escritor: None}, synchronize_session=False
+        ):
+            db.commit()
+            _hashes.pop(sesion_id, None)
+            (SESIONES_DIR / f"{sesion_id}.part").unlink(missing_ok=True)
+            vencidas += 1
+
+    antiguedad = time.time() - SESION_TTL_H * 3600
+    viejos = {p.stem: p for p in SESIONES_DIR.glob("*.part") if p.stat().st_mtime < antiguedad}
+    if viejos:
+        abiertas = {i for (i,) in db.query(SesionCarga.id).filter(
+            SesionCarga.id.in_(list(viejos)), SesionCarga.estado.in_(("abierta", "escribiendo"))
+        )}
+        for sesion_id, ruta in viejos.items():
+            if sesion_id not in abiertas:
+                ruta.unlink(missing_ok=True)
+    db.commit()
+    return vencidas
+
+
+def limpiar_en_segundo_plano(session_factory, detener: threading.Event | None = None):
+    """Hilo que vence las sesiones abandonadas cada SESION_LIMPIEZA_S."""
+    detener = detener or threading.Event()
+
+    def limpiar():
+        while True:
+            db = session_factory()
+            try:
+                vencidas = expirar_sesiones(db)
+                if vencidas:
+                    print(f"🧹 {vencidas} sesiones de carga vencidas")
+            except Exception as e:
+                db.rollback()
+                print(f"⚠️ No se pudieron vencer las sesiones de carga: {e}")
+            finally:
+                db.close()
+            if detener.wait(SESION_LIMPIEZA_S):
+                return
+
+    threading.Thread(target=limpiar, name="sesiones-carga", daemon=True).start()
+    return detener
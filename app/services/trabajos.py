@@ -0,0 +1,277 @@
+# app/services/trabajos.py
+# Cola de trabajos en segundo plano sobre la propia base de datos (tabla
+# 'trabajos'), sin broker externo. Los endpoints encolan y responden 202;
+# un pool de hilos toma los pendientes, los ejecuta y deja el resultado.
+# El pool corre dentro del proceso de la API (TRABAJOS_EN_PROCESO) o
+# aparte con `python -m app.worker`. La toma de un trabajo es un UPDATE
+# condicionado al estado, así varios procesos pueden compartir la cola.
+# Todas las marcas de tiempo son func.now(): un solo reloj (el de la base)
+# para latidos y vencimientos, aunque los workers corran en otras máquinas.
+import importlib
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+from decouple import config
+from sqlalchemy import func
+from app.models.trabajo import Trabajo
+from app.utils.reloj import hace_segundos
+
+TRABAJOS_EN_PROCESO = config("TRABAJOS_EN_PROCESO", default=True, cast=bool)
+TRABAJOS_WORKERS = config("TRABAJOS_WORKERS", default=2, cast=int)
+TRABAJOS_POLL_S = config("TRABAJOS_POLL_S", default=1.0, cast=float)
+# Un trabajo en curso sin latido por este tiempo se considera abandonado (worker caído)
+TRABAJOS_HUERFANO_S = config("TRABAJOS_HUERFANO_S", default=120, cast=int)
+TRABAJOS_MAX_INTENTOS = config("TRABAJOS_MAX_INTENTOS", default=3, cast=int)
+PROGRESO_CADA_S = 1.0  # no escribir el progreso en la base más de una vez por segundo
+
+# Módulos que declaran tareas con @tarea; se importan al iniciar el pool
+MODULOS_TAREAS = ["app.services.documentos_url_service", "app.utils.ingesta", "app.services.deltas", "app.services.paquetes"]
+
+TAREAS = {}
+
+
+def tarea(nombre: str):
+    """Registra `fn(db, trabajo: ContextoTrabajo, **parametros) -> dict` bajo `nombre`."""
+    def registrar(fn):
+        TAREAS[nombre] = fn
+        return fn
+    return registrar
+
+
+def _cargar_tareas():
+    for modulo in MODULOS_TAREAS:
+        importlib.import_module(modulo)
+
+
+def encolar(db, tipo: str, usuario_id: int, parametros: dict, total: int | None = None,
+            commit: bool = True) -> Trabajo:
+    """
+    Crea el trabajo como pendiente y despierta al pool local. `parametros`
+    debe ser JSON. Con commit=False queda en la transacción del llamador y
+    solo se ejecuta si esta se confirma.
+    """
+    _cargar_tareas()
+    if tipo not in TAREAS:
+        raise ValueError(f"Tipo de trabajo desconocido: {tipo}")
+    trabajo = Trabajo(
+        id=uuid.uuid4().hex,
+        tipo=tipo,
+        usuario_id=usuario_id,
+        estado="pendiente",
+        parametros=parametros,
+        progreso_actual=0,
+        progreso_total=total,
+        intentos=0,
+    )
+    db.add(trabajo)
+    if commit:
+        db.commit()
+        db.refresh(trabajo)
+    pool_trabajos.despertar()
+    return trabajo
+
+
+def estado_trabajo(trabajo: Trabajo) -> dict:
+    return {
+        "trabajo_id": trabajo.id,
+        "tipo": trabajo.tipo,
+        "estado": trabajo.estado,
+        "progreso": {"actual": trabajo.progreso_actual, "total": trabajo.progreso_total},
+        "intentos": trabajo.intentos,
+        "creado_en": trabajo.creado_en.isoformat() if trabajo.creado_en else None,
+        "iniciado_en": trabajo.iniciado_en.isoformat() if trabajo.iniciado_en else None,
+        "terminado_en": trabajo.terminado_en.isoformat() if trabajo.terminado_en else None,
+        "resultado": trabajo.resultado,
+        "error": trabajo.error,
+    }
+
+
+class ContextoTrabajo:
+    """Lo que recibe la tarea: datos del trabajo y forma de reportar progreso."""
+
+    def __init__(self, session_factory, trabajo: Trabajo):
+        self._session_factory = session_factory
+        self.id = trabajo.id
+        self.usuario_id = trabajo.usuario_id
+        self.intento = trabajo.intentos  # >1: lo retoma otro worker tras una caída
+        self.total = trabajo.progreso_total
+        self._ultimo = 0.0
+        self._lock = threading.Lock()
+
+    def progreso(self, actual: int, total: int | None = None, forzar: bool = False):
+        """
+        Actualiza el progreso en su propia sesión (visible aunque la tarea
+        no haya hecho commit). Se limita a una escritura por segundo.
+        """
+        ahora = time.monotonic()
+        with self._lock:
+            if total is not None:
+                self.total = total
+            if not forzar and ahora - self._ultimo < PROGRESO_CADA_S:
+                return
+            self._ultimo = ahora
+        db = self._session_factory()
+        try:
+            db.query(Trabajo).filter(Trabajo.id == self.id).update(
+                {Trabajo.progreso_actual: actual, Trabajo.progreso_total: self.total,
+                 Trabajo.actualizado_en: func.now()},
+                synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+
+
+def reclamar(db, worker: str) -> Trabajo | None:
+    """Toma el pendiente más antiguo. Si otro worker lo toma primero, prueba el siguiente."""
+    candidatos = db.query(Trabajo.id).filter(
+        Trabajo.estado == "pendiente"
+    ).order_by(Trabajo.creado_en).limit(10).all()
+    for (trabajo_id,) in candidatos:
+        tomado = db.query(Trabajo).filter(
+            Trabajo.id == trabajo_id, Trabajo.estado == "pendiente"
+        ).update(
+            {Trabajo.estado: "en_curso", Trabajo.worker: worker, Trabajo.iniciado_en: func.now(),
+             Trabajo.actualizado_en: func.now(), Trabajo.intentos: Trabajo.intentos + 1},
+            synchronize_session=False
+        )
+        db.commit()
+        if tomado:
+            return db.get(Trabajo, trabajo_id)
+    return None
+
+
+def recuperar_huerfanos(db) -> int:
+    """
+    Trabajos 'en_curso' sin latido (su worker murió): vuelven a pendiente
+    o, si ya agotaron los intentos, quedan como fallidos.
+    """
+    limite = hace_segundos(db, TRABAJOS_HUERFANO_S)
+    abandonados = (Trabajo.estado == "en_curso") & (Trabajo.actualizado_en < limite)
+    reintentados = db.query(Trabajo).filter(
+        abandonados, Trabajo.intentos < TRABAJOS_MAX_INTENTOS
+    ).update({Trabajo.estado: "pendiente", Trabajo.worker: None}, synchronize_session=False)
+    db.query(Trabajo).filter(abandonados).update(
+        {Trabajo.estado: "fallido", Trabajo.error: "El worker se detuvo sin terminar el trabajo",
+         Trabajo.terminado_en: func.now()},
+        synchronize_session=False
+    )
+    db.commit()
+    return reintentados
+
+
+def ejecutar(session_factory, trabajo: Trabajo):
+    """
+    Corre la tarea y guarda el resultado o el error, salvo que el trabajo
+    se haya dado por abandonado y otro worker lo haya retomado.
+    """
+    db = session_factory()
+    try:
+        contexto = ContextoTrabajo(session_factory, trabajo)
+        try:
+            resultado = TAREAS[trabajo.tipo](db, contexto, **trabajo.parametros)
+            cambios = {Trabajo.estado: "completado", Trabajo.resultado: resultado, Trabajo.error: None}
+            if contexto.total is not None:
+                cambios[Trabajo.progreso_actual] = contexto.total
+        except Exception as e:
+            db.rollback()
+            cambios = {Trabajo.estado: "fallido", Trabajo.error: f"{e}\n{traceback.format_exc(limit=5)}"}
+        db.query(Trabajo).filter(
+            Trabajo.id == trabajo.id, Trabajo.estado == "en_curso", Trabajo.worker == trabajo.worker
+        ).update(
+            {**cambios, Trabajo.terminado_en: func.now(), Trabajo.actualizado_en: func.now()},
+            synchronize_session=False
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+class PoolTrabajos:
+    def __init__(self, workers: int, poll_s: float):
+        self.workers = workers
+        self.poll_s = poll_s
+        self._hilos = []
+        self._hay_trabajo = threading.Event()
+        self._detener = threading.Event()
+        self._en_curso = set()
+        self._lock = threading.Lock()
+        self._session_factory = None
+
+    @property
+    def activo(self) -> bool:
+        return bool(self._hilos)
+
+    def iniciar(self, session_factory, workers: int | None = None):
+        if self._hilos:
+            return
+        _cargar_tareas()
+        self._session_factory = session_factory
+        self._detener.clear()
+        prefijo = f"{socket.gethostname()}:{os.getpid()}"
+        for i in range(workers or self.workers):
+            hilo = threading.Thread(target=self._bucle, args=(f"{prefijo}:{i}",), name=f"trabajos-{i}", daemon=True)
+            hilo.start()
+            self._hilos.append(hilo)
+        latido = threading.Thread(target=self._latido, name="trabajos-latido", daemon=True)
+        latido.start()
+        self._hilos.append(latido)
+
+    def despertar(self):
+        self._hay_trabajo.set()
+
+    def detener(self, timeout: float | None = None):
+        """Deja de tomar trabajos y espera a que terminen los que están en curso."""
+        self._detener.set()
+        self._hay_trabajo.set()
+        for hilo in self._hilos:
+            hilo.join(timeout)
+        self._hilos = []
+
+    def _bucle(self, worker: str):
+        while not self._detener.is_set():
+            db = self._session_factory()
+            try:
+                trabajo = reclamar(db, worker)
+            except Exception:
+                trabajo = None  # base caída: reintentar en el siguiente ciclo
+            finally:
+                db.close()
+
+            if trabajo is None:
+                self._hay_trabajo.wait(self.poll_s)
+                self._hay_trabajo.clear()
+                continue
+
+            with self._lock:
+                self._en_curso.add(trabajo.id)
+            try:
+                ejecutar(self._session_factory, trabajo)
+            finally:
+                with self._lock:
+                    self._en_curso.discard(trabajo.id)
+
+    def _latido(self):
+        """Marca como vivos los trabajos de este proceso y recupera los abandonados por otros."""
+        while not self._detener.wait(TRABAJOS_HUERFANO_S / 4):
+            with self._lock:
+                ids = list(self._en_curso)
+            db = self._session_factory()
+            try:
+                if ids:
+                    db.query(Trabajo).filter(Trabajo.id.in_(ids)).update(
+                        {Trabajo.actualizado_en: func.now()}, synchronize_session=False
+                    )
+                    db.commit()
+                if recuperar_huerfanos(db):
+                    self.despertar()
+            except Exception:
+                db.rollback()
+            finally:
+                db.close()
+
+
+pool_trabajos = PoolTrabajos(TRABAJOS_WORKERS, TRABAJOS_POLL_S)
@@ -0,0 +1,257 @@
+# app/services/validacion.py
+# Validación de formato (PDF, XLSX, TRD/CCD) fuera del event loop.
+# El parseo corre en un ProcessPoolExecutor acotado: cada trabajo tiene
+# tiempo máximo (contado desde que empieza a correr, no desde que entra en
+# cola) y los procesos tienen límite de memoria. Si un proceso se cuelga o
+# muere, se reemplaza solo ese proceso.
+import asyncio
+import multiprocessing
+import os
+import signal
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturesTimeout
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from decouple import config
+
+VALIDACION_WORKERS = config("VALIDACION_WORKERS", default=2, cast=int)
+VALIDACION_TIMEOUT_S = config("VALIDACION_TIMEOUT_S", default=30, cast=int)
+VALIDACION_MEMORIA_MB = config("VALIDACION_MEMORIA_MB", default=512, cast=int)
+TAREAS_POR_PROCESO = 100  # reciclar procesos periódicamente por si hay fugas
+
+# Solo estas extensiones requieren parseo; el resto no pasa por el pool
+EXTENSIONES_VALIDADAS = {".pdf", ".xlsx", ".trd", ".ccd"}
+
+
+class ArchivoInvalido(Exception):
+    """El archivo no pasa las validaciones de formato (TRD/CCD, PDF, XLSX...)."""
+
+
+def validar_formato(ruta: str, extension: str) -> str | None:
+    """
+    Valida el archivo en el proceso actual usando los modos más baratos
+    de cada librería. Retorna el mensaje de error o None si es válido.
+    """
+    from app.utils.validaciones import validar_trd_ccd
+
+    if extension in {".trd", ".ccd"} and not validar_trd_ccd(Path(ruta)):
+        return "Archivo TRD/CCD inválido"
+
+    try:
+        if extension == ".pdf":
+            from PyPDF2 import PdfReader
+            PdfReader(ruta)
+        elif extension == ".xlsx":
+            import openpyxl
+            # Se pasa el archivo abierto: openpyxl rechaza rutas sin sufijo .xlsx (staging .part)
+            with open(ruta, "rb") as f:
+                wb = openpyxl.load_workbook(f, read_only=True)
+                wb.close()
+    except Exception:
+        return "Archivo corrupto o no procesable"
+    return None
+
+
+def _limitar_memoria(memoria_mb: int):
+    """Inicializador de cada proceso del pool: tope de memoria virtual."""
+    try:
+        import resource
+        limite = memoria_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limite, limite))
+    except (ImportError, ValueError, OSError):
+        pass  # Windows o límite no permitido: se valida sin tope
+
+
+def _iniciar_proceso(memoria_mb: int, pid):
+    """Inicializador de cada proceso: tope de memoria y pid visible para el padre."""
+    _limitar_memoria(memoria_mb)
+    pid.value = os.getpid()
+
+
+class ProcesoAislado:
+    """
+    Un proceso de trabajo: un ProcessPoolExecutor de un solo worker con
+    tope de memoria. Si su trabajo se cuelga se mata ese proceso y se
+    reemplaza, sin romper los trabajos que corren en los demás (pool de
+    validación y pool de ingesta).
+    """
+
+    def __init__(self, memoria_mb: int, tareas_por_proceso: int | None = TAREAS_POR_PROCESO):
+        contexto = multiprocessing.get_context("spawn")  # el que usa max_tasks_per_child
+        self.pid = contexto.Value("i", 0)
+        self.pool = ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=contexto,
+            max_tasks_per_child=tareas_por_proceso,
+            initializer=_iniciar_proceso,
+            initargs=(memoria_mb, self.pid),
+        )
+
+    def matar(self):
+        if self.pid.value:
+            try:
+                os.kill(self.pid.value, getattr(signal, "SIGKILL", signal.SIGTERM))
+            except OSError:
+                pass  # ya había terminado
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+class ServicioValidacion:
+    """
+    Pool de `workers` ranuras. Un trabajo primero espera una ranura libre
+    (sin límite de tiempo) y recién ahí corre con `timeout_s`: el tiempo en
+    cola no cuenta contra el trabajo.
+    """
+
+    def __init__(self, workers: int, timeout_s: int, memoria_mb: int):
+        self.workers = workers
+        self.timeout_s = timeout_s
+        self.memoria_mb = memoria_mb
+        self._lock = threading.Lock()
+        self._ranuras = [None] * workers
+        self._libres = list(range(workers))
+        self._esperando = deque()  # threading.Event o (loop, future) en orden de llegada
+        self.reciclajes = 0
+
+    # ===============================
+    # RANURAS LIBRES (semáforo compartido por hilos y event loop)
+    # ===============================
+    def _tomar(self) -> int:
+        with self._lock:
+            if self._libres:
+                return self._libres.pop()
+            espera = threading.Event()
+            self._esperando.append(espera)
+        espera.wait()
+        return espera.ranura
+
+    async def _tomar_async(self) -> int:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._libres:
+                return self._libres.pop()
+            futuro = loop.create_future()
+            self._esperando.append((loop, futuro))
+        try:
+            return await futuro
+        except asyncio.CancelledError:
+            with self._lock:
+                if (loop, futuro) in self._esperando:
+                    self._esperando.remove((loop, futuro))
+            if futuro.done() and not futuro.cancelled():
+                self._devolver(futuro.result())  # se la entregaron justo al cancelar
+            raise
+
+    def _devolver(self, i: int):
+        """Entrega la ranura al primero que espera o la deja libre."""
+        with self._lock:
+            if not self._esperando:
+                self._libres.append(i)
+                return
+            espera = self._esperando.popleft()
+        if isinstance(espera, threading.Event):
+            espera.ranura = i
+            espera.set()
+        else:
+            loop, futuro = espera
+            loop.call_soon_threadsafe(self._entregar, futuro, i)
+
+    def _entregar(self, futuro: asyncio.Future, i: int):
+        if futuro.cancelled():
+            self._devolver(i)
+        else:
+            futuro.set_result(i)
+
+    def _ranura(self, i: int) -> ProcesoAislado:
+        with self._lock:
+            if self._ranuras[i] is None:
+                self._ranuras[i] = ProcesoAislado(self.memoria_mb)
+            return self._ranuras[i]
+
+    def _reciclar(self, i: int, ranura: ProcesoAislado):
+        """Mata el proceso de la ranura (colgado o roto); el próximo trabajo crea otro."""
+        with self._lock:
+            if self._ranuras[i] is not ranura:
+                return
+            self._ranuras[i] = None
+            self.reciclajes += 1
+        ranura.matar()
+
+    # ===============================
+    # EJECUCIÓN
+    # ===============================
+    async def _en_proceso(self, funcion, *args):
+        """Corre `funcion(*args)` en una ranura. Lanza TimeoutError o BrokenProcessPool."""
+        loop = asyncio.get_running_loop()
+        i = await self._tomar_async()
+        try:
+            for intento in range(2):
+                ranura = self._ranura(i)
+                try:
+                    return await asyncio.wait_for(
+                        loop.run_in_executor(ranura.pool, funcion, *args), timeout=self.timeout_s
+                    )
+                except asyncio.TimeoutError:
+                    self._reciclar(i, ranura)
+                    raise TimeoutError
+                except BrokenProcessPool:
+                    # El proceso murió (memoria, crash); reintentar una vez en uno nuevo
+                    self._reciclar(i, ranura)
+                    if intento == 1:
+                        raise
+        finally:
+            self._devolver(i)
+
+    def _en_proceso_sync(self, funcion, *args):
+        i = self._tomar()
+        try:
+            for intento in range(2):
+                ranura = self._ranura(i)
+                try:
+                    return ranura.pool.submit(funcion, *args).result(timeout=self.timeout_s)
+                except FuturesTimeout:
+                    self._reciclar(i, ranura)
+                    raise TimeoutError
+                except BrokenProcessPool:
+                    self._reciclar(i, ranura)
+                    if intento == 1:
+                        raise
+        finally:
+            self._devolver(i)
+
+    async def validar(self, ruta: Path, extension: str):
+        """Valida sin bloquear el event loop. Lanza ArchivoInvalido."""
+        if extension not in EXTENSIONES_VALIDADAS:
+            return
+        try:
+            error = await self._en_proceso(validar_formato, str(ruta), extension)
+        except TimeoutError:
+            raise ArchivoInvalido("El archivo tardó demasiado en validarse")
+        except BrokenProcessPool:
+            raise ArchivoInvalido("Archivo corrupto o no procesable")
+        if error:
+            raise ArchivoInvalido(error)
+
+    def validar_sync(self, ruta: Path, extension: str):
+        """Versión para código síncrono (handlers sync, ingesta)."""
+        if extension not in EXTENSIONES_VALIDADAS:
+            return
+        try:
+            error = self._en_proceso_sync(validar_formato, str(ruta), extension)
+        except TimeoutError:
+            raise ArchivoInvalido("El archivo tardó demasiado en validarse")
+        except BrokenProcessPool:
+            raise ArchivoInvalido("Archivo corrupto o no procesable")
+        if error:
+            raise ArchivoInvalido(error)
+
+    def cerrar(self):
+        with self._lock:
+            ranuras, self._ranuras = self._ranuras, [None] * self.workers
+        for ranura in ranuras:
+            if ranura:
+                ranura.pool.shutdown(wait=True, cancel_futures=True)
+
+
+servicio_validacion = ServicioValidacion(VALIDACION_WORKERS, VALIDACION_TIMEOUT_S, VALIDACION_MEMORIA_MB)
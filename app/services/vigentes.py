@@ -0,0 +1,116 @@
+# app/services/vigentes.py
+# Proyección 'documentos_vigentes': una fila por (usuario_id, nombre_archivo)
+# con la versión más alta del historial. registrar_documento la actualiza
+# en la misma transacción que el historial; si se desincroniza (cargas
+# directas a la base, restauraciones) se reconstruye desde el historial:
+#
+#   python -m app.services.vigentes [--usuario ID]
+import argparse
+from sqlalchemy import func, insert, select, tuple_
+from sqlalchemy.exc import IntegrityError
+from app.models.documento import Documento
+from app.models.documento_vigente import DocumentoVigente
+from app.models.historial_documento import HistorialDocumento
+from app.utils.versiones import clave_de_version
+
+
+def actualizar_vigente(db, historial: HistorialDocumento, documento_id: int | None = None):
+    """
+    Suma la versión recién registrada (`historial` ya con id) a la fila
+    vigente de su documento y la reemplaza si es más alta. Sin commit: va
+    en la transacción del registro.
+    """
+    filtro = (
+        DocumentoVigente.usuario_id == historial.usuario_id,
+        DocumentoVigente.nombre_archivo == historial.nombre_archivo,
+    )
+    clave = clave_de_version(historial.version)
+    valores = {
+        "historial_id": historial.id,
+        "documento_id": documento_id,
+        "version": historial.version,
+        "clave_version": clave,
+        "categoria": historial.categoria,
+        "usuario": historial.usuario,
+        "fecha_subida": historial.fecha_subida,
+    }
+    for _ in range(2):
+        # El primer UPDATE bloquea la fila: dos subidas del mismo documento no se pisan
+        if db.query(DocumentoVigente).filter(*filtro).update(
+            {DocumentoVigente.total_versiones: DocumentoVigente.total_versiones + 1}, synchronize_session=False
+        ):
+            db.query(DocumentoVigente).filter(
+                *filtro,
+                tuple_(DocumentoVigente.clave_version, DocumentoVigente.historial_id) < tuple_(clave, historial.id)
+            ).update(valores, synchronize_session=False)
+            return
+        try:
+            with db.begin_nested():
+                db.add(DocumentoVigente(usuario_id=historial.usuario_id, nombre_archivo=historial.nombre_archivo,
+                                        total_versiones=1, **valores))
+            return
+        except IntegrityError:
+            continue  # otra subida concurrente creó la fila: se actualiza
+
+
+def reconstruir_vigentes(conn, usuario_id: int | None = None) -> int:
+    """
+    Rehace la proyección (de un usuario o completa) desde el historial con
+    un solo INSERT ... SELECT: por documento, la fila de mayor
+    (clave_version, id) y la cantidad de versiones. `conn` puede ser una
+    sesión o una conexión; sin commit. Retorna los documentos vigentes.
+    """
+    h = HistorialDocumento.__table__
+    d = Documento.__table__
+    v = DocumentoVigente.__table__
+    grupo = (h.c.usuario_id, h.c.nombre_archivo)
+    historial = select(
+        h.c.id, h.c.usuario_id, h.c.nombre_archivo, h.c.version, h.c.clave_version, h.c.categoria,
+        h.c.usuario, h.c.fecha_subida,
+        func.row_number().over(partition_by=grupo, order_by=(h.c.clave_version.desc(), h.c.id.desc())).label("orden"),
+        func.count().over(partition_by=grupo).label("total"),
+    )
+    borrar = v.delete()
+    if usuario_id is not None:
+        historial = historial.where(h.c.usuario_id == usuario_id)
+        borrar = borrar.where(v.c.usuario_id == usuario_id)
+    historial = historial.subquery()
+
+    # Documento de esa versión (la fila más nueva si se registró más de una vez)
+    documento = select(func.max(d.c.id)).where(
+        d.c.usuario_id == historial.c.usuario_id,
+        d.c.nombre_archivo == historial.c.nombre_archivo,
+        d.c.clave_version == historial.c.clave_version,
+    ).scalar_subquery()
+
+    conn.execute(borrar)
+    resultado = conn.execute(insert(v).from_select(
+        ["usuario_id", "nombre_archivo", "historial_id", "documento_id", "version", "clave_version",
+         "categoria", "usuario", "fecha_subida", "total_versiones"],
+        select(
+            historial.c.usuario_id, historial.c.nombre_archivo, historial.c.id, documento, historial.c.version,
+            historial.c.clave_version, historial.c.categoria, historial.c.usuario, historial.c.fecha_subida,
+            historial.c.total,
+        ).where(historial.c.orden == 1)
+    ))
+    return resultado.rowcount
+
+
+def main():
+    from app.database import engine, Base
+    from app.core.esquema import actualizar_esquema
+    import app.models  # noqa: F401
+
+    parser = argparse.ArgumentParser(description="Reconstruye documentos_vigentes desde historial_documentos")
+    parser.add_argument("--usuario", type=int, help="solo los documentos de este usuario")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    actualizar_esquema(engine)
+    with engine.begin() as conn:
+        total = reconstruir_vigentes(conn, args.usuario)
+    print(f"✅ {total:,} documentos vigentes")
+
+
+if __name__ == "__main__":
+    main()
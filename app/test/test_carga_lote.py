@@ -0,0 +1,77 @@
+# app/test/test_carga_lote.py
+# Subida por lote: un resultado por archivo (ok, duplicado, rechazado), el
+# mismo contenido con otra versión comparte el blob, y los registros de
+# 'documentos' e 'historial_documentos' se insertan con un INSERT por tabla.
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from app.database import Base
+from app.models import Usuario, Documento
+from app.models.blob import Blob
+from app.api import documentos
+from app.api.auth import get_current_user
+from app.api.documentos import get_db
+from app.services.almacenamiento import TMP_DIR, BLOBS_DIR
+
+CONTENIDO = bytes(range(256)) * 40  # como .png no pasa por la validación de formato
+
+
+@pytest.fixture
+def entorno(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    TMP_DIR.mkdir(parents=True)
+    BLOBS_DIR.mkdir(parents=True)
+    engine = create_engine(f"sqlite:///{tmp_path / 'lote.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    Sesion = sessionmaker(autoflush=False, bind=engine)
+    db = Sesion()
+    db.add(Usuario(id=1, nombre="ana", email="ana@test.com", password_hash="x"))
+    db.commit()
+    usuario = db.get(Usuario, 1)
+
+    def sesion_db():
+        s = Sesion()
+        try:
+            yield s
+        finally:
+            s.close()
+
+    app = FastAPI()
+    app.include_router(documentos.router)
+    app.dependency_overrides[get_db] = sesion_db
+    app.dependency_overrides[get_current_user] = lambda: usuario
+    yield TestClient(app), db, engine
+    db.close()
+    engine.dispose()
+
+
+def test_lote_con_duplicados_y_un_insert_por_tabla(entorno):
+    client, db, engine = entorno
+    inserts = []
+
+    # Una ejecución con todas las filas: en PostgreSQL es un solo INSERT ... VALUES (...), (...);
+    # SQLite no devuelve los ids en orden y el driver la corre fila por fila
+    @event.listens_for(engine, "before_execute")
+    def contar(conn, sentencia, parametros_multiples, parametros, opciones):
+        tabla = str(sentencia).split()[2] if str(sentencia).startswith("INSERT INTO") else None
+        if tabla in ("documentos", "historial_documentos"):
+            inserts.append((tabla, len(parametros_multiples)))
+
+    otro = bytes(reversed(CONTENIDO))
+    r = client.post("/upload-batch", data={"versiones": ["1.0", "2.0", "1.0", "1.0", "1.0"]}, files=[
+        ("files", ("acta.png", CONTENIDO)),
+        ("files", ("acta_v2.png", CONTENIDO)),    # mismo contenido, otra versión
+        ("files", ("copia.png", CONTENIDO)),      # mismo contenido y versión que acta.png
+        ("files", ("otro.png", otro)),
+        ("files", ("notas.txt", b"texto")),
+    ])
+
+    assert r.status_code == 200
+    assert [x["estado"] for x in r.json()["resultados"]] == ["ok", "ok", "duplicado", "ok", "rechazado"]
+    assert sorted(inserts) == [("documentos", 3), ("historial_documentos", 3)]
+    assert {d.nombre_archivo for d in db.query(Documento)} == {"acta.png", "acta_v2.png", "otro.png"}
+    referencias = {b.referencias for b in db.query(Blob)}
+    assert db.query(Blob).count() == 2 and referencias == {1, 2}
+    assert not list(TMP_DIR.iterdir())
@@ -0,0 +1,151 @@
+# app/test/test_deltas.py
+# Versiones guardadas como delta de la siguiente: el delta reconstruye el
+# archivo exacto, se descarta cuando no ahorra, y los blobs base no se
+# borran mientras haya deltas que dependan de ellos (ni quedan huérfanos
+# cuando un delta vuelve a guardarse completo). Una descarga no se corta si
+# su versión pasa a delta mientras se envía.
+import hashlib
+import os
+import random
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.database import Base
+import app.models  # noqa: F401
+from app.models import Usuario, Documento
+from app.models.blob import Blob
+from app.api import documentos
+from app.api.auth import get_current_user
+from app.services.almacenamiento import TMP_DIR, BLOBS_DIR, guardar_blob, liberar_blob, contenido_blob, ruta_blob
+from app.services.deltas import comprimir_como_delta
+from app.utils.delta import codificar, decodificar
+
+
+def version(n: int) -> bytes:
+    rnd = random.Random(7)
+    filas = [f"fila {i};{rnd.random()}\n" for i in range(50_000)]
+    filas[n * 1000] = f"editada en la versión {n}\n"
+    return "".join(filas).encode()
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    TMP_DIR.mkdir(parents=True)
+    BLOBS_DIR.mkdir(parents=True)
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(autoflush=False, bind=engine)()  # como SessionLocal
+    yield session
+    session.close()
+
+
+def guardar(db, contenido: bytes) -> str:
+    hash_archivo = hashlib.sha256(contenido).hexdigest()
+    origen = TMP_DIR / f"{hash_archivo}.part"
+    origen.write_bytes(contenido)
+    guardar_blob(db, origen, hash_archivo, len(contenido))
+    db.commit()
+    return hash_archivo
+
+
+def test_delta_reconstruye_y_descarta_si_no_conviene(tmp_path):
+    (tmp_path / "v1").write_bytes(version(1))
+    (tmp_path / "v2").write_bytes(version(2))
+    tamano = codificar(tmp_path / "v2", tmp_path / "v1", tmp_path / "d")
+    assert tamano < 1000
+    hashes = decodificar(tmp_path / "v2", tmp_path / "d", tmp_path / "salida")
+    assert hashes.sha256 == hashlib.sha256(version(1)).hexdigest()
+
+    (tmp_path / "azar").write_bytes(os.urandom(200_000))
+    assert codificar(tmp_path / "v2", tmp_path / "azar", tmp_path / "d2") is None
+    assert not (tmp_path / "d2").exists()
+
+
+def test_cadena_de_versiones_y_liberacion(db):
+    h1, h2, h3 = (guardar(db, version(n)) for n in (1, 2, 3))
+    assert comprimir_como_delta(db, h2, h3)["estado"] == "delta"
+    assert comprimir_como_delta(db, h1, h2)["estado"] == "delta"
+    assert comprimir_como_delta(db, h3, h1)["motivo"] == "ciclo"
+
+    v1 = db.get(Blob, h1)
+    assert not os.path.exists(v1.ruta) and v1.tamano_almacenado < 1000
+    with contenido_blob(db, v1) as ruta:  # dos deltas: v1 <- v2 <- v3
+        assert open(ruta, "rb").read() == version(1)
+
+    # v3 es base de la cadena: sin referencias se conserva hasta que se liberan sus deltas
+    assert liberar_blob(db, db.get(Blob, h3).ruta) == []
+    assert liberar_blob(db, db.get(Blob, h2).ruta) == []
+    rutas = liberar_blob(db, db.get(Blob, h1).ruta)
+    db.commit()
+    assert db.query(Blob).count() == 0
+    assert len(rutas) == 6  # archivo y delta de cada uno de los tres
+
+
+def test_delta_que_vuelve_a_subirse_libera_su_base(db):
+    h1, h2 = guardar(db, version(1)), guardar(db, version(2))
+    assert comprimir_como_delta(db, h1, h2)["estado"] == "delta"
+    ruta_v2 = db.get(Blob, h2).ruta
+    assert liberar_blob(db, ruta_v2) == []  # v2 se conserva: es la base de v1
+    db.commit()
+
+    # v1 se sube otra vez: queda completo y v2 ya no tiene quién la use
+    guardar(db, version(1))
+    db.expire_all()
+    assert db.get(Blob, h2) is None and not os.path.exists(ruta_v2)
+    v1 = db.get(Blob, h1)
+    assert v1.base_hash is None and open(v1.ruta, "rb").read() == version(1)
+
+
+def test_el_blob_pasa_al_almacen_solo_al_confirmar(db):
+    contenido = version(4)
+    hash_archivo = hashlib.sha256(contenido).hexdigest()
+    origen = TMP_DIR / "subida.part"
+    origen.write_bytes(contenido)
+
+    guardar_blob(db, origen, hash_archivo, len(contenido))
+    with db.begin_nested():
+        pass  # un savepoint no cuenta como commit ni como rollback de la transacción
+    assert origen.exists() and not ruta_blob(hash_archivo).exists()
+    db.rollback()
+    # Revertido: nada en el almacén; el origen queda para que lo borre el llamador
+    assert origen.exists() and not ruta_blob(hash_archivo).exists()
+
+    guardar_blob(db, origen, hash_archivo, len(contenido))
+    db.commit()
+    assert not origen.exists() and ruta_blob(hash_archivo).read_bytes() == contenido
+
+
+@pytest.mark.parametrize("momento", ["antes_del_enlace", "despues_del_enlace"])
+def test_descarga_cuando_la_version_pasa_a_delta(db, monkeypatch, momento):
+    h1, h2 = guardar(db, version(1)), guardar(db, version(2))
+    db.add(Usuario(id=1, nombre="ana", email="ana@test.com", password_hash="x"))
+    db.add(Documento(id=1, nombre_archivo="informe.csv", extension=".csv", version="1.0", hash_archivo=h1,
+                     hash_sha256=h1, ruta_guardado=db.get(Blob, h1).ruta, tamano_kb=1.0, usuario_id=1))
+    db.commit()
+    usuario = db.get(Usuario, 1)
+
+    enlazar = documentos._enlazar
+
+    def compresor_en_paralelo(origen, destino):
+        # El compresor de deltas reemplaza el archivo completo entre la consulta y el envío
+        if momento == "despues_del_enlace":
+            enlazar(origen, destino)
+        assert comprimir_como_delta(db, h1, h2)["estado"] == "delta"
+        if momento == "antes_del_enlace":
+            enlazar(origen, destino)
+
+    monkeypatch.setattr(documentos, "_enlazar", compresor_en_paralelo)
+    app = FastAPI()
+    app.include_router(documentos.router)
+    app.dependency_overrides[documentos.get_db] = lambda: db
+    app.dependency_overrides[get_current_user] = lambda: usuario
+
+    r = TestClient(app).get("/1/descargar")
+    assert r.status_code == 200
+    assert r.content == version(1)
+    assert not os.path.exists(db.get(Blob, h1).ruta)
+    assert not list(TMP_DIR.iterdir())  # el enlace o la reconstrucción se borran tras la respuesta
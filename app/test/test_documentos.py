@@ -0,0 +1,264 @@
+# app/test/test_documentos.py
+# Regresión de planes de consulta: las consultas de los endpoints de
+# documentos deben resolverse con índices y no con recorridos secuenciales.
+# Por defecto usa SQLite en memoria; con TEST_DATABASE_URL se corre contra
+# una base PostgreSQL de pruebas (se crean y eliminan las tablas).
+import os
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import create_engine, insert, text
+from sqlalchemy.orm import sessionmaker
+from app.database import Base
+from app.models import Usuario, Documento, HistorialDocumento
+from app.services.document_service import (
+    consulta_duplicado, consulta_historial, consulta_versiones, consulta_ultima_version, consulta_vigentes,
+    pagina_versiones, pagina_historial, pagina_vigentes, codificar_cursor
+)
+from app.services.vigentes import reconstruir_vigentes
+from app.services.busqueda import buscar_documentos, consulta_exactas, consulta_prefijo, motor_busqueda, _motores
+from app.core.esquema import actualizar_esquema
+from app.utils.versiones import clave_de_version
+
+N_USUARIOS = 50
+N_FILAS = 50_000
+
+
+@pytest.fixture(scope="module")
+def db():
+    engine = create_engine(os.getenv("TEST_DATABASE_URL", "sqlite://"))
+    Base.metadata.create_all(bind=engine)
+
+    inicio = datetime(2025, 1, 1)
+    with engine.begin() as conn:
+        conn.execute(insert(Usuario), [
+            {"id": u, "nombre": f"usuario{u}", "email": f"u{u}@test.com", "password_hash": "x"}
+            for u in range(1, N_USUARIOS + 1)
+        ])
+        conn.execute(insert(Documento), [
+            {
+                "nombre_archivo": f"Documento_{i % 2000}.pdf",
+                "extension": ".pdf",
+                "version": f"{i % 7}.0",
+                "hash_archivo": f"{i:064x}",
+                "hash_md5": f"{i:032x}",
+                "hash_sha256": f"{i:064x}",
+                "ruta_guardado": f"uploads/blobs/{i:064x}",
+                "tamano_kb": 1.0,
+                "usuario_id": i % N_USUARIOS + 1,
+            }
+            for i in range(N_FILAS)
+        ])
+        conn.execute(insert(HistorialDocumento), [
+            {
+                "nombre_archivo": f"Documento_{i % 2000}.pdf",
+                "version": f"{i % 7}.0",
+                "usuario": "usuario",
+                "usuario_id": i % N_USUARIOS + 1,
+                "fecha_subida": inicio + timedelta(minutes=i),
+                "hash_md5": f"{i:032x}",
+            }
+            for i in range(N_FILAS)
+        ])
+        conn.execute(text("ANALYZE"))
+
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+    if engine.dialect.name != "sqlite":
+        Base.metadata.drop_all(bind=engine)
+    engine.dispose()
+
+
+def plan_de(db, query) -> str:
+    bind = db.get_bind()
+    sql = str(query.statement.compile(dialect=bind.dialect, compile_kwargs={"literal_binds": True}))
+    if bind.dialect.name == "sqlite":
+        filas = db.execute(text(f"EXPLAIN QUERY PLAN {sql}")).all()
+        return "\n".join(f[-1] for f in filas)
+    filas = db.execute(text(f"EXPLAIN {sql}")).all()
+    return "\n".join(f[0] for f in filas)
+
+
+def assert_usa_indice(db, query, tabla):
+    plan = plan_de(db, query)
+    if db.get_bind().dialect.name == "sqlite":
+        assert f"SEARCH {tabla}" in plan, plan
+        assert f"SCAN {tabla}" not in plan, plan
+    else:
+        assert "Seq Scan" not in plan, plan
+
+
+def test_chequeo_duplicados_usa_indice(db):
+    query = consulta_duplicado(db, 7, f"{1234:064x}", "2.0")
+    assert_usa_indice(db, query, "documentos")
+
+
+def test_historial_por_nombre_usa_indice(db):
+    query = consulta_historial(db, 13, "documento_12.PDF")
+    assert_usa_indice(db, query, "historial_documentos")
+    assert query.count() > 0
+
+
+def test_historial_por_nombre_con_acentos(db):
+    db.add(HistorialDocumento(nombre_archivo="INFORMACIÓN.pdf", version="1.0", usuario="usuario",
+                              usuario_id=13, hash_md5="0" * 32))
+    db.commit()
+    # El nombre tal cual y con otras mayúsculas (SQLite solo pliega ASCII)
+    for nombre in ("INFORMACIÓN.pdf", "informaciÓn.PDF"):
+        assert [h.nombre_archivo for h in consulta_historial(db, 13, nombre)] == ["INFORMACIÓN.pdf"]
+    assert_usa_indice(db, consulta_historial(db, 13, "INFORMACIÓN.pdf"), "historial_documentos")
+
+
+def test_historial_ordenado_sin_sort_adicional(db):
+    plan = plan_de(db, consulta_historial(db, 13, "Documento_12.pdf"))
+    if db.get_bind().dialect.name == "sqlite":
+        assert "TEMP B-TREE" not in plan, plan
+
+
+def test_listado_versiones_usa_indice(db):
+    query = consulta_versiones(db, 7)
+    assert_usa_indice(db, query, "historial_documentos")
+
+
+def test_pagina_de_versiones_usa_rango_del_indice(db):
+    query = consulta_versiones(db, 7, despues_de=["Documento_500.pdf", clave_de_version("3.0"), 12345], prefijo="Documento_5")
+    assert_usa_indice(db, query.limit(100), "historial_documentos")
+    if db.get_bind().dialect.name == "sqlite":
+        assert "TEMP B-TREE" not in plan_de(db, query.limit(100))
+
+
+def test_paginas_de_versiones_cubren_todo_el_historial(db):
+    vistos, cursor, paginas = [], None, 0
+    while True:
+        pagina = pagina_versiones(db, 7, limite=300, cursor=cursor, prefijo="Documento_1")
+        for doc in pagina["documentos"]:
+            assert doc["nombre"].startswith("Documento_1")
+            vistos.extend((doc["nombre"], v["version"], v["fecha_subida"]) for v in doc["versiones"])
+        paginas += 1
+        cursor = pagina["siguiente"]
+        if cursor is None:
+            break
+    esperados = [(r.nombre_archivo, r.version, r.fecha_subida.strftime("%Y-%m-%d %H:%M:%S"))
+                 for r in consulta_versiones(db, 7, prefijo="Documento_1")]
+    assert vistos == esperados
+    assert paginas == len(esperados) // 300 + 1
+
+
+@pytest.mark.parametrize("pagina, valores", [
+    (pagina_historial, [["2025-01-01"], 5]),        # una lista en lugar de la fecha
+    (pagina_historial, [1735689600, 5]),
+    (pagina_historial, ["2025-01-01T00:00:00", "5"]),
+    (pagina_versiones, ["Documento_1.pdf", 3, 12345]),
+    (pagina_versiones, ["Documento_1.pdf", "0003", True]),
+    (pagina_vigentes, [{"nombre": "x"}]),
+])
+def test_cursor_con_tipos_incorrectos_es_invalido(db, pagina, valores):
+    # ValueError: el endpoint responde 400 en lugar de fallar en la consulta
+    args = ("Documento_1.pdf",) if pagina is pagina_historial else ()
+    with pytest.raises(ValueError, match="Cursor inválido"):
+        pagina(db, 7, *args, cursor=codificar_cursor(valores))
+
+
+def test_clave_de_version_ordena_numericamente():
+    versiones = ["v1", "1.0.1", "1.1", "2.0", "2.0-rc1", "2.1", "9.0", "10.0"]
+    assert sorted(versiones, key=clave_de_version) == versiones
+    assert clave_de_version("1") == clave_de_version("1.0") == clave_de_version("V1.0.0")
+
+
+def test_ultima_version_por_indice_sin_ordenar(db):
+    db.add_all([HistorialDocumento(nombre_archivo="Plan.docx", version=v, usuario="usuario", usuario_id=3,
+                                   hash_md5="0" * 32)
+                for v in ("9.0", "10.0", "2.5")])
+    db.commit()
+    assert consulta_ultima_version(db, 3, "Plan.docx").version == "10.0"
+    query = db.query(HistorialDocumento).filter(
+        HistorialDocumento.usuario_id == 3, HistorialDocumento.nombre_archivo == "Plan.docx"
+    ).order_by(HistorialDocumento.clave_version.desc(), HistorialDocumento.id.desc()).limit(1)
+    assert_usa_indice(db, query, "historial_documentos")
+    if db.get_bind().dialect.name == "sqlite":
+        assert "TEMP B-TREE" not in plan_de(db, query)
+
+
+def test_vigentes_reconstruidos_desde_el_historial(db):
+    reconstruir_vigentes(db, usuario_id=7)
+    query = consulta_vigentes(db, 7, despues_de="Documento_500.pdf", prefijo="Documento_5")
+    assert_usa_indice(db, query.limit(100), "documentos_vigentes")
+    vigentes = {v.nombre_archivo: (v.version, v.total_versiones) for v in consulta_vigentes(db, 7)}
+    esperados = {}
+    for r in consulta_versiones(db, 7):  # orden de versión: la última pisa a las anteriores
+        esperados[r.nombre_archivo] = (r.version, esperados.get(r.nombre_archivo, (None, 0))[1] + 1)
+    assert vigentes == esperados
+    db.rollback()
+
+
+def test_busqueda_por_nombre_ordenada_por_coincidencia(db):
+    nombres = ["Informe anual.pdf", "informe.pdf", "Resumen del INFORME.pdf", "Otro.pdf", "Informal.pdf"]
+    db.add_all([HistorialDocumento(nombre_archivo=n, version="1.0", usuario="usuario", usuario_id=11,
+                                   hash_md5="0" * 32) for n in nombres])
+    db.commit()
+    actualizar_esquema(db.get_bind())  # índices de búsqueda (FTS5 / pg_trgm)
+    reconstruir_vigentes(db, usuario_id=11)
+    db.commit()
+
+    resultados = [(nivel, v.nombre_archivo) for nivel, v in buscar_documentos(db, 11, " Informe")]
+    assert resultados[:3] == [
+        ("exacta", "informe.pdf"), ("prefijo", "Informe anual.pdf"), ("contiene", "Resumen del INFORME.pdf")
+    ]
+    assert ("contiene", "Otro.pdf") not in resultados
+    assert len(buscar_documentos(db, 11, "informe", limite=2)) == 2
+
+    assert_usa_indice(db, consulta_prefijo(db, 11, "Informe", 20), "documentos_vigentes")
+
+
+def test_busqueda_con_acentos_y_guion_bajo(db):
+    nombres = ["Acta ÑANDÚ.pdf", "acta_2020.pdf", "acta12020.pdf", "actas.pdf", "Resolución_2021.pdf"]
+    db.add_all([HistorialDocumento(nombre_archivo=n, version="1.0", usuario="usuario", usuario_id=12,
+                                   hash_md5="0" * 32) for n in nombres])
+    db.commit()
+    reconstruir_vigentes(db, usuario_id=12)
+    db.commit()
+
+    def buscar(q):
+        return [(nivel, v.nombre_archivo) for nivel, v in buscar_documentos(db, 12, q)]
+
+    # Texto y nombre pasan por el mismo lower() de la base (el de SQLite solo cambia ASCII)
+    assert buscar("ACTA ÑANDÚ") == [("exacta", "Acta ÑANDÚ.pdf")]
+    # '_' es un carácter más, no el comodín de LIKE ni un separador de la intercalación
+    assert buscar("acta_") == [("prefijo", "acta_2020.pdf")]
+    assert buscar("cta_20") == [("contiene", "acta_2020.pdf")]
+    assert ("contiene", "Resolución_2021.pdf") in buscar("ón_2021")
+    db.rollback()
+
+
+def test_exactas_no_quedan_afuera_del_limite(db):
+    # En el rango del prefijo "acta 01.pdf" ... "acta 30.pdf" van antes que "acta.pdf" (' ' < '.')
+    nombres = [f"acta {i:02d}.pdf" for i in range(1, 31)] + ["acta.pdf", "Acta", "acta.v2.pdf", "acta%.pdf"]
+    db.add_all([HistorialDocumento(nombre_archivo=n, version="1.0", usuario="usuario", usuario_id=13,
+                                   hash_md5="0" * 32) for n in nombres])
+    db.commit()
+    reconstruir_vigentes(db, usuario_id=13)
+    db.commit()
+
+    resultados = [(nivel, v.nombre_archivo) for nivel, v in buscar_documentos(db, 13, "ACTA", limite=5)]
+    assert resultados == [("exacta", "Acta"), ("exacta", "acta.pdf"), ("prefijo", "acta 01.pdf"),
+                          ("prefijo", "acta 02.pdf"), ("prefijo", "acta 03.pdf")]
+    # "acta.v2.pdf" no es exacta; '%' en el texto no es un comodín
+    assert [v.nombre_archivo for v in consulta_exactas(db, 13, "acta%", 5)] == ["acta%.pdf"]
+    assert_usa_indice(db, consulta_exactas(db, 13, "acta", 5), "documentos_vigentes")
+    db.rollback()
+
+
+def test_motor_like_no_se_recuerda(db):
+    class SinIndices:
+        """Sesión de una base donde todavía no se crearon los índices de búsqueda."""
+        def get_bind(self):
+            return db.get_bind()
+
+        def execute(self, consulta):
+            return db.execute(text("SELECT 1 WHERE 0"))
+
+    _motores.clear()
+    assert motor_busqueda(SinIndices()) == "like"
+    actualizar_esquema(db.get_bind())
+    assert motor_busqueda(db) == ("fts5" if db.get_bind().dialect.name == "sqlite" else "trigramas")
+    db.rollback()
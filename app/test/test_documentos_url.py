@@ -0,0 +1,111 @@
+# app/test/test_documentos_url.py
+# Descarga masiva desde URL contra un servidor HTTP local: los límites de
+# concurrencia global y por servidor se respetan y el tiempo total escala
+# con el límite, no con la cantidad de URLs. Las URLs en caché se piden en
+# forma condicional y un 304 no descarga nada.
+import asyncio
+import http.server
+import threading
+import time
+from pathlib import Path
+import pytest
+from app.services.documentos_url_service import descargar_lote, process_external_document, DescargaDemasiadoGrande
+
+DEMORA_S = 0.2
+
+
+class _Servidor(http.server.ThreadingHTTPServer):
+    activas = 0
+    max_activas = 0
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.headers.get("If-None-Match") == '"v1"':
+            self.send_response(304)
+            self.end_headers()
+            return
+        srv = self.server
+        with srv.lock:
+            srv.activas += 1
+            srv.max_activas = max(srv.max_activas, srv.activas)
+        time.sleep(DEMORA_S)
+        with srv.lock:
+            srv.activas -= 1
+        n = int(Path(self.path).stem)
+        self.send_response(200)
+        self.send_header("Content-Length", str(n))
+        self.send_header("ETag", '"v1"')
+        self.end_headers()
+        self.wfile.write(b"x" * n)
+
+
+@pytest.fixture
+def servidor():
+    srv = _Servidor(("127.0.0.1", 0), _Handler)
+    srv.lock = threading.Lock()
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+def _descargar(servidor, tamanos, **kwargs):
+    base = f"http://127.0.0.1:{servidor.server_port}"
+    inicio = time.monotonic()
+    resultados = asyncio.run(descargar_lote([(f"{base}/{n}.pdf", "1.0") for n in tamanos], 1, **kwargs))
+    duracion = time.monotonic() - inicio
+    for r in resultados:
+        if isinstance(r, dict):
+            Path(r["ruta_guardado"]).unlink(missing_ok=True)
+    return resultados, duracion
+
+
+def test_respeta_limite_por_servidor(servidor):
+    resultados, duracion = _descargar(servidor, [100 + i for i in range(12)], concurrencia=12, por_host=3)
+    assert [r["tamano_bytes"] for r in resultados] == [100 + i for i in range(12)]
+    assert servidor.max_activas == 3
+    # 12 URLs de a 3: cuatro tandas, no doce
+    assert duracion < DEMORA_S * 12 / 2
+
+
+def test_respeta_limite_global(servidor):
+    _descargar(servidor, [10] * 8, concurrencia=2, por_host=8)
+    assert servidor.max_activas == 2
+
+
+def test_error_de_una_url_no_afecta_al_resto(servidor):
+    resultados, _ = _descargar(servidor, [10, 5000, 20], concurrencia=4, por_host=4, max_bytes=1000)
+    assert resultados[0]["tamano_bytes"] == 10
+    assert isinstance(resultados[1], DescargaDemasiadoGrande)
+    assert resultados[2]["tamano_bytes"] == 20
+
+
+def test_url_en_cache_no_se_descarga(servidor):
+    base = f"http://127.0.0.1:{servidor.server_port}"
+    entrada = {
+        "url": f"{base}/10.pdf", "etag": '"v1"', "last_modified": None,
+        "hash_sha256": "a" * 64, "hash_md5": "b" * 32, "tamano_bytes": 10,
+        "nombre_archivo": "10.pdf", "extension": "pdf", "content_type": None, "servidor": None,
+    }
+    resultados = asyncio.run(descargar_lote(
+        [(f"{base}/10.pdf", "1.0"), (f"{base}/20.pdf", "1.0")], 1, cache={entrada["url"]: entrada}
+    ))
+    assert resultados[0]["desde_cache"] and resultados[0]["ruta_guardado"] is None
+    assert resultados[0]["hash_sha256"] == "a" * 64
+    assert not resultados[1]["desde_cache"] and resultados[1]["etag"] == '"v1"'
+    Path(resultados[1]["ruta_guardado"]).unlink(missing_ok=True)
+    # solo la URL sin caché llegó a la parte costosa del servidor
+    assert servidor.max_activas == 1
+
+
+def test_descarga_sincronica_usa_la_misma_implementacion(servidor):
+    base = f"http://127.0.0.1:{servidor.server_port}"
+    metadata = process_external_document(f"{base}/30.pdf", 1)
+    assert metadata["tamano_bytes"] == 30 and metadata["etag"] == '"v1"'
+    Path(metadata["ruta_guardado"]).unlink()
+    with pytest.raises(DescargaDemasiadoGrande):
+        process_external_document(f"{base}/5000.pdf", 1, max_bytes=1000)
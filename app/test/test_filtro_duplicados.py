@@ -0,0 +1,117 @@
+# app/test/test_filtro_duplicados.py
+# Pre-filtro de duplicados: las filas que otro proceso confirma con un id
+# menor que el último leído (commits fuera de orden) también se cargan, un
+# filtro desbordado se reconstruye solo y cada usuario ve solo su filtro.
+import time
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.database import Base
+from app.models import Usuario, Documento
+from app.services import filtro_duplicados as modulo
+from app.services.filtro_duplicados import FiltroDuplicados
+
+
+@pytest.fixture
+def db(monkeypatch):
+    monkeypatch.setattr(modulo, "FILTRO_DUPLICADOS", True)
+    monkeypatch.setattr(modulo, "FILTRO_SYNC_S", 0)
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    session.add(Usuario(id=1, nombre="ana", email="ana@test.com", password_hash="x"))
+    session.commit()
+    yield session
+    session.close()
+
+
+def documento(doc_id: int) -> Documento:
+    return Documento(id=doc_id, nombre_archivo=f"d{doc_id}.pdf", extension=".pdf", version="1.0",
+                     hash_archivo=f"{doc_id:064x}", hash_sha256=f"{doc_id:064x}", hash_md5=f"{doc_id:032x}",
+                     ruta_guardado="x", tamano_kb=1.0, usuario_id=1)
+
+
+def test_commit_fuera_de_orden_de_id(db):
+    filtro = FiltroDuplicados(1024, 0.01)
+    db.add(documento(1))
+    db.commit()
+    filtro.reconstruir(db)
+
+    # La transacción que tomó el id 2 confirma después que la del id 3
+    db.add(documento(3))
+    db.commit()
+    assert filtro.quizas_existe(db, 1, f"{3:064x}", "1.0")
+    assert not filtro.quizas_existe(db, 1, f"{2:064x}", "1.0")
+    assert filtro.estadisticas()["huecos"] == 1
+
+    db.add(documento(2))
+    db.commit()
+    assert filtro.quizas_existe(db, 1, f"{2:064x}", "1.0")
+    assert filtro.estadisticas()["huecos"] == 0
+
+
+def test_huecos_vencidos_y_desborde(db, monkeypatch):
+    filtro = FiltroDuplicados(1024, 0.01)
+    filtro.reconstruir(db)
+    db.add(documento(5))
+    db.commit()
+    filtro.quizas_existe(db, 1, "otro", "1.0")
+    assert filtro.estadisticas()["huecos"] == 4
+
+    monkeypatch.setattr(modulo, "FILTRO_HUECOS_TTL_S", -1)  # ids de transacciones revertidas
+    filtro.quizas_existe(db, 1, "otro", "1.0")
+    assert filtro.estadisticas()["huecos"] == 0
+
+    # Demasiados huecos para seguirlos: el filtro deja de descartar
+    monkeypatch.setattr(modulo, "FILTRO_MAX_HUECOS", 10)
+    db.add(documento(100))
+    db.commit()
+    assert filtro.quizas_existe(db, 1, "otro", "1.0")
+    assert filtro.estadisticas()["desbordado"]
+
+
+def test_desbordado_se_reconstruye_en_segundo_plano(tmp_path, monkeypatch):
+    monkeypatch.setattr(modulo, "FILTRO_DUPLICADOS", True)
+    monkeypatch.setattr(modulo, "FILTRO_SYNC_S", 0)
+    monkeypatch.setattr(modulo, "FILTRO_RECONSTRUIR_S", 0)
+    monkeypatch.setattr(modulo, "FILTRO_MAX_HUECOS", 10)
+    monkeypatch.setattr(modulo, "FILTRO_VENTANA_IDS", 5)
+    # Archivo: la reconstrucción corre en otro hilo con su propia conexión
+    engine = create_engine(f"sqlite:///{tmp_path / 'filtro.db'}")
+    Base.metadata.create_all(bind=engine)
+    Sesion = sessionmaker(bind=engine)
+    with Sesion() as db:
+        db.add(Usuario(id=1, nombre="ana", email="ana@test.com", password_hash="x"))
+        db.add(documento(1))
+        db.commit()
+        filtro = FiltroDuplicados(1024, 0.01)
+        filtro._session_factory = Sesion
+        filtro.reconstruir(db)
+
+        db.add(documento(100))  # 98 ids salteados: más de los que se siguen
+        db.commit()
+        filtro.quizas_existe(db, 1, "otro", "1.0")  # la sincronización desborda y dispara la reconstrucción
+        assert filtro._ultima_reconstruccion
+        limite = time.monotonic() + 10
+        while not (filtro.listo and not filtro._desbordado):
+            assert time.monotonic() < limite, "el filtro no se reconstruyó"
+            time.sleep(0.05)
+
+        # Tras reconstruir solo se siguen los huecos de la ventana y vuelve a descartar
+        assert filtro.estadisticas()["huecos"] == 4  # 96..99
+        assert filtro.quizas_existe(db, 1, f"{100:064x}", "1.0")
+        assert not filtro.quizas_existe(db, 1, "otro", "1.0")
+    engine.dispose()
+
+
+def test_estadisticas_de_un_usuario_no_muestran_a_los_demas(db):
+    db.add(Usuario(id=2, nombre="beto", email="beto@test.com", password_hash="x"))
+    db.add(documento(1))
+    db.commit()
+    filtro = FiltroDuplicados(1024, 0.01)
+    filtro.reconstruir(db)
+
+    assert filtro.estadisticas_usuario(1)["elementos"] == 1
+    propias = filtro.estadisticas_usuario(2)
+    assert (propias["elementos"], propias["capas"]) == (0, 0)
+    assert not {"usuarios", "descartes", "aciertos", "falsos_positivos", "consultas_bd"} & set(propias)
@@ -0,0 +1,95 @@
+# app/test/test_ingesta.py
+# Ingesta de carpetas: un archivo que cuelga a su proceso vence sin frenar
+# al resto, y los que no pasan la validación quedan marcados en el
+# manifiesto para que la siguiente corrida no los vuelva a leer.
+import csv
+import io
+import os
+import pytest
+from PyPDF2 import PdfWriter
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.database import Base
+from app.models import Usuario
+from app.models.manifiesto_ingesta import ManifiestoIngesta
+from app.services.almacenamiento import TMP_DIR, BLOBS_DIR
+from app.utils.ingesta import PoolArchivos, ingesta_local
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    TMP_DIR.mkdir(parents=True)
+    BLOBS_DIR.mkdir(parents=True)
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    session.add(Usuario(id=1, nombre="usuario", email="u@test.com", password_hash="x"))
+    session.commit()
+    yield session
+    session.close()
+
+
+def pdf_valido() -> bytes:
+    salida = io.BytesIO()
+    writer = PdfWriter()
+    writer.add_blank_page(width=100, height=100)
+    writer.write(salida)
+    return salida.getvalue()
+
+
+def filas_reporte(resumen: dict) -> list[dict]:
+    with open(resumen["reporte"], newline="", encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+
+def test_archivo_colgado_vence_sin_frenar_al_resto(db, tmp_path):
+    # Abrir un FIFO sin escritor bloquea: el proceso queda colgado en ese archivo
+    fifo = tmp_path / "colgado.pdf"
+    os.mkfifo(fifo)
+    normales = []
+    for i in range(4):
+        normales.append(tmp_path / f"normal_{i}.png")
+        normales[-1].write_bytes(b"x" * (1000 + i))
+
+    resultados = {}
+    pool = PoolArchivos(workers=2, timeout_s=3)
+    try:
+        for ruta in [fifo, *normales]:
+            pool.enviar(str(ruta), {}, lambda r: resultados.__setitem__(r["ruta"], r))
+        pool.vaciar()
+    finally:
+        pool.cerrar()
+
+    assert resultados[str(fifo)]["detalle"] == "El archivo tardó demasiado en procesarse"
+    assert [resultados[str(r)]["tamano"] for r in normales] == [1000, 1001, 1002, 1003]
+    assert pool.reciclajes == 1
+    # Solo quedan las copias de los archivos procesados, no la del colgado
+    assert sorted(p.name for p in TMP_DIR.iterdir()) == sorted(
+        os.path.basename(resultados[str(r)]["tmp"]) for r in normales
+    )
+
+
+def test_archivo_invalido_queda_en_el_manifiesto(db, tmp_path):
+    carpeta = tmp_path / "origen"
+    carpeta.mkdir()
+    (carpeta / "roto.pdf").write_bytes(b"esto no es un pdf")
+    (carpeta / "bien.png").write_bytes(b"x" * 100)
+
+    primera = ingesta_local(str(carpeta), 1, db, workers=1)
+    assert primera["registrados"] == 1 and primera["corruptos"] == 1
+    entrada = db.query(ManifiestoIngesta).filter(ManifiestoIngesta.ruta == "roto.pdf").one()
+    assert entrada.error and entrada.version is None
+
+    # Sin cambios: no se vuelve a leer, pero sigue en el reporte
+    segunda = ingesta_local(str(carpeta), 1, db, workers=1)
+    assert segunda["sin_cambios"] == 1 and segunda["corruptos"] == 1 and segunda["bytes"] == 0
+    assert "sin cambios desde la ingesta anterior" in filas_reporte(segunda)[0]["detalle"]
+
+    # Corregido: entra como documento nuevo y se limpia la marca
+    (carpeta / "roto.pdf").write_bytes(pdf_valido())
+    tercera = ingesta_local(str(carpeta), 1, db, workers=1)
+    assert tercera["registrados"] == 1 and tercera["corruptos"] == 0
+    db.refresh(entrada)
+    assert entrada.error is None and entrada.version == "1.0"
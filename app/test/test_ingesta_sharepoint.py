@@ -0,0 +1,89 @@
+# app/test/test_ingesta_sharepoint.py
+# Ingesta por streaming contra una biblioteca de SharePoint falsa: los
+# archivos se piden de a uno a medida que hay lugar, los bytes leídos sin
+# escribir nunca superan el tope y todo queda registrado por lotes.
+import asyncio
+from io import BytesIO
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.database import Base
+from app.models import Usuario, Documento
+from app.services.almacenamiento import TMP_DIR, BLOBS_DIR
+from app.utils.ingesta import ingesta_sharepoint
+
+MB = 1024 * 1024
+
+
+class SharePointFalso:
+    """Biblioteca de documentos simulada: entrega cada archivo como un async iterator de bloques."""
+
+    def __init__(self, archivos: int, tamano: int, bloque: int = 256 * 1024):
+        self.archivos = archivos
+        self.tamano = tamano
+        self.bloque = bloque
+        self.pedidos = 0
+        self.abiertos = 0
+        self.max_abiertos = 0
+        self.max_adelanto = 0  # fuentes pedidas por el pipeline antes de terminar las anteriores
+        self.terminados = 0
+
+    async def _contenido(self, i: int):
+        self.abiertos += 1
+        self.max_abiertos = max(self.max_abiertos, self.abiertos)
+        try:
+            enviados = 0
+            while enviados < self.tamano:
+                await asyncio.sleep(0.001)  # latencia de red
+                n = min(self.bloque, self.tamano - enviados)
+                yield (f"{i:08d}".encode() * (n // 8 + 1))[:n]
+                enviados += n
+        finally:
+            self.abiertos -= 1
+            self.terminados += 1
+
+    async def __aiter__(self):
+        for i in range(self.archivos):
+            self.pedidos += 1
+            self.max_adelanto = max(self.max_adelanto, self.pedidos - self.terminados)
+            yield f"Documentos compartidos/informe_{i}.docx", self._contenido(i)
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    TMP_DIR.mkdir(parents=True)
+    BLOBS_DIR.mkdir(parents=True)
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    session.add(Usuario(id=1, nombre="usuario", email="u@test.com", password_hash="x"))
+    session.commit()
+    yield session
+    session.close()
+
+
+def test_topes_de_archivos_y_bytes_en_vuelo(db):
+    fuente = SharePointFalso(archivos=20, tamano=2 * MB)
+    resumen = ingesta_sharepoint(fuente, 1, db, max_bytes_en_vuelo=4 * MB, max_archivos_en_vuelo=3,
+                                 tamano_lote=7)
+    assert resumen["registrados"] == 20
+    assert resumen["bytes"] == 20 * 2 * MB
+    assert db.query(Documento).count() == 20
+    assert fuente.max_abiertos <= 3
+    assert fuente.max_adelanto <= 3
+    assert 0 < resumen["pico_bytes_en_vuelo"] <= 4 * MB
+    assert not list(TMP_DIR.iterdir())  # staging vacío
+
+
+def test_iterador_sincronico_con_duplicados_y_omitidos(db):
+    fuentes = iter([
+        ("a.docx", BytesIO(b"contenido a")),
+        ("copia de a.docx", lambda: BytesIO(b"contenido a")),
+        ("b.docx", [b"contenido ", b"b"]),
+        ("notas.txt", BytesIO(b"no permitido")),
+    ])
+    resumen = ingesta_sharepoint(fuentes, 1, db)
+    assert (resumen["registrados"], resumen["duplicados"], resumen["omitidos"]) == (2, 1, 1)
+    assert {d.nombre_archivo for d in db.query(Documento)} == {"a.docx", "b.docx"}
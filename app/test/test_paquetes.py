@@ -0,0 +1,209 @@
+# app/test/test_paquetes.py
+# Paquetes ZIP/TRD/CCD: metadata.xml define versión y categoría, cada
+# miembro se informa por separado (duplicado, CRC incorrecto, demasiado
+# grande), la subida se ingresa como trabajo sin dejar copias en staging,
+# un trabajo retomado tras la caída de su worker sigue donde quedó y al
+# eliminar el paquete sus miembros quedan como documentos sueltos.
+import csv
+import io
+import zipfile
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.database import Base
+from app.models import Usuario, Documento
+from app.models.trabajo import Trabajo
+from app.api import documentos
+from app.api.auth import get_current_user
+from app.api.documentos import get_db
+from app.services import paquetes
+from app.services.almacenamiento import TMP_DIR, BLOBS_DIR
+from app.services.trabajos import reclamar, ejecutar, recuperar_huerfanos
+
+METADATA = """<?xml version="1.0" encoding="utf-8"?>
+<paquete xmlns="urn:trd">
+  <categoria>Actas</categoria>
+  <version>2.0</version>
+  <documentos>
+    <documento archivo="./Documentos\\Acta1.PNG" version="3.0"/>
+    <documento><ruta>documentos/acta2.png</ruta><categoria>Resoluciones</categoria></documento>
+  </documentos>
+</paquete>
+"""
+
+
+@pytest.fixture
+def entorno(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    TMP_DIR.mkdir(parents=True)
+    BLOBS_DIR.mkdir(parents=True)
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    Sesion = sessionmaker(autoflush=False, bind=engine)
+    db = Sesion()
+    db.add(Usuario(id=1, nombre="ana", email="ana@test.com", password_hash="x"))
+    db.commit()
+    usuario = db.get(Usuario, 1)
+
+    def sesion_db():
+        s = Sesion()
+        try:
+            yield s
+        finally:
+            s.close()
+
+    app = FastAPI()
+    app.include_router(documentos.router)
+    app.dependency_overrides[get_db] = sesion_db
+    app.dependency_overrides[get_current_user] = lambda: usuario
+    yield TestClient(app), Sesion, db
+    db.close()
+
+
+def zip_con(miembros: dict[str, bytes], compresion=zipfile.ZIP_DEFLATED) -> bytes:
+    salida = io.BytesIO()
+    with zipfile.ZipFile(salida, "w", compresion) as zf:
+        for nombre, datos in miembros.items():
+            zf.writestr(nombre, datos)
+    return salida.getvalue()
+
+
+def subir_y_procesar(client, Sesion, contenido: bytes, nombre: str = "expediente.zip") -> Trabajo:
+    r = client.post("/upload-paquete", data={"version": "1.0"}, files={"file": (nombre, contenido)})
+    assert r.status_code == 202
+    with Sesion() as db:
+        trabajo = reclamar(db, "prueba")
+        assert trabajo.id == r.json()["trabajo_id"]
+    ejecutar(Sesion, trabajo)
+    with Sesion() as db:
+        return db.get(Trabajo, trabajo.id)
+
+
+def test_leer_metadata():
+    datos = zip_con({"metadata.xml": METADATA.encode()})
+    with zipfile.ZipFile(io.BytesIO(datos)) as zf:
+        generales, por_archivo = paquetes.leer_metadata(zf)
+
+    assert generales == {"categoria": "Actas", "version": "2.0"}
+    assert por_archivo == {
+        "documentos/acta1.png": {"version": "3.0", "categoria": None},
+        "documentos/acta2.png": {"version": None, "categoria": "Resoluciones"},
+    }
+
+
+def test_metadata_invalido():
+    with zipfile.ZipFile(io.BytesIO(zip_con({"metadata.xml": b"<paquete><version>"}))) as zf:
+        with pytest.raises(paquetes.PaqueteInvalido):
+            paquetes.leer_metadata(zf)
+
+
+def test_paquete_en_segundo_plano_con_errores_por_miembro(entorno, monkeypatch):
+    client, Sesion, db = entorno
+    monkeypatch.setattr(paquetes, "PAQUETE_MAX_MIEMBRO_MB", 1)
+    roto = b"contenido con CRC incorrecto " * 100
+    datos = zip_con({
+        "metadata.xml": METADATA.encode(),
+        "documentos/acta1.png": b"1" * 1000,
+        "documentos/acta2.png": b"2" * 1000,
+        "documentos/copia.png": b"2" * 1000,            # mismo contenido y versión que acta2
+        "documentos/grande.png": b"\0" * (1024 * 1024 + 1),  # comprimido es chico, descomprimido no
+        "documentos/roto.png": roto,
+        "leeme.txt": b"no es un tipo permitido",
+    }, zipfile.ZIP_STORED)
+    datos = datos.replace(roto[:40], b"X" + roto[1:40], 1)  # sin comprimir: se altera el contenido, no el CRC
+
+    trabajo = subir_y_procesar(client, Sesion, datos)
+
+    assert trabajo.estado == "completado", trabajo.error
+    resultado = trabajo.resultado
+    assert (resultado["miembros"], resultado["registrados"], resultado["duplicados"], resultado["omitidos"]) == \
+        (5, 2, 1, 1)
+    assert (resultado["errores"], resultado["corruptos"]) == (2, 2)
+    # Los errores se escriben en el reporte a medida que ocurren, no se juntan en el resultado
+    with open(resultado["reporte"], newline="", encoding="utf-8") as f:
+        errores = {e["nombre_archivo"]: e["tipo_error"] for e in csv.DictReader(f)}
+    assert errores == {"documentos/copia.png": "duplicado", "documentos/grande.png": "corrupto",
+                       "documentos/roto.png": "corrupto"}
+    miembros = {d.nombre_archivo: (d.version, d.categoria) for d in
+                db.query(Documento).filter(Documento.paquete_id == resultado["paquete_id"])}
+    assert miembros == {"acta1.png": ("3.0", "Actas"), "acta2.png": ("2.0", "Resoluciones")}
+    assert not list(TMP_DIR.iterdir())
+
+
+def test_paquete_duplicado_no_deja_la_copia_en_staging(entorno):
+    client, Sesion, _ = entorno
+    datos = zip_con({"acta.png": b"1" * 1000})
+    assert subir_y_procesar(client, Sesion, datos).estado == "completado"
+
+    trabajo = subir_y_procesar(client, Sesion, datos)
+    assert trabajo.estado == "fallido" and "Ya subiste anteriormente" in trabajo.error
+    assert not list(TMP_DIR.iterdir())
+
+
+class Caida(BaseException):
+    """El worker muere: no es un error de la tarea y el trabajo queda en curso."""
+
+
+def test_trabajo_retomado_sigue_el_paquete_a_medias(entorno, monkeypatch):
+    client, Sesion, db = entorno
+    monkeypatch.setattr(paquetes, "PAQUETE_LOTE", 1)
+    validar = paquetes.servicio_validacion.validar_sync
+    llamadas = []
+
+    def validar_y_caer(ruta, extension):
+        llamadas.append(ruta)
+        if len(llamadas) == 2:
+            raise Caida()
+        return validar(ruta, extension)
+
+    monkeypatch.setattr(paquetes.servicio_validacion, "validar_sync", validar_y_caer)
+    datos = zip_con({"a.png": b"1" * 1000, "b.png": b"2" * 1000, "c.png": b"3" * 1000})
+    r = client.post("/upload-paquete", data={"version": "1.0"}, files={"file": ("expediente.zip", datos)})
+    with Sesion() as s:
+        trabajo = reclamar(s, "prueba")
+    with pytest.raises(Caida):
+        ejecutar(Sesion, trabajo)
+    # El paquete y su primer miembro se confirmaron y la copia en staging pasó al almacén
+    assert db.query(Documento).count() == 2
+    assert not list(TMP_DIR.iterdir())
+
+    with Sesion() as s:
+        s.execute(text("UPDATE trabajos SET actualizado_en = datetime('now', '-1 hour') WHERE id = :id"),
+                  {"id": r.json()["trabajo_id"]})
+        s.commit()
+        assert recuperar_huerfanos(s) == 1
+        trabajo = reclamar(s, "otro")
+    ejecutar(Sesion, trabajo)
+
+    with Sesion() as s:
+        trabajo = s.get(Trabajo, trabajo.id)
+    assert trabajo.estado == "completado", trabajo.error
+    assert (trabajo.resultado["registrados"], trabajo.resultado["duplicados"]) == (3, 0)
+    db.expire_all()
+    paquete = db.get(Documento, trabajo.resultado["paquete_id"])
+    assert paquete.nombre_archivo == "expediente.zip"
+    assert sorted(d.nombre_archivo for d in db.query(Documento).filter(Documento.paquete_id == paquete.id)) == \
+        ["a.png", "b.png", "c.png"]
+    assert db.query(Documento).count() == 4
+    assert not list(TMP_DIR.iterdir())
+
+
+def test_archivo_que_no_es_zip(entorno):
+    client, _, db = entorno
+    r = client.post("/upload-paquete", data={"version": "1.0"}, files={"file": ("expediente.zip", b"no soy un zip")})
+    assert r.status_code == 400
+    assert not list(TMP_DIR.iterdir())
+    assert db.query(Trabajo).count() == 0
+
+
+def test_eliminar_paquete_suelta_sus_miembros(entorno):
+    client, Sesion, db = entorno
+    resultado = subir_y_procesar(client, Sesion, zip_con({"a.png": b"1" * 1000, "b.png": b"2" * 1000})).resultado
+
+    assert client.delete(f"/{resultado['paquete_id']}").status_code == 200
+    db.expire_all()
+    assert db.get(Documento, resultado["paquete_id"]) is None
+    assert [d.paquete_id for d in db.query(Documento)] == [None, None]
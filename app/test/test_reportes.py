@@ -0,0 +1,46 @@
+# app/test/test_reportes.py
+# Reporte de errores incremental: lo escrito queda legible aunque el
+# proceso no llegue a cerrar el reporte, las partes rotan por tamaño y el
+# resumen cuenta las filas por tipo_error.
+import csv
+import gzip
+import json
+from app.utils.reportes import ReporteErrores, generar_reporte_errores
+
+
+def test_jsonl_gz_legible_sin_cerrar(tmp_path):
+    reporte = ReporteErrores(formato="jsonl.gz", directorio=tmp_path, flush_filas=10)
+    for i in range(25):
+        reporte.agregar(f"f{i}.pdf", "corrupto", "PDF ilegible")
+    # Sin cerrar (corte a mitad de la ingesta): se recupera lo del último flush
+    with open(reporte.ruta, "rb") as f:
+        datos = gzip.GzipFile(fileobj=f)
+        filas = []
+        try:
+            for linea in datos:
+                filas.append(json.loads(linea))
+        except EOFError:
+            pass  # falta la cola del gzip
+    assert len(filas) == 20
+    assert filas[0] == {"nombre_archivo": "f0.pdf", "tipo_error": "corrupto", "detalle": "PDF ilegible"}
+    reporte.cerrar()
+
+
+def test_rotacion_y_resumen(tmp_path):
+    with ReporteErrores(directorio=tmp_path, max_mb=0) as reporte:  # una parte por fila
+        reporte.agregar("a.pdf", "corrupto", "x")
+        reporte.agregar("b.pdf", "duplicado", "y")
+        reporte.agregar("c.pdf", "duplicado", "z")
+    assert len(reporte.partes) == 3
+    filas = [fila for parte in reporte.partes for fila in csv.DictReader(open(parte, encoding="utf-8"))]
+    assert [f["nombre_archivo"] for f in filas] == ["a.pdf", "b.pdf", "c.pdf"]
+    resumen = json.loads((tmp_path / f"{reporte.nombre}_resumen.json").read_text(encoding="utf-8"))
+    assert resumen["por_tipo_error"] == {"corrupto": 1, "duplicado": 2}
+    assert resumen["total"] == 3 and resumen["completo"]
+
+
+def test_sin_errores_no_hay_archivo_y_nombres_no_chocan(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert generar_reporte_errores([]) is None
+    errores = [{"nombre_archivo": "a.pdf", "tipo_error": "corrupto", "detalle": "x"}]
+    assert generar_reporte_errores(errores) != generar_reporte_errores(errores)
@@ -0,0 +1,123 @@
+# app/test/test_sesiones_carga.py
+# Subida reanudable por sesiones: se reanuda desde el offset confirmado,
+# un offset equivocado o un PUT simultáneo responden 409 sin tocar el
+# .part, /finalizar registra el archivo con su hash y las sesiones
+# abandonadas vencen.
+import asyncio
+import hashlib
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from app.database import Base
+from app.models import Usuario, Documento, SesionCarga
+from app.api import documentos_sesiones
+from app.api.auth import get_current_user
+from app.api.documentos import get_db
+from app.services import sesiones_carga
+from app.services.almacenamiento import TMP_DIR, BLOBS_DIR
+
+CONTENIDO = bytes(range(256)) * 400  # como .png no pasa por la validación de formato
+
+
+@pytest.fixture
+def entorno(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for carpeta in (TMP_DIR, BLOBS_DIR, sesiones_carga.SESIONES_DIR):
+        carpeta.mkdir(parents=True)
+    # Archivo y no memoria: cada sesión usa su propia conexión, como dos peticiones reales
+    engine = create_engine(f"sqlite:///{tmp_path / 'sesiones.db'}", connect_args={"timeout": 30})
+    Base.metadata.create_all(bind=engine)
+    Sesion = sessionmaker(autoflush=False, bind=engine)
+    db = Sesion()
+    db.add(Usuario(id=1, nombre="ana", email="ana@test.com", password_hash="x"))
+    db.commit()
+    usuario = db.get(Usuario, 1)
+
+    def sesion_db():
+        s = Sesion()
+        try:
+            yield s
+        finally:
+            s.close()
+
+    app = FastAPI()
+    app.include_router(documentos_sesiones.router)
+    app.dependency_overrides[get_db] = sesion_db
+    app.dependency_overrides[get_current_user] = lambda: usuario
+    yield TestClient(app), db, Sesion
+    db.close()
+    engine.dispose()
+
+
+def crear(client) -> str:
+    r = client.post("/documentos/sesiones", data={
+        "nombre_archivo": "escaneo.png", "tamano_total": len(CONTENIDO), "version": "1.0"
+    })
+    assert r.status_code == 200
+    return r.json()["sesion_id"]
+
+
+def test_reanudar_y_finalizar(entorno):
+    client, db, _ = entorno
+    sesion_id = crear(client)
+    mitad = len(CONTENIDO) // 2
+
+    assert client.put(f"/documentos/sesiones/{sesion_id}", params={"offset": 0},
+                      content=CONTENIDO[:mitad]).json()["offset"] == mitad
+    # El cliente reintenta un bloque ya confirmado: 409 con el offset desde donde seguir
+    r = client.put(f"/documentos/sesiones/{sesion_id}", params={"offset": 0}, content=CONTENIDO[:mitad])
+    assert r.status_code == 409 and r.json()["detail"]["offset"] == mitad
+    r = client.post(f"/documentos/sesiones/{sesion_id}/finalizar")
+    assert r.status_code == 409 and r.json()["detail"]["offset"] == mitad
+
+    assert client.get(f"/documentos/sesiones/{sesion_id}").json()["offset"] == mitad
+    sesiones_carga._hashes.clear()  # como tras un reinicio: el hash se rehace desde el .part
+    assert client.put(f"/documentos/sesiones/{sesion_id}", params={"offset": mitad},
+                      content=CONTENIDO[mitad:]).json()["offset"] == len(CONTENIDO)
+
+    r = client.post(f"/documentos/sesiones/{sesion_id}/finalizar")
+    assert r.status_code == 200
+    assert r.json()["hash_sha256"] == hashlib.sha256(CONTENIDO).hexdigest()
+    doc = db.get(Documento, r.json()["documento_id"])
+    assert open(doc.ruta_guardado, "rb").read() == CONTENIDO
+    assert client.get(f"/documentos/sesiones/{sesion_id}").json()["estado"] == "finalizada"
+    assert not list(sesiones_carga.SESIONES_DIR.iterdir())
+
+
+def test_bloques_simultaneos_en_el_mismo_offset(entorno):
+    client, _, Sesion = entorno
+    sesion_id = crear(client)
+
+    async def lento(datos: bytes):
+        for i in range(0, len(datos), 1000):
+            await asyncio.sleep(0.001)
+            yield datos[i:i + 1000]
+
+    async def dos_puts():
+        return await asyncio.gather(*(
+            sesiones_carga.escribir_bloque(db_propia, db_propia.get(SesionCarga, sesion_id), 0, lento(CONTENIDO))
+            for db_propia in (Sesion(), Sesion())
+        ), return_exceptions=True)
+
+    resultados = asyncio.run(dos_puts())
+    assert sorted(type(r).__name__ for r in resultados) == ["SesionOcupada", "int"]
+    assert client.post(f"/documentos/sesiones/{sesion_id}/finalizar").json()["hash_sha256"] == \
+        hashlib.sha256(CONTENIDO).hexdigest()
+
+
+def test_sesiones_abandonadas_vencen(entorno):
+    client, db, _ = entorno
+    vieja, nueva = crear(client), crear(client)
+    client.put(f"/documentos/sesiones/{vieja}", params={"offset": 0}, content=CONTENIDO[:100])
+    db.execute(text("UPDATE sesiones_carga SET actualizado_en = datetime('now', '-2 days') WHERE id = :id"),
+               {"id": vieja})
+    db.commit()
+
+    assert sesiones_carga.expirar_sesiones(db) == 1
+    assert client.get(f"/documentos/sesiones/{vieja}").json()["estado"] == "vencida"
+    assert not (sesiones_carga.SESIONES_DIR / f"{vieja}.part").exists()
+    assert (sesiones_carga.SESIONES_DIR / f"{nueva}.part").exists()
+    r = client.put(f"/documentos/sesiones/{vieja}", params={"offset": 100}, content=CONTENIDO[100:200])
+    assert r.status_code == 409
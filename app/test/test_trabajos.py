@@ -0,0 +1,98 @@
+# app/test/test_trabajos.py
+# Cola de trabajos: dos workers nunca toman el mismo trabajo, un trabajo
+# sin latido vuelve a la cola (y el worker que lo perdió no pisa el
+# resultado) y al agotar los intentos queda fallido.
+import threading
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from app.database import Base
+from app.models import Usuario
+from app.models.trabajo import Trabajo
+from app.services import trabajos
+from app.services.trabajos import tarea, encolar, reclamar, recuperar_huerfanos, ejecutar
+
+
+@tarea("prueba")
+def tarea_prueba(db, trabajo, valor: int):
+    return {"valor": valor}
+
+
+@pytest.fixture
+def sesiones(tmp_path):
+    # Archivo y no memoria: cada sesión usa su propia conexión, como procesos distintos
+    engine = create_engine(f"sqlite:///{tmp_path / 'trabajos.db'}", connect_args={"timeout": 30})
+    Base.metadata.create_all(bind=engine)
+    Sesion = sessionmaker(autoflush=False, bind=engine)
+    with Sesion() as db:
+        db.add(Usuario(id=1, nombre="ana", email="ana@test.com", password_hash="x"))
+        db.commit()
+    yield Sesion
+    engine.dispose()
+
+
+def sin_latido(db, trabajo_id: str):
+    db.execute(text("UPDATE trabajos SET actualizado_en = datetime('now', '-1 hour') WHERE id = :id"),
+               {"id": trabajo_id})
+    db.commit()
+
+
+def test_dos_workers_no_toman_el_mismo_trabajo(sesiones):
+    with sesiones() as db:
+        ids = {encolar(db, "prueba", 1, {"valor": i}).id for i in range(30)}
+
+    tomados = {"w1": [], "w2": []}
+
+    def worker(nombre):
+        with sesiones() as db:
+            while (trabajo := reclamar(db, nombre)) is not None:
+                tomados[nombre].append(trabajo.id)
+
+    hilos = [threading.Thread(target=worker, args=(n,)) for n in tomados]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+
+    assert not set(tomados["w1"]) & set(tomados["w2"])
+    assert set(tomados["w1"]) | set(tomados["w2"]) == ids
+    with sesiones() as db:
+        assert {t.intentos for t in db.query(Trabajo)} == {1}
+
+
+def test_trabajo_sin_latido_vuelve_a_la_cola(sesiones):
+    with sesiones() as db:
+        trabajo_id = encolar(db, "prueba", 1, {"valor": 7}).id
+    with sesiones() as db:
+        perdido = reclamar(db, "w1")
+    with sesiones() as db:
+        assert recuperar_huerfanos(db) == 0  # con latido reciente sigue en curso
+        sin_latido(db, trabajo_id)
+        assert recuperar_huerfanos(db) == 1
+    with sesiones() as db:
+        retomado = reclamar(db, "w2")
+        assert retomado.id == trabajo_id and retomado.intentos == 2
+
+    # w1 termina tarde: su resultado no pisa el trabajo que ahora es de w2
+    ejecutar(sesiones, perdido)
+    with sesiones() as db:
+        assert db.get(Trabajo, trabajo_id).estado == "en_curso"
+    ejecutar(sesiones, retomado)
+    with sesiones() as db:
+        trabajo = db.get(Trabajo, trabajo_id)
+        assert trabajo.estado == "completado" and trabajo.resultado == {"valor": 7}
+
+
+def test_agota_los_reintentos(sesiones, monkeypatch):
+    monkeypatch.setattr(trabajos, "TRABAJOS_MAX_INTENTOS", 2)
+    with sesiones() as db:
+        trabajo_id = encolar(db, "prueba", 1, {"valor": 1}).id
+        for intento in (1, 2):
+            assert reclamar(db, f"w{intento}").intentos == intento
+            sin_latido(db, trabajo_id)
+            assert recuperar_huerfanos(db) == (1 if intento == 1 else 0)
+        trabajo = db.get(Trabajo, trabajo_id)
+        db.refresh(trabajo)
+        assert trabajo.estado == "fallido" and "sin terminar" in trabajo.error
+        assert trabajo.terminado_en is not None
+        assert reclamar(db, "w3") is None
@@ -0,0 +1,47 @@
+# app/test/test_validacion.py
+# Pool de validación: el tiempo máximo corre desde que el trabajo empieza
+# (no mientras espera ranura) y un trabajo colgado solo se lleva su proceso.
+import asyncio
+import time
+from app.services.validacion import ServicioValidacion
+
+
+def dormir(segundos: float) -> float:
+    time.sleep(segundos)
+    return segundos
+
+
+def test_la_espera_en_cola_no_cuenta_para_el_timeout():
+    servicio = ServicioValidacion(workers=1, timeout_s=5, memoria_mb=1024)
+    servicio._en_proceso_sync(dormir, 0)  # arrancar el proceso fuera de la medición
+
+    async def tres_trabajos():
+        return await asyncio.gather(*(servicio._en_proceso(dormir, 2) for _ in range(3)))
+
+    try:
+        # 3 trabajos de 2 s en una ranura: el último espera 4 s en cola y no vence
+        assert asyncio.run(tres_trabajos()) == [2, 2, 2]
+        assert servicio.reciclajes == 0
+    finally:
+        servicio.cerrar()
+
+
+def test_trabajo_colgado_solo_mata_su_proceso():
+    servicio = ServicioValidacion(workers=2, timeout_s=3, memoria_mb=1024)
+
+    async def colgado_y_normal():
+        return await asyncio.gather(
+            servicio._en_proceso(dormir, 60),
+            servicio._en_proceso(dormir, 2),
+            return_exceptions=True,
+        )
+
+    try:
+        colgado, normal = asyncio.run(colgado_y_normal())
+        assert isinstance(colgado, TimeoutError)
+        assert normal == 2
+        assert servicio.reciclajes == 1
+        # La ranura reemplazada sigue atendiendo trabajos
+        assert servicio._en_proceso_sync(dormir, 0) == 0
+    finally:
+        servicio.cerrar()
@@ -0,0 +1,130 @@
+# app/test/test_vigilante.py
+# Carpeta vigilada: un archivo que todavía se está escribiendo no se toma,
+# una ráfaga de archivos se registra en un solo lote y un error de base
+# no detiene al vigilante (los archivos se reintentan).
+import threading
+import time
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session, sessionmaker
+from app.database import Base
+from app.models import Usuario, Documento
+from app.services.almacenamiento import TMP_DIR, BLOBS_DIR
+from app.utils import vigilante
+from app.utils.vigilante import Vigilante, FuentePolling
+
+
+class SesionQueFalla(Session):
+    """Sesión cuyo commit falla `fallos` veces, como con la base reiniciándose."""
+    fallos = 0
+
+    def commit(self):
+        if SesionQueFalla.fallos:
+            SesionQueFalla.fallos -= 1
+            raise OperationalError("COMMIT", {}, Exception("server closed the connection unexpectedly"))
+        super().commit()
+
+
+@pytest.fixture
+def entorno(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    TMP_DIR.mkdir(parents=True)
+    BLOBS_DIR.mkdir(parents=True)
+    carpeta = tmp_path / "escaner"
+    carpeta.mkdir()
+    # Archivo y no memoria: cada sesión usa su propia conexión y el test solo ve lo confirmado
+    engine = create_engine(f"sqlite:///{tmp_path / 'vigilante.db'}", connect_args={"timeout": 30})
+    Base.metadata.create_all(bind=engine)
+    Sesion = sessionmaker(autoflush=False, bind=engine, class_=SesionQueFalla)
+    with Sesion() as db:
+        db.add(Usuario(id=1, nombre="usuario", email="u@test.com", password_hash="x"))
+        db.commit()
+    # Sondeo rápido para que el test no espere VIGILANTE_POLL_S
+    monkeypatch.setattr(vigilante, "crear_fuente", lambda raiz, polling=False: FuentePolling(raiz, 0.1))
+    yield carpeta, Sesion
+    SesionQueFalla.fallos = 0
+    engine.dispose()
+
+
+def documentos(Sesion) -> int:
+    with Sesion() as db:
+        return db.query(Documento).count()
+
+
+def esperar(condicion, timeout: float = 30):
+    limite = time.monotonic() + timeout
+    while not condicion():
+        assert time.monotonic() < limite, "tiempo de espera agotado"
+        time.sleep(0.05)
+
+
+class EnSegundoPlano:
+    """Corre Vigilante.ejecutar en un hilo hasta salir del bloque with."""
+
+    def __init__(self, v: Vigilante):
+        self.v = v
+        self.detener = threading.Event()
+        self.hilo = threading.Thread(target=v.ejecutar, args=(self.detener,))
+
+    def __enter__(self):
+        self.hilo.start()
+        esperar(lambda: self.v.al_dia)
+        return self.v
+
+    def __exit__(self, *_):
+        self.detener.set()
+        self.hilo.join(30)
+
+
+def test_archivo_que_se_sigue_escribiendo_no_se_toma(entorno):
+    carpeta, Sesion = entorno
+    v = Vigilante(str(carpeta), 1, Sesion, espera_s=1)
+    ruta = carpeta / "escaneo.png"
+    ruta.write_bytes(b"x" * 1000)
+    v.candidatos[str(ruta)] = (0.0, None)
+
+    v._revisar_candidatos(0.5)  # sin un segundo de calma todavía
+    assert not v.listos
+    v._revisar_candidatos(1.0)  # primera revisión: se anota tamaño/mtime
+    assert not v.listos
+    with open(ruta, "ab") as f:
+        f.write(b"y" * 1000)    # el escáner sigue escribiendo
+    v._revisar_candidatos(2.0)
+    assert not v.listos
+    v._revisar_candidatos(3.0)  # sin cambios desde la revisión anterior
+    assert [r for r, _ in v.listos] == [str(ruta)]
+    assert not v.candidatos
+
+
+def test_rafaga_se_registra_en_un_solo_lote(entorno, monkeypatch):
+    carpeta, Sesion = entorno
+    llamadas = []
+    original = Vigilante._registrar_listos
+    monkeypatch.setattr(Vigilante, "_registrar_listos",
+                        lambda self, *a: llamadas.append(len(self.listos)) or original(self, *a))
+    v = Vigilante(str(carpeta), 1, Sesion, workers=1, espera_s=0.3, agrupar_s=1)
+
+    with EnSegundoPlano(v):
+        for i in range(20):
+            (carpeta / f"hoja_{i:02d}.png").write_bytes(str(i).encode() * 1000)
+        esperar(lambda: documentos(Sesion) == 20)
+
+    assert llamadas == [20]
+
+
+def test_error_de_base_no_detiene_al_vigilante(entorno):
+    carpeta, Sesion = entorno
+    v = Vigilante(str(carpeta), 1, Sesion, workers=1, espera_s=0.2, agrupar_s=0.2)
+
+    with EnSegundoPlano(v):
+        SesionQueFalla.fallos = 1
+        for i in range(3):
+            (carpeta / f"hoja_{i}.png").write_bytes(str(i).encode() * 1000)
+        # Solo se ven filas confirmadas: el primer commit falló y estas son del reintento
+        esperar(lambda: documentos(Sesion) == 3)
+        assert SesionQueFalla.fallos == 0
+        esperar(lambda: v.fallos == 0)  # se pone en cero después del commit que el test ya ve
+
+    # Las copias del lote fallido se borraron; las del reintento pasaron al almacén
+    assert not list(TMP_DIR.iterdir())
@@ -0,0 +1,168 @@
+# app/utils/delta.py
+# Deltas binarios entre dos archivos, solo con la biblioteca estándar.
+# Ambos se cortan en bloques definidos por contenido (los cortes dependen
+# de los bytes, no de la posición, así una inserción no desplaza los
+# bloques que siguen); los bloques del objetivo que están en la base se
+# guardan como COPIA (offset, largo) y el resto como LITERAL. El resultado
+# va comprimido con gzip. Los archivos se leen con mmap: la memoria no
+# depende del tamaño, salvo el índice de bloques de la base.
+#
+# Formato (dentro del gzip): MAGIC, tamaño de la base y del objetivo, y
+# una secuencia de operaciones b"C" + offset + largo | b"L" + largo + bytes.
+import gzip
+import mmap
+import os
+import re
+import struct
+import zlib
+from pathlib import Path
+from app.utils.hashing import HashMultiple, CHUNK_SIZE
+
+MAGIC = b"GDDELTA1"
+ENCABEZADO = struct.Struct(">QQ")  # tamaño de la base, tamaño del objetivo
+COPIA = b"C"
+LITERAL = b"L"
+OP_COPIA = struct.Struct(">QQ")    # offset en la base, largo
+OP_LITERAL = struct.Struct(">Q")   # largo (los bytes van a continuación)
+
+# Candidatos a corte: fin de línea (texto), corridas de ceros y 0xFF
+# seguido de un byte bajo (binarios comprimidos, uno cada ~200 bytes).
+# Se corta en uno de cada ~4 candidatos según el CRC de los bytes previos:
+# la decisión depende solo del contenido cercano, no del corte anterior,
+# así dos archivos que difieren en un punto vuelven a cortar igual enseguida.
+PATRON_CORTE = re.compile(rb"\n+|\x00{2,}|\xff[\x00-\x1f]")
+VENTANA = 16
+MASCARA = 0b11
+MAX_BLOQUE = 16 * 1024
+
+
+class DeltaInvalido(Exception):
+    """El archivo no es un delta de este formato o no corresponde a la base."""
+
+
+def cortes(datos):
+    """(inicio, fin) de cada bloque de `datos`, de hasta MAX_BLOQUE bytes."""
+    inicio, total = 0, len(datos)
+    for m in PATRON_CORTE.finditer(datos):
+        fin = m.end()
+        if zlib.crc32(datos[max(fin - VENTANA, 0):fin]) & MASCARA:
+            continue
+        while fin - inicio > MAX_BLOQUE:
+            yield inicio, inicio + MAX_BLOQUE
+            inicio += MAX_BLOQUE
+        yield inicio, fin
+        inicio = fin
+    while total - inicio > MAX_BLOQUE:
+        yield inicio, inicio + MAX_BLOQUE
+        inicio += MAX_BLOQUE
+    if inicio < total:
+        yield inicio, total
+
+
+def _escribir_literal(salida, objetivo, inicio: int, fin: int):
+    salida.write(LITERAL + OP_LITERAL.pack(fin - inicio))
+    for desde in range(inicio, fin, CHUNK_SIZE):
+        salida.write(objetivo[desde:min(desde + CHUNK_SIZE, fin)])
+
+
+def codificar(ruta_base: Path, ruta_objetivo: Path, destino: Path, limite: int | None = None) -> int | None:
+    """
+    Escribe en `destino` el delta que reconstruye `ruta_objetivo` a partir
+    de `ruta_base` y retorna su tamaño. Si el delta no queda por debajo de
+    `limite` (por defecto, el tamaño del objetivo) no deja nada y retorna
+    None: conviene guardar el archivo completo.
+    """
+    destino = Path(destino)
+    with open(ruta_base, "rb") as fb, open(ruta_objetivo, "rb") as fo:
+        tamano_base = os.fstat(fb.fileno()).st_size
+        tamano_objetivo = os.fstat(fo.fileno()).st_size
+        if not tamano_base or not tamano_objetivo:
+            return None
+        limite = tamano_objetivo if limite is None else limite
+        with mmap.mmap(fb.fileno(), 0, access=mmap.ACCESS_READ) as base, \
+                mmap.mmap(fo.fileno(), 0, access=mmap.ACCESS_READ) as objetivo:
+            indice = {}
+            for inicio, fin in cortes(base):
+                indice.setdefault(hash(base[inicio:fin]), inicio)
+
+            with open(destino, "wb") as crudo:
+                with gzip.GzipFile(fileobj=crudo, mode="wb", compresslevel=6, mtime=0) as salida:
+                    salida.write(MAGIC + ENCABEZADO.pack(tamano_base, tamano_objetivo))
+                    copia = None        # [offset en la base, largo] pendiente de escribir
+                    literal = None      # inicio en el objetivo del literal pendiente
+                    excedido = False
+                    for inicio, fin in cortes(objetivo):
+                        bloque = objetivo[inicio:fin]
+                        offset = indice.get(hash(bloque))
+                        if offset is not None and base[offset:offset + len(bloque)] == bloque:
+                            if literal is not None:
+                                _escribir_literal(salida, objetivo, literal, inicio)
+                                literal = None
+                            if copia and copia[0] + copia[1] == offset:
+                                copia[1] += len(bloque)
+                                continue
+                            if copia:
+                                salida.write(COPIA + OP_COPIA.pack(*copia))
+                            copia = [offset, len(bloque)]
+                        else:
+                            if copia:
+                                salida.write(COPIA + OP_COPIA.pack(*copia))
+                                copia = None
+                            if literal is None:
+                                literal = inicio
+                            if crudo.tell() >= limite:
+                                excedido = True  # ya no conviene: se descarta abajo
+                                break
+                    else:
+                        if literal is not None:
+                            _escribir_literal(salida, objetivo, literal, tamano_objetivo)
+                        if copia:
+                            salida.write(COPIA + OP_COPIA.pack(*copia))
+
+    tamano = destino.stat().st_size
+    if excedido or tamano >= limite:
+        destino.unlink(missing_ok=True)
+        return None
+    return tamano
+
+
+def _leer(entrada, n: int) -> bytes:
+    datos = entrada.read(n)
+    if len(datos) != n:
+        raise DeltaInvalido("Delta truncado")
+    return datos
+
+
+def decodificar(ruta_base: Path, ruta_delta: Path, destino: Path) -> HashMultiple:
+    """
+    Reconstruye en `destino` el archivo original. Retorna sus hashes para
+    que el llamador lo compare con el esperado. Lanza DeltaInvalido.
+    """
+    hasher = HashMultiple()
+    with open(ruta_base, "rb") as base, gzip.open(ruta_delta, "rb") as entrada, open(destino, "wb") as salida:
+        try:
+            if entrada.read(len(MAGIC)) != MAGIC:
+                raise DeltaInvalido("No es un delta")
+            tamano_base, tamano_objetivo = ENCABEZADO.unpack(_leer(entrada, ENCABEZADO.size))
+            if os.fstat(base.fileno()).st_size != tamano_base:
+                raise DeltaInvalido("La base no corresponde al delta")
+            while tipo := entrada.read(1):
+                if tipo == COPIA:
+                    offset, restante = OP_COPIA.unpack(_leer(entrada, OP_COPIA.size))
+                    base.seek(offset)
+                    fuente = base
+                elif tipo == LITERAL:
+                    (restante,) = OP_LITERAL.unpack(_leer(entrada, OP_LITERAL.size))
+                    fuente = entrada
+                else:
+                    raise DeltaInvalido(f"Operación desconocida: {tipo!r}")
+                while restante:
+                    bloque = _leer(fuente, min(CHUNK_SIZE, restante))
+                    hasher.update(bloque)
+                    salida.write(bloque)
+                    restante -= len(bloque)
+        except (OSError, EOFError, struct.error) as e:
+            raise DeltaInvalido(f"Delta ilegible: {e}")
+    if hasher.tamano != tamano_objetivo:
+        raise DeltaInvalido("Delta incompleto")
+    return hasher
@@ -0,0 +1,28 @@
+# app/utils/etapas.py
+# Tiempo acumulado por etapa de una ingesta (lectura y hash, validación,
+# duplicados, registro, commit) para ver dónde se va el tiempo en cargas
+# masivas. Las etapas que corren en los procesos del pool se suman entre
+# todos los procesos, así que pueden superar el tiempo total.
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+class Etapas:
+    def __init__(self):
+        self.segundos = defaultdict(float)
+
+    @contextmanager
+    def medir(self, etapa: str):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.segundos[etapa] += time.perf_counter() - inicio
+
+    def sumar(self, tiempos: dict | None):
+        for etapa, segundos in (tiempos or {}).items():
+            self.segundos[etapa] += segundos
+
+    def resumen(self) -> dict:
+        return {etapa: round(segundos, 2) for etapa, segundos in self.segundos.items()}
@@ -0,0 +1,58 @@
+# app/utils/file_manager.py
+import os
+import tempfile
+from pathlib import Path
+import magic
+from fastapi import UploadFile
+from app.services.almacenamiento import ejecutor_almacenamiento
+from app.utils.hashing import HashMultiple, CHUNK_SIZE
+
+
+class ArchivoDemasiadoGrande(Exception):
+    """Se lanza cuando un archivo supera el tamaño máximo permitido."""
+
+
+async def guardar_upload_por_bloques(file: UploadFile, carpeta: Path, max_bytes: int):
+    """
+    Lee el UploadFile en bloques de tamaño fijo y los escribe en un archivo
+    temporal dentro de `carpeta`, actualizando los hashes (MD5 y SHA-256 en
+    una sola pasada) y el contador de bytes a medida que llegan.
+    Aborta en cuanto se supera `max_bytes`.
+
+    La memoria usada por subida es constante (un bloque), sin importar
+    el tamaño del archivo. Las operaciones de disco corren en el pool de
+    almacenamiento para no bloquear el event loop.
+
+    Retorna (ruta_temporal, hashes, tamano_bytes) con hashes = {"md5", "sha256"}.
+    """
+    if file.size is not None and file.size > max_bytes:
+        raise ArchivoDemasiadoGrande(f"El archivo supera el máximo de {max_bytes} bytes")
+
+    hasher = HashMultiple()
+    ejecutar = ejecutor_almacenamiento.ejecutar
+    fd, tmp = await ejecutar(tempfile.mkstemp, dir=carpeta, suffix=".part")
+    ruta_tmp = Path(tmp)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            while True:
+                bloque = await file.read(CHUNK_SIZE)
+                if not bloque:
+                    break
+                if hasher.tamano + len(bloque) > max_bytes:
+                    raise ArchivoDemasiadoGrande(f"El archivo supera el máximo de {max_bytes} bytes")
+                hasher.update(bloque)
+                await ejecutar(f.write, bloque)
+    except BaseException:
+        ruta_tmp.unlink(missing_ok=True)
+        raise
+
+    return ruta_tmp, hasher.resultado(), hasher.tamano
+
+
+def detectar_tipo(ruta: Path) -> str:
+    """Tipo MIME según el contenido (libmagic)."""
+    try:
+        mime = magic.Magic(mime=True)
+        return mime.from_file(str(ruta))
+    except Exception:
+        return "desconocido"
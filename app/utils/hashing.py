@@ -0,0 +1,50 @@
+# app/utils/hashing.py
+import hashlib
+from pathlib import Path
+
+CHUNK_SIZE = 1024 * 1024  # 1 MB por bloque
+
+
+class HashMultiple:
+    """
+    Calcula MD5 y SHA-256 en una sola pasada sobre los bloques.
+    SHA-256 es el hash fuerte (deduplicación y almacén por contenido);
+    MD5 se conserva por compatibilidad con registros anteriores.
+    """
+
+    def __init__(self):
+        self._md5 = hashlib.md5()
+        self._sha256 = hashlib.sha256()
+        self.tamano = 0
+
+    def update(self, bloque: bytes):
+        self._md5.update(bloque)
+        self._sha256.update(bloque)
+        self.tamano += len(bloque)
+
+    @property
+    def md5(self) -> str:
+        return self._md5.hexdigest()
+
+    @property
+    def sha256(self) -> str:
+        return self._sha256.hexdigest()
+
+    def resultado(self) -> dict:
+        return {"md5": self.md5, "sha256": self.sha256}
+
+
+def hash_de_archivo(ruta: Path, limite: int | None = None) -> HashMultiple:
+    """Hashea un archivo en disco por bloques (hasta `limite` bytes si se indica)."""
+    hasher = HashMultiple()
+    restante = limite
+    with open(ruta, "rb") as f:
+        while restante is None or restante > 0:
+            leer = CHUNK_SIZE if restante is None else min(CHUNK_SIZE, restante)
+            bloque = f.read(leer)
+            if not bloque:
+                break
+            hasher.update(bloque)
+            if restante is not None:
+                restante -= len(bloque)
+    return hasher
@@ -1,53 +1,718 @@
+import asyncio
+import os
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
-from fastapi import UploadFile
-from app.api.documentos import upload_file as upload_endpoint
-from app.utils.reportes import generar_reporte_errores
-from io import BytesIO
+from decouple import config
+from starlette.concurrency import run_in_threadpool
+from app.models.usuario import Usuario
+from app.services.almacenamiento import TMP_DIR, borrar, ejecutor_almacenamiento
+from app.services.document_service import versiones_existentes, registrar_documento
+from app.services.validacion import ProcesoAislado, VALIDACION_MEMORIA_MB, ArchivoInvalido, servicio_validacion
+from app.services import manifiesto
+from app.services.paquetes import ingerir_paquete, cerrar_reporte
+from app.utils.ingesta_archivos import procesar_archivo
+from app.utils.reportes import ReporteErrores, REPORTE_FORMATO
+from app.services.trabajos import tarea, encolar
+from app.utils.hashing import HashMultiple, CHUNK_SIZE
+from app.utils.etapas import Etapas
+from app.utils.validaciones import ALLOWED_EXTENSIONS
 
-def ingesta_local(carpeta: str, usuario_id: int, db):
+# Procesos que hashean y validan en paralelo, y filas por commit
+INGESTA_WORKERS = config("INGESTA_WORKERS", default=os.cpu_count() or 2, cast=int)
+INGESTA_LOTE = config("INGESTA_LOTE", default=500, cast=int)
+# Tiempo máximo para copiar, hashear y validar un archivo
+INGESTA_TIMEOUT_S = config("INGESTA_TIMEOUT_S", default=300, cast=int)
+EN_VUELO_POR_WORKER = 4  # archivos encolados por proceso: acota la memoria con carpetas enormes
+BLOQUE_MANIFIESTO = 1000  # rutas por consulta al manifiesto
+# Ingesta por streaming (SharePoint): bytes leídos sin escribir y archivos en curso a la vez
+SHAREPOINT_MAX_MB_EN_VUELO = config("SHAREPOINT_MAX_MB_EN_VUELO", default=64, cast=int)
+SHAREPOINT_MAX_ARCHIVOS_EN_VUELO = config("SHAREPOINT_MAX_ARCHIVOS_EN_VUELO", default=8, cast=int)
+_FIN = object()
+
+
+def recorrer_carpeta(carpeta: str):
+    """
+    Recorre `carpeta` recursivamente con os.scandir y entrega los archivos
+    de a uno (generador): en memoria solo quedan los directorios pendientes.
+    No sigue enlaces simbólicos. Entrega (ruta, stat, None) o
+    (ruta, None, error) si un archivo o directorio no se pudo leer.
+    """
+    pendientes = [str(carpeta)]
+    while pendientes:
+        actual = pendientes.pop()
+        try:
+            with os.scandir(actual) as entradas:
+                for entrada in entradas:
+                    try:
+                        if entrada.is_dir(follow_symlinks=False):
+                            pendientes.append(entrada.path)
+                        elif entrada.is_file(follow_symlinks=False):
+                            yield entrada.path, entrada.stat(follow_symlinks=False), None
+                    except OSError as e:
+                        yield entrada.path, None, str(e)
+        except OSError as e:
+            if actual == str(carpeta):
+                raise
+            yield actual, None, str(e)
+
+
+class EstadoIngesta:
+    """
+    Estado de una corrida de ingesta: lote pendiente, contadores y el
+    reporte de errores, que se escribe a medida que ocurren.
+    Con `simulacion` se hace todo salvo registrar: no se mueve nada al
+    almacén, no se actualiza el manifiesto y cada lote termina en rollback.
+    """
+
+    def __init__(self, db, usuario, raiz, version, categoria, tamano_lote, progreso, incremental,
+                 simulacion: bool = False, formato_reporte: str = REPORTE_FORMATO):
+        self.db = db
+        self.raiz = raiz
+        self.incremental = incremental
+        self.simulacion = simulacion
+        self.usuario = usuario
+        self.version = version
+        self.categoria = categoria
+        self.tamano_lote = tamano_lote
+        self.progreso = progreso
+        self.lote = []
+        self.invalidos = []  # corruptos a marcar en el manifiesto con el próximo lote
+        self.reporte = ReporteErrores("ingesta", formato_reporte)
+        self.archivos = 0
+        self.registrados = 0
+        self.duplicados = 0
+        self.modificados = 0
+        self.sin_cambios = 0
+        self.omitidos = 0
+        self.bytes = 0
+        self.etapas = Etapas()
+        self.inicio = time.monotonic()
+
+    def error(self, ruta: str, tipo_error: str, detalle: str):
+        self.reporte.agregar(ruta, tipo_error, detalle)
+
+    def resultado_archivo(self, res: dict):
+        self.archivos += 1
+        if "tipo_error" in res:
+            self.error(res["ruta"], res["tipo_error"], res["detalle"])
+            if res["tipo_error"] == "corrupto" and "stat" in res and self.incremental and not self.simulacion:
+                self.invalidos.append(res)
+        else:
+            self.bytes += res["tamano"]
+            self.etapas.sumar(res.get("tiempos"))
+            self.lote.append(res)
+        if len(self.lote) + len(self.invalidos) >= self.tamano_lote:
+            self.registrar_lote()
+        if self.progreso:
+            self.progreso(self.archivos)
+
+    def version_para(self, r: dict) -> str:
+        """Archivo nuevo: la versión pedida. Modificado: la siguiente a la registrada."""
+        previa = r["manifiesto"]
+        return manifiesto.siguiente_version(previa.version) if previa and previa.version else self.version
+
+    def guardar_manifiesto(self, r: dict, version: str | None):
+        if self.incremental and not self.simulacion:
+            manifiesto.guardar(self.db, self.usuario.id, self.raiz, r["relativa"], r["stat"],
+                               r["hashes"]["sha256"], version, r["manifiesto"])
+
+    def registrar_lote(self):
+        """Duplicados en una sola consulta y un commit para todo el lote (con su manifiesto)."""
+        if not self.lote and not self.invalidos:
+            return
+        lote, self.lote = self.lote, []
+        invalidos, self.invalidos = self.invalidos, []
+        try:
+            for r in invalidos:
+                # La próxima corrida lo salta (y lo reporta) mientras no cambie
+                previa = r["manifiesto"]
+                manifiesto.guardar(self.db, self.usuario.id, self.raiz, r["relativa"], r["stat"],
+                                   r.get("hashes", {}).get("sha256", ""), previa.version if previa else None,
+                                   previa, error=r["detalle"])
+            with self.etapas.medir("duplicados"):
+                existentes = versiones_existentes(
+                    self.db, self.usuario.id, [(r["hashes"]["sha256"], self.version_para(r)) for r in lote]
+                )
+            inicio_registro = time.perf_counter()
+            for r in lote:
+                previa = r["manifiesto"]
+                if previa and not previa.error and previa.hash_sha256 == r["hashes"]["sha256"]:
+                    # Solo cambió la fecha (copia, touch): mismo contenido
+                    _descartar(r)
+                    self.sin_cambios += 1
+                    self.guardar_manifiesto(r, previa.version)
+                    continue
+                version = self.version_para(r)
+                clave = (r["hashes"]["sha256"], version)
+                if clave in existentes:
+                    _descartar(r)
+                    self.duplicados += 1
+                    self.error(r["ruta"], "duplicado", f"Ya existe con la versión '{version}'")
+                    self.guardar_manifiesto(r, previa.version if previa else version)
+                    continue
+                existentes.add(clave)
+                if not self.simulacion:
+                    # registrar_documento agrega también la entrada en HistorialDocumento
+                    registrar_documento(
+                        self.db,
+                        self.usuario,
+                        nombre_archivo=Path(r["ruta"]).name,
+                        extension=Path(r["ruta"]).suffix.lower(),
+                        version=version,
+                        categoria=self.categoria,
+                        hashes=r["hashes"],
+                        ruta_temporal=Path(r["tmp"]),
+                        tamano_bytes=r["tamano"],
+                        commit=False,
+                    )
+                else:
+                    _descartar(r)
+                self.guardar_manifiesto(r, version)
+                if previa and previa.version:
+                    self.modificados += 1
+                else:
+                    self.registrados += 1
+            self.etapas.segundos["registro"] += time.perf_counter() - inicio_registro
+            with self.etapas.medir("commit"):
+                if self.simulacion:
+                    self.db.rollback()
+                else:
+                    self.db.commit()
+        except Exception:
+            self.db.rollback()
+            for r in lote:
+                _descartar(r)
+            raise
+
+    def abandonar(self):
+        """Tras un error: borra las copias en staging que no se registraron y cierra el reporte como incompleto."""
+        for r in self.lote:
+            _descartar(r)
+        self.lote, self.invalidos = [], []
+        self.reporte.cerrar(completo=False)
+
+    def resumen(self) -> dict:
+        segundos = max(time.monotonic() - self.inicio, 1e-6)
+        return {
+            "archivos": self.archivos,
+            "registrados": self.registrados,
+            "modificados": self.modificados,
+            "sin_cambios": self.sin_cambios,
+            "duplicados": self.duplicados,
+            "errores": self.reporte.filas - self.duplicados,
+            "corruptos": self.reporte.conteo["corrupto"],
+            "omitidos": self.omitidos,
+            "bytes": self.bytes,
+            "segundos": round(segundos, 2),
+            "archivos_por_s": round(self.archivos / segundos, 1),
+            "mb_por_s": round(self.bytes / (1024 * 1024) / segundos, 2),
+            "etapas_s": self.etapas.resumen(),
+            "simulacion": self.simulacion,
+        }
+
+
+def _descartar(r: dict):
+    """Borra la copia en staging de un resultado (en simulación no hay copia)."""
+    if r["tmp"]:
+        borrar(r["tmp"])
+
+
+def _descartar_resultado(r: dict):
+    """al_terminar de PoolArchivos.descartar: el resultado no se entrega, solo se borra su copia."""
+    if r.get("tmp"):
+        borrar(r["tmp"])
+
+
+class _EnVuelo:
+    __slots__ = ("futuro", "ruta", "datos", "al_terminar", "tmp", "enviado")
+
+    def __init__(self, futuro, ruta, datos, al_terminar, tmp):
+        self.futuro = futuro
+        self.ruta = ruta
+        self.datos = datos
+        self.al_terminar = al_terminar
+        self.tmp = tmp
+        self.enviado = time.monotonic()
+
+
+class PoolArchivos:
+    """
+    Pool de procesos para procesar_archivo con a lo sumo
+    EN_VUELO_POR_WORKER archivos por proceso en vuelo: quien envía espera
+    cuando el pool está lleno. Cada resultado se entrega a `al_terminar`.
+    Como en la validación, cada proceso es un ProcesoAislado: un archivo
+    que pasa INGESTA_TIMEOUT_S procesándose (contados desde que empieza,
+    no desde que entra en cola) o que mata su proceso se reporta como
+    corrupto y solo se reemplaza ese proceso; lo que esperaba detrás se
+    reenvía.
+    """
+
+    def __init__(self, workers: int, copiar: bool = True, timeout_s: int = INGESTA_TIMEOUT_S):
+        self.workers = workers
+        self.copiar = copiar
+        self.timeout_s = timeout_s
+        self.reciclajes = 0
+        self._procesos = [self._nuevo_proceso() for _ in range(workers)]
+        self._colas = [deque() for _ in range(workers)]  # _EnVuelo en orden de ejecución
+        self._fin_anterior = [0.0] * workers  # cuándo terminó el último archivo de cada proceso
+
+    @staticmethod
+    def _nuevo_proceso() -> ProcesoAislado:
+        return ProcesoAislado(VALIDACION_MEMORIA_MB, tareas_por_proceso=None)
+
+    def _someter(self, i: int, ruta: str, datos: dict, al_terminar, tmp: str | None) -> _EnVuelo:
+        proceso = self._procesos[i]
+        futuro = proceso.pool.submit(procesar_archivo, ruta, str(TMP_DIR), self.copiar, tmp)
+
+        def marcar_fin(_):
+            if self._procesos[i] is proceso:  # no los futuros del proceso que se mató
+                self._fin_anterior[i] = time.monotonic()
+
+        futuro.add_done_callback(marcar_fin)
+        return _EnVuelo(futuro, ruta, datos, al_terminar, tmp)
+
+    def _reemplazar(self, i: int, motivo: str):
+        """
+        Mata el proceso `i`, reporta su archivo en curso como corrupto y
+        reenvía los que esperaban detrás (no llegaron a correr).
+        """
+        cola = self._colas[i]
+        self._procesos[i].matar()
+        self._procesos[i] = self._nuevo_proceso()
+        self._fin_anterior[i] = 0.0
+        self.reciclajes += 1
+        colgado = cola.popleft()
+        if colgado.tmp:
+            borrar(colgado.tmp)
+        colgado.al_terminar({**colgado.datos, "ruta": colgado.ruta, "tipo_error": "corrupto", "detalle": motivo})
+        pendientes = list(cola)
+        cola.clear()
+        for e in pendientes:
+            cola.append(self._someter(i, e.ruta, e.datos, e.al_terminar, e.tmp))
+
+    def _recoger(self, i: int):
+        """Entrega los archivos terminados al frente de la cola del proceso `i`."""
+        cola = self._colas[i]
+        while cola and cola[0].futuro.done():
+            e = cola[0]
+            try:
+                resultado = e.futuro.result()
+            except BrokenProcessPool:
+                # El proceso murió (memoria, crash) con este archivo
+                self._reemplazar(i, "Archivo corrupto o no procesable")
+                continue
+            except Exception as ex:
+                if e.tmp:
+                    borrar(e.tmp)
+                resultado = {"ruta": e.ruta, "tipo_error": "ilegible", "detalle": str(ex)}
+            cola.popleft()
+            e.al_terminar({**resultado, **e.datos})
+
+    def _esperar(self):
+        """Espera a que termine algún archivo o a que venza el que corre en algún proceso."""
+        activos = [i for i, cola in enumerate(self._colas) if cola]
+        if not activos:
+            return
+        vencimientos = {
+            i: max(self._colas[i][0].enviado, self._fin_anterior[i]) + self.timeout_s for i in activos
+        }
+        espera = max(0.0, min(vencimientos.values()) - time.monotonic())
+        wait([self._colas[i][0].futuro for i in activos], timeout=espera, return_when=FIRST_COMPLETED)
+        for i in activos:
+            self._recoger(i)
+            cola = self._colas[i]
+            # El mismo archivo sigue al frente y sin terminar pasado su plazo: colgado
+            if cola and not cola[0].futuro.done() and \
+                    time.monotonic() >= max(cola[0].enviado, self._fin_anterior[i]) + self.timeout_s:
+                self._reemplazar(i, "El archivo tardó demasiado en procesarse")
+
+    def enviar(self, ruta: str, datos: dict, al_terminar):
+        while sum(len(c) for c in self._colas) >= self.workers * EN_VUELO_POR_WORKER:
+            self._esperar()
+        tmp = None
+        if self.copiar:
+            # La copia la nombra este proceso: si hay que matar al worker se puede borrar
+            fd, tmp = tempfile.mkstemp(dir=TMP_DIR, suffix=".part")
+            os.close(fd)
+        i = min(range(self.workers), key=lambda j: len(self._colas[j]))
+        try:
+            self._colas[i].append(self._someter(i, ruta, datos, al_terminar, tmp))
+        except BrokenProcessPool:
+            self._procesos[i].matar()
+            self._procesos[i] = self._nuevo_proceso()
+            self._colas[i].append(self._someter(i, ruta, datos, al_terminar, tmp))
+
+    def vaciar(self):
+        """Espera todo lo que está en vuelo."""
+        while any(self._colas):
+            self._esperar()
+
+    def descartar(self):
+        """Espera lo que está en vuelo y borra sus copias sin entregar los resultados."""
+        for cola in self._colas:
+            for e in cola:
+                e.al_terminar = _descartar_resultado
+        self.vaciar()
+
+    def cerrar(self):
+        for proceso in self._procesos:
+            proceso.pool.shutdown(wait=True, cancel_futures=True)
+
+
+def nueva_ingesta(db, usuario_id: int, carpeta: str, version: str = "1.0", categoria: str | None = None,
+                  tamano_lote: int | None = None, progreso=None, incremental: bool = True,
+                  simulacion: bool = False, formato_reporte: str = REPORTE_FORMATO) -> EstadoIngesta:
+    usuario = db.get(Usuario, usuario_id)
+    if usuario is None:
+        raise ValueError(f"Usuario {usuario_id} no existe")
+    raiz = str(Path(carpeta).resolve())
+    return EstadoIngesta(db, usuario, raiz, version, categoria, tamano_lote or INGESTA_LOTE, progreso, incremental,
+                         simulacion, formato_reporte)
+
+
+def procesar_bloque(estado: EstadoIngesta, pool: PoolArchivos, bloque: list):
+    """
+    `bloque` son pares (ruta, stat). Consulta el manifiesto una vez para
+    todo el bloque y envía al pool solo lo nuevo o modificado.
+    """
+    relativas = [manifiesto.ruta_relativa(estado.raiz, ruta) for ruta, _ in bloque]
+    conocidos = manifiesto.consultar(estado.db, estado.usuario.id, estado.raiz, relativas) if estado.incremental else {}
+    for (ruta, st), relativa in zip(bloque, relativas):
+        previa = conocidos.get(relativa)
+        if manifiesto.sin_cambios(previa, st):
+            estado.archivos += 1
+            if previa.error:
+                estado.error(ruta, "corrupto", f"{previa.error} (sin cambios desde la ingesta anterior)")
+            else:
+                estado.sin_cambios += 1
+            if estado.progreso:
+                estado.progreso(estado.archivos)
+            continue
+        pool.enviar(ruta, {"relativa": relativa, "stat": st, "manifiesto": previa}, estado.resultado_archivo)
+
+
+def cerrar_ingesta(estado: EstadoIngesta, etiqueta: str) -> dict:
+    """Resumen con rendimiento; cierra el reporte de errores (si hubo) y agrega su ruta."""
+    resumen = estado.resumen()
+    print(f"{etiqueta}: {resumen['archivos']} archivos en {resumen['segundos']} s "
+          f"({resumen['archivos_por_s']} archivos/s, {resumen['mb_por_s']} MB/s)")
+
+    info = estado.reporte.cerrar()
+    if estado.reporte.ruta:
+        resumen["reporte"] = estado.reporte.ruta
+        resumen["reporte_resumen"] = info["ruta_resumen"]
+        print(f"Reporte de errores generado: {estado.reporte.ruta}")
+
+    return resumen
+
+
+def ingesta_local(carpeta: str, usuario_id: int, db, version: str = "1.0", categoria: str | None = None,
+                  workers: int | None = None, tamano_lote: int | None = None, progreso=None,
+                  incremental: bool = True, simulacion: bool = False, formato_reporte: str = REPORTE_FORMATO):
+    """
+    HU3: Ingresa todos los archivos de una carpeta local (recursivo).
+    HU5: Genera reporte de errores (duplicados, corruptos o ilegibles).
+
+    El recorrido es un generador y solo hay unos pocos archivos por proceso
+    en vuelo, así que la memoria no depende de la cantidad de archivos.
+    Hash (copiando a staging en la misma lectura) y validación corren en
+    un pool de procesos; los registros se insertan por lotes de
+    `tamano_lote`. `progreso(n)` recibe la cantidad de archivos procesados.
+    Los originales no se mueven ni se modifican.
+
+    Con `incremental` se usa el manifiesto de la carpeta: los archivos con
+    el mismo tamaño, mtime e inodo que la vez anterior se saltan sin
+    leerlos, y los modificados se registran como versión siguiente.
+    Con `simulacion` los archivos se leen, hashean y validan en su lugar
+    y se cuentan duplicados, pero no se copia ni se registra nada.
+    Retorna el resumen con archivos/s, MB/s y segundos por etapa.
+    """
+    estado = nueva_ingesta(db, usuario_id, carpeta, version, categoria, tamano_lote, progreso, incremental,
+                           simulacion, formato_reporte)
+    return ingresar_carpeta(estado, carpeta, workers)
+
+
+def ingresar_carpeta(estado: EstadoIngesta, carpeta: str, workers: int | None = None) -> dict:
+    """Recorrido y pool de ingesta_local sobre un estado ya creado (ver nueva_ingesta)."""
+    pool = PoolArchivos(workers or INGESTA_WORKERS, copiar=not estado.simulacion)
+    bloque = []
+    try:
+        for ruta, st, error in recorrer_carpeta(carpeta):
+            if error:
+                estado.archivos += 1
+                estado.error(ruta, "ilegible", error)
+                continue
+            if Path(ruta).suffix.lower() not in ALLOWED_EXTENSIONS:
+                estado.omitidos += 1
+                continue
+            bloque.append((ruta, st))
+            if len(bloque) >= BLOQUE_MANIFIESTO:
+                procesar_bloque(estado, pool, bloque)
+                bloque = []
+        procesar_bloque(estado, pool, bloque)
+        pool.vaciar()
+        estado.registrar_lote()
+    except BaseException:
+        estado.reporte.cerrar(completo=False)  # lo reportado hasta el corte queda en disco
+        raise
+    finally:
+        pool.cerrar()
+
+    return cerrar_ingesta(estado, f"Ingesta de {carpeta}")
+
+
+def ingesta_paquete(ruta: str, usuario_id: int, db, version: str = "1.0", categoria: str | None = None,
+                    simulacion: bool = False, progreso=None, tamano_lote: int | None = None,
+                    formato_reporte: str = REPORTE_FORMATO):
+    """
+    Ingresa un paquete ZIP/TRD/CCD local y sus miembros (ver app/services/paquetes.py).
+    El paquete original no se mueve: se copia una vez a staging mientras se
+    hashea (en simulación se lee en su lugar y no se copia).
+    """
+    usuario = db.get(Usuario, usuario_id)
+    if usuario is None:
+        raise ValueError(f"Usuario {usuario_id} no existe")
+    copia = procesar_archivo(str(ruta), str(TMP_DIR), copiar=not simulacion)
+    if "tipo_error" in copia:
+        raise ValueError(copia["detalle"])
+    reporte = ReporteErrores("ingesta_paquete", formato_reporte)
+    try:
+        resultado = ingerir_paquete(db, usuario, Path(copia["tmp"] or ruta), Path(ruta).name, copia["hashes"],
+                                    copia["tamano"], version, categoria, ALLOWED_EXTENSIONS, reporte,
+                                    simulacion=simulacion, progreso=progreso, tamano_lote=tamano_lote)
+    except BaseException:
+        reporte.cerrar(completo=False)  # lo reportado hasta el corte queda en disco
+        _descartar(copia)
+        raise
+    resultado = cerrar_reporte(resultado, reporte)
+    if reporte.ruta:
+        print(f"Reporte de errores generado: {reporte.ruta}")
+    return resultado
+
+
+class PresupuestoBytes:
+    """
+    Tope de bytes leídos de las fuentes que todavía no se escribieron en
+    staging. Quien toma espera mientras el tope esté lleno; si no hay nada
+    tomado siempre se puede avanzar (un bloque mayor que el tope no traba).
+    """
+
+    def __init__(self, maximo: int):
+        self.maximo = maximo
+        self.usado = 0
+        self.pico = 0
+        self._cambio = asyncio.Condition()
+
+    async def tomar(self, n: int):
+        async with self._cambio:
+            await self._cambio.wait_for(lambda: self.usado == 0 or self.usado + n <= self.maximo)
+            self.sumar(n)
+
+    def sumar(self, n: int):
+        """Cuenta `n` bytes sin esperar (el bloque ya llegó más grande de lo reservado)."""
+        self.usado += n
+        self.pico = max(self.pico, self.usado)
+
+    async def liberar(self, n: int):
+        async with self._cambio:
+            self.usado -= n
+            self._cambio.notify_all()
+
+
+async def _iterar(fuentes):
+    """Recorre un iterable síncrono o asíncrono sin bloquear el event loop."""
+    if hasattr(fuentes, "__aiter__"):
+        async for fuente in fuentes:
+            yield fuente
+        return
+    iterador = iter(fuentes)
+    while (fuente := await run_in_threadpool(next, iterador, _FIN)) is not _FIN:
+        yield fuente
+
+
+async def _bloques(origen, presupuesto: PresupuestoBytes):
     """
-    HU3: Lee todos los archivos de una carpeta local y los sube al sistema.
-    HU5: Genera reporte de errores (duplicados o corruptos)
+    Entrega el contenido de `origen` por bloques, reservando CHUNK_SIZE en
+    el presupuesto antes de pedir cada uno: si el tope está lleno la fuente
+    no se lee (contrapresión). Quien consume libera con `presupuesto.liberar`.
     """
-    folder = Path(carpeta)
-    errores = []
+    if isinstance(origen, (bytes, bytearray)):
+        # Contenido ya en memoria (compatibilidad con la lista de tuplas)
+        origen = [bytes(origen)]
+    if hasattr(origen, "__aiter__"):
+        iterador = origen.__aiter__()
+        siguiente = iterador.__anext__
+    elif hasattr(origen, "read"):
+        async def siguiente():
+            bloque = await run_in_threadpool(origen.read, CHUNK_SIZE)
+            if not bloque:
+                raise StopAsyncIteration
+            return bloque
+    else:
+        iterador = iter(origen)
+
+        async def siguiente():
+            bloque = await run_in_threadpool(next, iterador, _FIN)
+            if bloque is _FIN:
+                raise StopAsyncIteration
+            return bloque
+    while True:
+        await presupuesto.tomar(CHUNK_SIZE)
+        try:
+            bloque = await siguiente()
+        except StopAsyncIteration:
+            await presupuesto.liberar(CHUNK_SIZE)
+            return
+        except BaseException:
+            await presupuesto.liberar(CHUNK_SIZE)
+            raise
+        if len(bloque) > CHUNK_SIZE:
+            presupuesto.sumar(len(bloque) - CHUNK_SIZE)
+        elif len(bloque) < CHUNK_SIZE:
+            await presupuesto.liberar(CHUNK_SIZE - len(bloque))
+        if not bloque:
+            continue
+        yield bloque
+
+
+async def _cerrar_origen(origen):
+    if hasattr(origen, "aclose"):
+        await origen.aclose()
+    elif hasattr(origen, "close"):
+        await run_in_threadpool(origen.close)
 
-    for file_path in folder.iterdir():
-        if file_path.is_file():
-            with open(file_path, "rb") as f:
-                upload_file_obj = UploadFile(filename=file_path.name, file=f)
-                try:
-                    upload_endpoint(file=upload_file_obj, usuario_id=usuario_id, db=db)
-                except Exception as e:
-                    errores.append({
-                        "nombre_archivo": file_path.name,
-                        "tipo_error": "duplicado/corrupto",
-                        "detalle": str(e)
-                    })
 
-    if errores:
-        reporte = generar_reporte_errores(errores)
-        print(f"Reporte de errores generado: {reporte}")
+def _escribir(f, hasher: HashMultiple, bloque: bytes):
+    hasher.update(bloque)
+    f.write(bloque)
+
+
+async def _copiar_fuente(nombre: str, origen, presupuesto: PresupuestoBytes) -> dict:
+    """
+    Lleva una fuente a staging calculando los hashes y la valida. Retorna
+    {"ruta", "tmp", "tamano", "hashes"} o {"ruta", "tipo_error", "detalle"}
+    como procesar_archivo, para registrarla igual que la ingesta local.
+    """
+    extension = Path(nombre).suffix.lower()
+    hasher = HashMultiple()
+    fd, tmp = tempfile.mkstemp(dir=TMP_DIR, suffix=".part")
+    try:
+        if callable(origen):
+            origen = await run_in_threadpool(origen)  # apertura diferida: recién cuando hay lugar
+        try:
+            with os.fdopen(fd, "wb") as f:
+                async for bloque in _bloques(origen, presupuesto):
+                    try:
+                        await ejecutor_almacenamiento.ejecutar(_escribir, f, hasher, bloque)
+                    finally:
+                        await presupuesto.liberar(len(bloque))
+        finally:
+            await _cerrar_origen(origen)
+        await servicio_validacion.validar(Path(tmp), extension)
+    except ArchivoInvalido as e:
+        borrar(tmp)
+        return {"ruta": nombre, "tipo_error": "corrupto", "detalle": str(e)}
+    except Exception as e:
+        borrar(tmp)
+        return {"ruta": nombre, "tipo_error": "ilegible", "detalle": str(e)}
+    except BaseException:
+        borrar(tmp)
+        raise
+    return {"ruta": nombre, "tmp": tmp, "tamano": hasher.tamano, "hashes": hasher.resultado()}
 
 
-def ingesta_sharepoint(lista_archivos: list, usuario_id: int, db):
+async def ingesta_sharepoint_async(fuentes, usuario_id: int, db, version: str = "1.0",
+                                   categoria: str | None = None, max_bytes_en_vuelo: int | None = None,
+                                   max_archivos_en_vuelo: int | None = None, tamano_lote: int | None = None,
+                                   progreso=None, formato_reporte: str = REPORTE_FORMATO) -> dict:
     """
-    HU3: Ingesta desde SharePoint
-    lista_archivos: list of tuples (nombre_archivo, contenido_bytes)
+    HU3: Ingesta desde SharePoint (u otra biblioteca remota) por streaming.
+
+    `fuentes` es un iterable o iterable asíncrono de (nombre, origen); el
+    origen puede ser un objeto con read(), un iterable o iterable asíncrono
+    de bloques de bytes, bytes, o un callable que lo abre (se llama recién
+    cuando el archivo entra al pipeline). Se toma la siguiente fuente solo
+    cuando hay menos de `max_archivos_en_vuelo` en curso y cada bloque se
+    pide solo si caben en `max_bytes_en_vuelo`, así la memoria queda acotada
+    por esos topes sin importar el tamaño de la biblioteca. Cada archivo se
+    escribe una vez en staging (hash en la misma pasada), se valida en el
+    pool de procesos y se registra por lotes como en ingesta_local.
     """
-    errores = []
+    usuario = db.get(Usuario, usuario_id)
+    if usuario is None:
+        raise ValueError(f"Usuario {usuario_id} no existe")
+    estado = EstadoIngesta(db, usuario, None, version, categoria, tamano_lote or INGESTA_LOTE, progreso,
+                           incremental=False, formato_reporte=formato_reporte)
+    presupuesto = PresupuestoBytes(max_bytes_en_vuelo or SHAREPOINT_MAX_MB_EN_VUELO * 1024 * 1024)
+    cupos = asyncio.Semaphore(max_archivos_en_vuelo or SHAREPOINT_MAX_ARCHIVOS_EN_VUELO)
+    registro = asyncio.Lock()  # una sola sesión: los resultados se registran de a uno
+    tareas = set()
 
-    for nombre, contenido in lista_archivos:
-        upload_file_obj = UploadFile(filename=nombre, file=BytesIO(contenido))
+    async def resultado(res: dict):
+        async with registro:
+            await run_in_threadpool(estado.resultado_archivo, {**res, "manifiesto": None})
+
+    async def procesar(nombre: str, origen):
         try:
-            upload_endpoint(file=upload_file_obj, usuario_id=usuario_id, db=db)
-        except Exception as e:
-            errores.append({
-                "nombre_archivo": nombre,
-                "tipo_error": "duplicado/corrupto",
-                "detalle": str(e)
-            })
-
-    if errores:
-        reporte = generar_reporte_errores(errores)
-        print(f"Reporte de errores generado: {reporte}")
+            await resultado(await _copiar_fuente(nombre, origen, presupuesto))
+        finally:
+            cupos.release()
+
+    try:
+        siguiente = _iterar(fuentes).__anext__
+        while True:
+            await cupos.acquire()  # contrapresión: la siguiente fuente se pide recién cuando hay lugar
+            for terminada in [t for t in tareas if t.done()]:
+                tareas.discard(terminada)
+                terminada.result()  # un error al registrar corta la ingesta
+            try:
+                nombre, origen = await siguiente()
+            except StopAsyncIteration:
+                cupos.release()
+                break
+            if Path(nombre).suffix.lower() not in ALLOWED_EXTENSIONS:
+                estado.omitidos += 1
+                if not callable(origen):
+                    await _cerrar_origen(origen)
+                cupos.release()
+                continue
+            tareas.add(asyncio.create_task(procesar(nombre, origen)))
+        await asyncio.gather(*tareas)
+        async with registro:
+            await run_in_threadpool(estado.registrar_lote)
+    except BaseException:
+        for t in tareas:
+            t.cancel()
+        await asyncio.gather(*tareas, return_exceptions=True)
+        for r in estado.lote:
+            borrar(r["tmp"])
+        estado.reporte.cerrar(completo=False)
+        raise
+
+    resumen = cerrar_ingesta(estado, "Ingesta SharePoint")
+    resumen["pico_bytes_en_vuelo"] = presupuesto.pico
+    return resumen
+
+
+def ingesta_sharepoint(fuentes, usuario_id: int, db, **opciones) -> dict:
+    """Versión síncrona de ingesta_sharepoint_async (scripts, trabajos, CLI)."""
+    return asyncio.run(ingesta_sharepoint_async(fuentes, usuario_id, db, **opciones))
+
+
+# ===============================
+# TRABAJOS EN SEGUNDO PLANO
+# ===============================
+@tarea("ingesta_local")
+def tarea_ingesta_local(db, trabajo, carpeta: str, version: str = "1.0", categoria: str | None = None):
+    return ingesta_local(carpeta, trabajo.usuario_id, db, version=version, categoria=categoria,
+                         progreso=trabajo.progreso)
+
+
+def encolar_ingesta_local(db, carpeta: str, usuario_id: int, version: str = "1.0", categoria: str | None = None):
+    """Encola la ingesta de `carpeta` y retorna el Trabajo (consultar en /trabajos/{id})."""
+    return encolar(db, "ingesta_local", usuario_id,
+                   {"carpeta": str(Path(carpeta).resolve()), "version": version, "categoria": categoria})
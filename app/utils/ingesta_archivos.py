@@ -0,0 +1,58 @@
+# app/utils/ingesta_archivos.py
+# Trabajo por archivo de la ingesta masiva. Corre en los procesos del pool
+# de ingesta, por eso este módulo solo importa lo mínimo (nada de FastAPI
+# ni de sesiones de base de datos).
+import os
+import tempfile
+import time
+from pathlib import Path
+from app.services.validacion import validar_formato
+from app.utils.hashing import HashMultiple, CHUNK_SIZE
+
+
+def procesar_archivo(ruta: str, carpeta_tmp: str, copiar: bool = True, tmp: str | None = None) -> dict:
+    """
+    Copia `ruta` a staging (en `tmp` o en un archivo nuevo de
+    `carpeta_tmp`) calculando MD5 y SHA-256 en la misma lectura y valida el
+    formato sobre la copia. El original no se modifica. Con `copiar=False`
+    (simulación) solo se hashea y valida el original.
+    Retorna {"ruta", "tmp", "tamano", "hashes", "tiempos"} o
+    {"ruta", "tipo_error", "detalle"} (más "hashes" si lo que falló fue la
+    validación); "tiempos" son los segundos de cada etapa.
+    """
+    extension = Path(ruta).suffix.lower()
+    hasher = HashMultiple()
+    if copiar:
+        if tmp:
+            destino = open(tmp, "wb")
+        else:
+            fd, tmp = tempfile.mkstemp(dir=carpeta_tmp, suffix=".part")
+            destino = os.fdopen(fd, "wb")
+    else:
+        tmp, destino = None, None
+    inicio = time.perf_counter()
+    try:
+        with open(ruta, "rb") as origen:
+            while True:
+                bloque = origen.read(CHUNK_SIZE)
+                if not bloque:
+                    break
+                hasher.update(bloque)
+                if destino:
+                    destino.write(bloque)
+        if destino:
+            destino.close()
+        leido = time.perf_counter()
+        error = validar_formato(tmp or ruta, extension)
+    except OSError as e:
+        if tmp:
+            destino.close()
+            Path(tmp).unlink(missing_ok=True)
+        return {"ruta": ruta, "tipo_error": "ilegible", "detalle": str(e)}
+
+    if error:
+        if tmp:
+            Path(tmp).unlink(missing_ok=True)
+        return {"ruta": ruta, "tipo_error": "corrupto", "detalle": error, "hashes": hasher.resultado()}
+    tiempos = {"lectura_hash": leido - inicio, "validacion": time.perf_counter() - leido}
+    return {"ruta": ruta, "tmp": tmp, "tamano": hasher.tamano, "hashes": hasher.resultado(), "tiempos": tiempos}
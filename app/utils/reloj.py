@@ -0,0 +1,14 @@
+# app/utils/reloj.py
+# Plazos medidos con el reloj de la base de datos. Las columnas de latido
+# (actualizado_en) se escriben con func.now(), así que los vencimientos se
+# calculan también en la base: no dependen de que el reloj o la zona
+# horaria de cada proceso coincidan con los del servidor de base de datos.
+from sqlalchemy import func
+
+
+def hace_segundos(db, segundos: float):
+    """Expresión SQL con el instante actual de la base menos `segundos`."""
+    if db.get_bind().dialect.name == "postgresql":
+        return func.now() - func.make_interval(0, 0, 0, 0, 0, 0, segundos)
+    # SQLite: func.now() es CURRENT_TIMESTAMP ('YYYY-MM-DD HH:MM:SS', UTC), mismo formato que datetime()
+    return func.datetime("now", f"-{segundos} seconds")
@@ -1,25 +1,163 @@
 # app/utils/reportes.py
+# Reportes de errores de ingesta escritos a medida que ocurren: cada fila
+# va al disco al agregarse (con flush periódico), así un corte a mitad de
+# una carga masiva no pierde lo ya reportado y la memoria no depende de la
+# cantidad de errores. Formatos: CSV o JSONL comprimido con gzip. Al cerrar
+# se escribe un resumen con la cantidad por tipo_error.
 import csv
-from pathlib import Path
+import gzip
+import io
+import json
+import time
+import uuid
+from collections import Counter
 from datetime import datetime
+from pathlib import Path
+from decouple import config
 
 REPORTE_DIR = Path("reportes")
-REPORTE_DIR.mkdir(exist_ok=True)
+REPORTE_FORMATO = config("REPORTE_FORMATO", default="csv")
+REPORTE_MAX_MB = config("REPORTE_MAX_MB", default=100, cast=int)
+REPORTE_FLUSH_FILAS = config("REPORTE_FLUSH_FILAS", default=1000, cast=int)
+REPORTE_FLUSH_S = config("REPORTE_FLUSH_S", default=5.0, cast=float)
+FORMATOS = {"csv": ".csv", "jsonl.gz": ".jsonl.gz"}
+CAMPOS = ["nombre_archivo", "tipo_error", "detalle"]
+
+
+class ReporteErrores:
+    """
+    Escritor incremental de un reporte de errores:
+
+        with ReporteErrores("ingesta") as reporte:
+            reporte.agregar("a.pdf", "corrupto", "PDF ilegible")
 
-def generar_reporte_errores(errores: list):
+    El archivo se crea con la primera fila (sin errores no hay reporte).
+    Cuando una parte supera `max_mb` se sigue en otra (_002, _003...).
+    Al cerrar se escribe `<nombre>_resumen.json` con las filas por
+    tipo_error, las partes y si la corrida terminó (`completo`).
     """
-    errores: lista de dicts con keys:
+
+    def __init__(self, prefijo: str = "reporte_errores", formato: str = REPORTE_FORMATO,
+                 directorio: Path = REPORTE_DIR, max_mb: int = REPORTE_MAX_MB,
+                 flush_filas: int = REPORTE_FLUSH_FILAS, flush_s: float = REPORTE_FLUSH_S):
+        if formato not in FORMATOS:
+            raise ValueError(f"Formato de reporte desconocido: {formato} (opciones: {', '.join(FORMATOS)})")
+        self.formato = formato
+        self.directorio = Path(directorio)
+        self.max_bytes = max_mb * 1024 * 1024
+        self.flush_filas = flush_filas
+        self.flush_s = flush_s
+        # Fecha y un sufijo aleatorio: dos reportes en el mismo segundo no se pisan
+        self.nombre = f"{prefijo}_{datetime.now():%Y%m%d_%H%M%S}_{uuid.uuid4().hex[:6]}"
+        self.partes = []
+        self.conteo = Counter()
+        self.inicio = datetime.now()
+        self._crudo = None
+        self._texto = None
+        self._csv = None
+        self._sin_flush = 0
+        self._ultimo_flush = time.monotonic()
+        self._cerrado = False
+
+    @property
+    def filas(self) -> int:
+        return sum(self.conteo.values())
+
+    @property
+    def ruta(self) -> str | None:
+        """Primera parte del reporte (None si no hubo errores)."""
+        return str(self.partes[0]) if self.partes else None
+
+    def _abrir_parte(self):
+        self.directorio.mkdir(parents=True, exist_ok=True)
+        sufijo = f"_{len(self.partes) + 1:03d}" if self.partes else ""
+        ruta = self.directorio / f"{self.nombre}{sufijo}{FORMATOS[self.formato]}"
+        self._crudo = open(ruta, "wb")
+        if self.formato == "jsonl.gz":
+            comprimido = gzip.GzipFile(fileobj=self._crudo, mode="wb")
+            self._texto = io.TextIOWrapper(comprimido, encoding="utf-8", newline="\n")
+        else:
+            self._texto = io.TextIOWrapper(self._crudo, encoding="utf-8", newline="")
+            self._csv = csv.DictWriter(self._texto, fieldnames=CAMPOS, extrasaction="ignore")
+            self._csv.writeheader()
+        self.partes.append(ruta)
+
+    def _cerrar_parte(self):
+        if self._texto is None:
+            return
+        self._texto.close()  # cierra también el gzip, que escribe su cola
+        self._crudo.close()
+        self._texto = self._crudo = self._csv = None
+
+    def agregar(self, nombre_archivo: str, tipo_error: str, detalle: str | None):
+        self.escribir({"nombre_archivo": nombre_archivo, "tipo_error": tipo_error, "detalle": detalle})
+
+    def escribir(self, fila: dict):
+        if self._cerrado:
+            raise ValueError("El reporte ya está cerrado")
+        if self._texto is None:
+            self._abrir_parte()
+        elif self._crudo.tell() >= self.max_bytes:
+            self._cerrar_parte()
+            self._abrir_parte()
+        if self._csv:
+            self._csv.writerow(fila)
+        else:
+            self._texto.write(json.dumps({c: fila.get(c) for c in CAMPOS}, ensure_ascii=False) + "\n")
+        self.conteo[fila.get("tipo_error")] += 1
+        self._sin_flush += 1
+        if self._sin_flush >= self.flush_filas or time.monotonic() - self._ultimo_flush >= self.flush_s:
+            self.flush()
+
+    def flush(self):
+        """Lleva al disco lo escrito; en gzip cierra el bloque comprimido para que sea legible."""
+        if self._texto is not None:
+            self._texto.flush()
+            if self.formato == "jsonl.gz":
+                self._texto.buffer.flush()  # Z_SYNC_FLUSH del GzipFile
+            self._crudo.flush()
+        self._sin_flush = 0
+        self._ultimo_flush = time.monotonic()
+
+    def resumen(self) -> dict:
+        return {
+            "total": self.filas,
+            "por_tipo_error": dict(self.conteo),
+            "partes": [str(p) for p in self.partes],
+            "formato": self.formato,
+            "inicio": self.inicio.isoformat(timespec="seconds"),
+        }
+
+    def cerrar(self, completo: bool = True) -> dict:
+        """Cierra la parte abierta y escribe el resumen. Idempotente."""
+        resumen = self.resumen()
+        if self._cerrado:
+            return resumen
+        self._cerrado = True
+        self._cerrar_parte()
+        if self.partes:
+            resumen.update(fin=datetime.now().isoformat(timespec="seconds"), completo=completo)
+            ruta = self.directorio / f"{self.nombre}_resumen.json"
+            ruta.write_text(json.dumps(resumen, ensure_ascii=False, indent=2), encoding="utf-8")
+            resumen["ruta_resumen"] = str(ruta)
+        return resumen
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, *_):
+        self.cerrar(completo=tipo is None)
+
+
+def generar_reporte_errores(errores, formato: str = REPORTE_FORMATO) -> str | None:
+    """
+    errores: iterable de dicts con keys:
     - nombre_archivo
     - tipo_error ('duplicado', 'corrupto', etc)
     - detalle
+    Retorna la ruta del reporte (None si no había errores).
     """
-    ahora = datetime.now().strftime("%Y%m%d_%H%M%S")
-    reporte_file = REPORTE_DIR / f"reporte_errores_{ahora}.csv"
-
-    with open(reporte_file, "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=["nombre_archivo", "tipo_error", "detalle"])
-        writer.writeheader()
+    with ReporteErrores(formato=formato) as reporte:
         for e in errores:
-            writer.writerow(e)
-
-    return str(reporte_file)
+            reporte.escribir(e)
+    return reporte.ruta
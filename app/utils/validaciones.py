@@ -2,6 +2,9 @@
 import zipfile
 from pathlib import Path
 
+# Tipos que se aceptan al subir, ingerir una carpeta o vigilarla
+ALLOWED_EXTENSIONS = {".pdf", ".docx", ".xlsx", ".png", ".jpg", ".trd", ".ccd"}
+
 def validar_trd_ccd(file_path: Path) -> bool:
     """
     Valida la estructura de un archivo TRD/CCD.
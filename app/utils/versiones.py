@@ -0,0 +1,33 @@
+# app/utils/versiones.py
+# Clave de orden de las versiones. `version` es texto libre ("1.0",
+# "v2.10", "2024.3-rc1"), así que ordenarla como texto pone "10.0" antes
+# que "9.0". La clave normalizada se guarda al insertar (columna
+# clave_version) y comparada como texto da el orden correcto, con índice.
+import re
+
+ANCHO_COMPONENTE = 10  # dígitos por componente numérico
+COMPONENTES = re.compile(r"[0-9]+|[a-z]+")
+
+
+def clave_de_version(version: str | None) -> str:
+    """
+    "1.10" -> "0000000001.0000000010". Los componentes numéricos se
+    rellenan con ceros y el texto va en minúsculas; se ignoran la "v"
+    inicial, los separadores y los ceros finales ("1", "1.0" y "v1" son la
+    misma clave). Resultado: 9.0 < 10.0, 1.0 < 1.0.1 < 1.1 y un sufijo de
+    texto va después del número (2.0 < 2.0-rc1 < 2.1). Sin versión: "".
+    """
+    if not version:
+        return ""
+    texto = version.strip().lower()
+    if texto[:1] == "v" and texto[1:2].isdigit():
+        texto = texto[1:]
+    partes = [p.zfill(ANCHO_COMPONENTE) if p.isdigit() else p for p in COMPONENTES.findall(texto)]
+    while len(partes) > 1 and partes[-1] == "0" * ANCHO_COMPONENTE:
+        partes.pop()
+    return ".".join(partes)
+
+
+def clave_al_insertar(contexto) -> str:
+    """Default de columna: calcula la clave a partir de la `version` de la fila insertada."""
+    return clave_de_version(contexto.get_current_parameters().get("version"))
@@ -0,0 +1,338 @@
+# app/utils/vigilante.py
+# Carpeta vigilada ("hot folder"): los escáneres dejan archivos y se
+# ingresan en segundos con el mismo proceso de ingesta_local (staging +
+# hash + validación en el pool de procesos, registro por lotes y manifiesto).
+#
+#   python -m app.utils.vigilante CARPETA --usuario ID [--polling]
+#
+# En Linux usa inotify (vía ctypes, sin dependencias): en reposo no hace
+# nada y el trabajo es proporcional a los archivos nuevos. En otros
+# sistemas, o si inotify no está disponible, compara la carpeta cada
+# VIGILANTE_POLL_S segundos.
+import argparse
+import ctypes
+import ctypes.util
+import os
+import select
+import signal
+import struct
+import threading
+import time
+from pathlib import Path
+from decouple import config
+from app.utils.validaciones import ALLOWED_EXTENSIONS
+from app.utils.ingesta import (
+    INGESTA_WORKERS, INGESTA_LOTE, PoolArchivos, nueva_ingesta, procesar_bloque,
+    cerrar_ingesta, recorrer_carpeta
+)
+
+# Un archivo se ingresa cuando lleva este tiempo sin eventos y su tamaño/mtime no cambió
+VIGILANTE_ESPERA_S = config("VIGILANTE_ESPERA_S", default=1.0, cast=float)
+# Los archivos listos se juntan durante este tiempo para registrarlos en un solo lote
+VIGILANTE_AGRUPAR_S = config("VIGILANTE_AGRUPAR_S", default=2.0, cast=float)
+VIGILANTE_POLL_S = config("VIGILANTE_POLL_S", default=5.0, cast=float)
+# Tras un error de base los archivos se reintentan con espera creciente hasta este tope
+VIGILANTE_REINTENTO_MAX_S = config("VIGILANTE_REINTENTO_MAX_S", default=60.0, cast=float)
+ESPERA_MAXIMA_S = 1.0  # cada cuánto se revisa si hay que detenerse
+
+# Constantes de <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+MASCARA = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+EVENTO = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+def _ignorar(ruta: str) -> bool:
+    nombre = os.path.basename(ruta)
+    # Ocultos y temporales de Office/escáneres
+    return nombre.startswith((".", "~$")) or Path(nombre).suffix.lower() not in ALLOWED_EXTENSIONS
+
+
+class FuenteInotify:
+    """Eventos del kernel para toda la carpeta (un watch por subdirectorio)."""
+
+    def __init__(self, raiz: str):
+        nombre = ctypes.util.find_library("c")
+        self._libc = ctypes.CDLL(nombre, use_errno=True)
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 falló")
+        self._directorios = {}  # wd -> ruta
+        self._vigilar_arbol(raiz)
+
+    def _vigilar(self, ruta: str):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(ruta), MASCARA)
+        if wd < 0:
+            # ENOSPC: se agotó fs.inotify.max_user_watches
+            raise OSError(ctypes.get_errno(), f"No se pudo vigilar {ruta}")
+        self._directorios[wd] = ruta
+
+    def _vigilar_arbol(self, ruta: str) -> list[str]:
+        """Agrega watches a `ruta` y sus subcarpetas; retorna los archivos que ya contenían."""
+        archivos = []
+        for actual, subdirs, nombres in os.walk(ruta):
+            self._vigilar(actual)
+            archivos.extend(os.path.join(actual, n) for n in nombres)
+        return archivos
+
+    def esperar(self, timeout: float) -> tuple[set, bool]:
+        """Rutas de archivos con eventos y si el kernel perdió eventos (hay que re-escanear)."""
+        listos, _, _ = select.select([self._fd], [], [], timeout)
+        if not listos:
+            return set(), False
+        rutas, desborde = set(), False
+        while True:
+            try:
+                datos = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(datos):
+                wd, mask, _, largo = EVENTO.unpack_from(datos, offset)
+                nombre = datos[offset + EVENTO.size: offset + EVENTO.size + largo].rstrip(b"\0")
+                offset += EVENTO.size + largo
+                if mask & IN_Q_OVERFLOW:
+                    desborde = True
+                    continue
+                if mask & IN_IGNORED:
+                    self._directorios.pop(wd, None)
+                    continue
+                carpeta = self._directorios.get(wd)
+                if carpeta is None or not nombre:
+                    continue
+                ruta = os.path.join(carpeta, os.fsdecode(nombre))
+                if mask & IN_ISDIR:
+                    if mask & (IN_CREATE | IN_MOVED_TO):
+                        # Subcarpeta nueva: lo que se copió antes del watch no genera eventos
+                        try:
+                            rutas.update(self._vigilar_arbol(ruta))
+                        except OSError:
+                            pass
+                    continue
+                rutas.add(ruta)
+        return rutas, desborde
+
+    def cerrar(self):
+        os.close(self._fd)
+
+
+class FuentePolling:
+    """Alternativa portable: compara tamaño y mtime entre recorridos."""
+
+    def __init__(self, raiz: str, intervalo_s: float = VIGILANTE_POLL_S):
+        self.raiz = raiz
+        self.intervalo_s = intervalo_s
+        self._proximo = time.monotonic() + intervalo_s
+        self._vistos = self._escanear()
+
+    def _escanear(self) -> dict:
+        return {
+            ruta: (st.st_size, st.st_mtime_ns)
+            for ruta, st, error in recorrer_carpeta(self.raiz)
+            if not error and not _ignorar(ruta)
+        }
+
+    def esperar(self, timeout: float) -> tuple[set, bool]:
+        restante = self._proximo - time.monotonic()
+        if restante > timeout:
+            time.sleep(timeout)
+            return set(), False
+        time.sleep(max(restante, 0))
+        self._proximo = time.monotonic() + self.intervalo_s
+        actuales = self._escanear()
+        cambiados = {r for r, firma in actuales.items() if self._vistos.get(r) != firma}
+        self._vistos = actuales
+        return cambiados, False
+
+    def cerrar(self):
+        pass
+
+
+def crear_fuente(raiz: str, polling: bool = False):
+    if not polling:
+        try:
+            return FuenteInotify(raiz)
+        except (OSError, AttributeError, TypeError):
+            pass  # sin inotify (Windows, macOS) o sin watches disponibles
+    return FuentePolling(raiz)
+
+
+class Vigilante:
+    def __init__(self, carpeta: str, usuario_id: int, session_factory, version: str = "1.0",
+                 categoria: str | None = None, workers: int | None = None,
+                 espera_s: float = VIGILANTE_ESPERA_S, agrupar_s: float = VIGILANTE_AGRUPAR_S,
+                 polling: bool = False):
+        self.raiz = str(Path(carpeta).resolve())
+        self.usuario_id = usuario_id
+        self.session_factory = session_factory
+        self.version = version
+        self.categoria = categoria
+        self.workers = workers or INGESTA_WORKERS
+        self.espera_s = espera_s
+        self.agrupar_s = agrupar_s
+        self.polling = polling
+        self.candidatos = {}  # ruta -> (último evento, stat de la revisión anterior)
+        self.listos = []      # (ruta, stat) estables, esperando a agruparse
+        self.primer_listo = None
+        self.al_dia = False   # False: hay que recorrer la carpeta (inicio, desborde o error)
+        self.fallos = 0       # errores seguidos; define la espera del próximo reintento
+        self.reintentar_en = 0.0
+
+    def _nueva_ingesta(self, db):
+        return nueva_ingesta(db, self.usuario_id, self.raiz, self.version, self.categoria)
+
+    def _ponerse_al_dia(self, db, pool):
+        """Ingresa lo que llegó mientras el vigilante no corría (el manifiesto salta lo ya ingresado)."""
+        estado = self._nueva_ingesta(db)
+        limite = time.time_ns() - int(self.espera_s * 1e9)
+        bloque = []
+        try:
+            for ruta, st, error in recorrer_carpeta(self.raiz):
+                if error or _ignorar(ruta):
+                    continue
+                if st.st_mtime_ns > limite:
+                    self.candidatos[ruta] = (time.monotonic(), None)  # puede estar escribiéndose
+                    continue
+                bloque.append((ruta, st))
+                if len(bloque) >= 1000:
+                    procesar_bloque(estado, pool, bloque)
+                    bloque = []
+            procesar_bloque(estado, pool, bloque)
+            pool.vaciar()
+            estado.registrar_lote()
+        except Exception:
+            pool.descartar()
+            estado.abandonar()
+            raise
+        self.al_dia = True
+        if estado.archivos:
+            cerrar_ingesta(estado, f"Puesta al día de {self.raiz}")
+
+    def _revisar_candidatos(self, ahora: float):
+        """Pasa a listos los archivos sin eventos y con el mismo tamaño/mtime que en la revisión anterior."""
+        for ruta, (ultimo, anterior) in list(self.candidatos.items()):
+            if ahora - ultimo < self.espera_s:
+                continue
+            try:
+                st = os.stat(ruta)
+            except OSError:
+                del self.candidatos[ruta]  # borrado o movido antes de terminar
+                continue
+            if anterior is not None and (st.st_size, st.st_mtime_ns) == (anterior.st_size, anterior.st_mtime_ns):
+                del self.candidatos[ruta]
+                self.listos.append((ruta, st))
+                if self.primer_listo is None:
+                    self.primer_listo = ahora
+            else:
+                self.candidatos[ruta] = (ahora, st)
+
+    def _plazo(self, ahora: float) -> float:
+        """Cuánto se puede esperar eventos antes de tener que revisar algo."""
+        plazos = [ESPERA_MAXIMA_S]
+        if not self.al_dia:
+            plazos.append(self.reintentar_en - ahora)
+        if self.candidatos:
+            plazos.append(min(u for u, _ in self.candidatos.values()) + self.espera_s - ahora)
+        if self.listos:
+            plazos.append(self.primer_listo + self.agrupar_s - ahora)
+        return max(min(plazos), 0.05)
+
+    def _registrar_listos(self, db, pool):
+        estado = self._nueva_ingesta(db)
+        listos, self.listos, self.primer_listo = self.listos, [], None
+        try:
+            procesar_bloque(estado, pool, listos)
+            pool.vaciar()
+            estado.registrar_lote()
+        except Exception:
+            pool.descartar()
+            estado.abandonar()
+            self.listos = listos  # lo ya confirmado queda en el manifiesto y se salta al reintentar
+            raise
+        return cerrar_ingesta(estado, f"Carpeta vigilada {self.raiz}")
+
+    def _tras_error(self, db, error: Exception, ahora: float):
+        """
+        Un error (p. ej. OperationalError: la base se reinició) no detiene al
+        vigilante: se descarta la sesión, los archivos listos vuelven a ser
+        candidatos y todo se reintenta con espera creciente.
+        """
+        try:
+            db.rollback()
+        except Exception:
+            pass  # conexión caída: la sesión se descarta igual
+        db.close()
+        self.fallos += 1
+        demora = min(self.espera_s * 2 ** self.fallos, VIGILANTE_REINTENTO_MAX_S)
+        self.reintentar_en = ahora + demora
+        print(f"⚠️ Error en la carpeta vigilada {self.raiz}: {error}. Se reintenta en {demora:.0f} s")
+        # Elegibles cuando se cumpla la demora, si su tamaño/mtime no cambió
+        for ruta, st in self.listos:
+            self.candidatos[ruta] = (self.reintentar_en - self.espera_s, st)
+        self.listos, self.primer_listo = [], None
+        return self.session_factory()
+
+    def ejecutar(self, detener: threading.Event):
+        db = self.session_factory()
+        pool = PoolArchivos(self.workers)
+        # Los watches se crean antes de la puesta al día para no perder lo que llegue mientras tanto
+        fuente = crear_fuente(self.raiz, self.polling)
+        print(f"👀 Vigilando {self.raiz} ({type(fuente).__name__})")
+        try:
+            rutas, desborde = set(), False
+            while not detener.is_set():
+                ahora = time.monotonic()
+                if desborde:
+                    self.al_dia = False
+                for ruta in rutas:
+                    if not _ignorar(ruta):
+                        self.candidatos[ruta] = (ahora, self.candidatos.get(ruta, (None, None))[1])
+                self._revisar_candidatos(ahora)
+                try:
+                    if not self.al_dia and ahora >= self.reintentar_en:
+                        self._ponerse_al_dia(db, pool)
+                        self.fallos = 0
+                    if self.listos and ahora >= self.reintentar_en and (
+                        len(self.listos) >= INGESTA_LOTE or ahora - self.primer_listo >= self.agrupar_s
+                    ):
+                        self._registrar_listos(db, pool)
+                        self.fallos = 0
+                except Exception as e:
+                    db = self._tras_error(db, e, ahora)
+                rutas, desborde = fuente.esperar(self._plazo(time.monotonic()))
+        finally:
+            fuente.cerrar()
+            pool.cerrar()
+            db.close()
+
+
+def main():
+    from app.database import SessionLocal
+    import app.models  # noqa: F401
+
+    parser = argparse.ArgumentParser(description="Ingresa automáticamente los archivos que llegan a una carpeta")
+    parser.add_argument("carpeta")
+    parser.add_argument("--usuario", type=int, required=True, help="id del usuario dueño de los documentos")
+    parser.add_argument("--version", default="1.0")
+    parser.add_argument("--categoria")
+    parser.add_argument("--workers", type=int, default=INGESTA_WORKERS)
+    parser.add_argument("--polling", action="store_true", help="no usar inotify")
+    args = parser.parse_args()
+
+    detener = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: detener.set())
+    signal.signal(signal.SIGTERM, lambda *_: detener.set())
+
+    Vigilante(args.carpeta, args.usuario, SessionLocal, args.version, args.categoria,
+              args.workers, polling=args.polling).ejecutar(detener)
+
+
+if __name__ == "__main__":
+    main()
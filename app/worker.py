@@ -0,0 +1,39 @@
+# app/worker.py
+# Worker de trabajos en segundo plano como proceso aparte:
+#   python -m app.worker [--workers N]
+# Con TRABAJOS_EN_PROCESO=False en la API, solo este proceso ejecuta la cola.
+import argparse
+import signal
+import threading
+from app.database import engine, Base, SessionLocal
+from app.core.esquema import actualizar_esquema
+import app.models  # noqa: F401  (registra todas las tablas)
+from app.services.trabajos import pool_trabajos, TRABAJOS_WORKERS
+from app.services.validacion import servicio_validacion
+from app.services.almacenamiento import ejecutor_almacenamiento
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker de la cola de trabajos del Gestor Documental")
+    parser.add_argument("--workers", type=int, default=TRABAJOS_WORKERS, help="trabajos simultáneos")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    actualizar_esquema(engine)
+
+    detener = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: detener.set())
+    signal.signal(signal.SIGTERM, lambda *_: detener.set())
+
+    pool_trabajos.iniciar(SessionLocal, workers=args.workers)
+    print(f"👷 Worker iniciado con {args.workers} hilos; Ctrl+C para detener")
+    detener.wait()
+
+    print("Deteniendo: esperando a que terminen los trabajos en curso...")
+    pool_trabajos.detener()
+    servicio_validacion.cerrar()
+    ejecutor_almacenamiento.cerrar()
+
+
+if __name__ == "__main__":
+    main()